@@ -10,22 +10,71 @@ guiding them on how to improve their password.
 
 # First, lets import necessary libraries
 import secrets # This will be used for generating secure random passwords
+import os # To find the word lists and notice when they change
+import time
 
 # I think we should then define file paths for dictionary and common passwords in case they change in the future
 dictionary_file = "wordlist.txt"
 top_passwords_file = "toppasswords.txt"
 
-# Lets create a function that reads the files and checks if the word the user enters is present.
-def word_in_file(word, filename, case_sensitive=False):
+# Reading the whole file for every check got slow once we started checking lots of passwords,
+# so each word list is now loaded into a frozenset the first time it is needed and shared by
+# every later check. That makes a check a single hash lookup. We still notice when a file is
+# edited: at most once every RELOAD_CHECK_SECONDS we compare its modification time and size
+# with the ones we loaded, and read it again if they changed.
+RELOAD_CHECK_SECONDS = 1.0
+
+# (filename, case_sensitive) -> [words, (mtime, size) when loaded, time of the last check]
+_word_indexes = {}
+_missing_files = set()
+
+def _file_version(path):
     try:
-        with open(filename, "r", encoding="utf-8") as file:
-            lines = (line.strip() for line in file)
-            if not case_sensitive:
-                return any(word.lower() == line.lower() for line in lines)
-            return any(word == line for line in lines)
+        info = os.stat(path)
     except FileNotFoundError:
-        print(f"Error: File '{filename}' not found.")
-        return False
+        return None
+    return info.st_mtime_ns, info.st_size
+
+def _read_words(path, case_sensitive):
+    with open(path, "r", encoding="utf-8") as file:
+        if case_sensitive:
+            return frozenset(line.strip() for line in file)
+        return frozenset(line.strip().lower() for line in file)
+
+# This function returns the set of words in a file (lowercased unless case_sensitive),
+# loading it only the first time and again when the file changes.
+def load_word_index(filename, case_sensitive=False):
+    key = (filename, case_sensitive)
+    entry = _word_indexes.get(key)
+    now = time.monotonic()
+    if entry is not None and now - entry[2] < RELOAD_CHECK_SECONDS:
+        return entry[0]
+    path = os.path.abspath(filename)
+    version = _file_version(path)
+    if entry is not None and version == entry[1]:
+        entry[2] = now
+        return entry[0]
+    words = frozenset()
+    if version is None:
+        # Only report a missing file once, not on every check.
+        if path not in _missing_files:
+            print(f"Error: File '{filename}' not found.")
+            _missing_files.add(path)
+    else:
+        try:
+            words = _read_words(path, case_sensitive)
+        except FileNotFoundError:
+            version = None
+        _missing_files.discard(path)
+    _word_indexes[key] = [words, version, now]
+    return words
+
+# Lets create a function that checks if the word the user enters is present in the file.
+def word_in_file(word, filename, case_sensitive=False):
+    words = load_word_index(filename, case_sensitive)
+    if not case_sensitive:
+        return word.lower() in words
+    return word in words
 
 # We have to define the character sets
 LOWER = ["a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k", "l", "m", "n", "o", "p", "q", "r", "s", "t", "u", "v", "w", "x", "y", "z"]
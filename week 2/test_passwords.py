@@ -0,0 +1,79 @@
+from passwords import word_in_file, load_word_index
+import passwords
+import random
+import pytest
+from os import path
+
+WORDLIST = path.join(path.dirname(path.abspath(__file__)), passwords.dictionary_file)
+
+
+def scan_word_in_file(word, filename, case_sensitive=False):
+    """The original check, which scanned the file line by line."""
+    with open(filename, "r", encoding="utf-8") as file:
+        lines = (line.strip() for line in file)
+        if not case_sensitive:
+            return any(word.lower() == line.lower() for line in lines)
+        return any(word == line for line in lines)
+
+
+@pytest.fixture
+def word_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(passwords, "_word_indexes", {})
+    monkeypatch.setattr(passwords, "_missing_files", set())
+    filename = tmp_path / "words.txt"
+    filename.write_text("Apple\nbanana\n  Cherry  \npa55word\n\n", encoding="utf-8")
+    return str(filename)
+
+
+def test_matches_line_scan(word_file):
+    """Verify that the word index gives the same answers as a line scan."""
+    words = ["apple", "APPLE", "Apple", "banana", "Banana", "cherry", "Cherry",
+            " cherry", "pa55word", "PA55WORD", "", "grape", "app"]
+    for word in words:
+        for case_sensitive in (False, True):
+            assert word_in_file(word, word_file, case_sensitive) \
+                    == scan_word_in_file(word, word_file, case_sensitive), (word, case_sensitive)
+
+
+def test_matches_line_scan_on_wordlist():
+    """Verify the same on the real word list, with words and non-words."""
+    rng = random.Random(25)
+    with open(WORDLIST, "r", encoding="utf-8") as file:
+        listed = [line.strip() for line in file]
+    words = rng.sample(listed, 20) + [word.upper() for word in rng.sample(listed, 20)] \
+            + ["".join(rng.choice("abcxyz") for _ in range(8)) for _ in range(20)]
+    for word in words:
+        assert word_in_file(word, WORDLIST) == scan_word_in_file(word, WORDLIST), word
+
+
+def test_edited_file_is_reloaded(word_file, monkeypatch):
+    """Verify that the index is shared until the file changes, and that
+    an edited file is read again."""
+    clock = [1000.0]
+    monkeypatch.setattr(passwords.time, "monotonic", lambda: clock[0])
+    index = load_word_index(word_file)
+    assert load_word_index(word_file) is index
+    assert not word_in_file("grape", word_file)
+
+    with open(word_file, "a", encoding="utf-8") as file:
+        file.write("Grape\n")
+    # Within RELOAD_CHECK_SECONDS the file is not looked at again.
+    assert not word_in_file("grape", word_file)
+    clock[0] += passwords.RELOAD_CHECK_SECONDS
+    assert word_in_file("grape", word_file)
+    assert load_word_index(word_file) is not index
+
+
+def test_missing_file(tmp_path, monkeypatch, capsys):
+    """Verify that a missing file has no words and is reported once."""
+    monkeypatch.setattr(passwords, "_word_indexes", {})
+    monkeypatch.setattr(passwords, "_missing_files", set())
+    monkeypatch.setattr(passwords, "RELOAD_CHECK_SECONDS", 0)
+    missing = str(tmp_path / "missing.txt")
+    assert not word_in_file("apple", missing)
+    assert not word_in_file("apple", missing)
+    assert capsys.readouterr().out.count("not found") == 1
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "--tb=line", "-rN", __file__])
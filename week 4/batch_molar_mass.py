@@ -0,0 +1,145 @@
+"""Molar masses and moles for many formulas at once.
+
+element_count_matrix turns a list of formulas into a sparse
+compounds x elements matrix of atom counts, stored in compressed sparse
+row form (indptr, indices, quantities) with plain NumPy arrays. All molar
+masses are then one matrix-vector product with the vector of atomic
+masses, instead of one compute_molar_mass loop per compound. (Compounds
+with isotope labels take their molar mass from FormulaCache, which
+weighs the labelled atoms with their isotope masses.)
+
+Each distinct formula is parsed once (through a FormulaCache) and each
+distinct compound gets one row of the matrix it is computed from, so a
+list of 100,000 inventory records that name 200 compounds parses 200
+formulas and multiplies a 200-row matrix.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from periodic_table import PERIODIC_TABLE
+from formula import FormulaCache, FormulaError
+
+# Compressed sparse row matrix: the counts of row r are
+# quantities[indptr[r]:indptr[r+1]] in the columns indices[indptr[r]:indptr[r+1]].
+ElementCountMatrix = namedtuple("ElementCountMatrix",
+    ["indptr", "indices", "quantities", "shape"])
+
+_formula_cache = None
+
+
+def default_formula_cache():
+    """Return the FormulaCache for PERIODIC_TABLE, shared by every batch
+    call that does not pass its own."""
+    global _formula_cache
+    if _formula_cache is None:
+        _formula_cache = FormulaCache(PERIODIC_TABLE)
+    return _formula_cache
+
+
+def atomic_masses(formula_cache):
+    """Return the atomic mass of every element, in the cache's column order."""
+    table = formula_cache.periodic_table_dict
+    masses = getattr(table, "masses", None)
+    if masses is not None and tuple(table) == formula_cache.symbols:
+        return masses
+    return np.array([table[symbol][1] for symbol in formula_cache.symbols],
+        dtype=np.float64)
+
+
+def _compile_unique(formulas, formula_cache, errors):
+    """Return (compiled formula of each distinct formula, position of each
+    input formula in that list). A formula that cannot be parsed is
+    compiled to None when errors is "nan"."""
+    if errors not in ("raise", "nan"):
+        raise ValueError(f"errors must be 'raise' or 'nan', not {errors!r}")
+    positions = {}
+    compiled = []
+    inverse = np.empty(len(formulas), dtype=np.intp)
+    for row, formula in enumerate(formulas):
+        position = positions.get(formula)
+        if position is None:
+            try:
+                result = formula_cache.compile(formula)
+            except FormulaError:
+                if errors == "raise":
+                    raise
+                result = None
+            position = positions[formula] = len(compiled)
+            compiled.append(result)
+        inverse[row] = position
+    return compiled, inverse
+
+
+def _unique_matrix(compiled, n_elements):
+    lengths = np.array([0 if c is None else len(c.indexes) for c in compiled],
+        dtype=np.intp)
+    indptr = np.zeros(len(compiled) + 1, dtype=np.intp)
+    np.cumsum(lengths, out=indptr[1:])
+    indices = np.fromiter((index for c in compiled if c is not None
+        for index in c.indexes), dtype=np.intp, count=indptr[-1])
+    quantities = np.fromiter((quantity for c in compiled if c is not None
+        for quantity in c.quantities), dtype=np.int64, count=indptr[-1])
+    return ElementCountMatrix(indptr, indices, quantities,
+        (len(compiled), n_elements))
+
+
+def matrix_vector_product(matrix, vector):
+    """Return matrix @ vector for an ElementCountMatrix."""
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    product = np.bincount(rows, weights=matrix.quantities * vector[matrix.indices],
+        minlength=matrix.shape[0])
+    # bincount of no rows at all returns integers.
+    return product.astype(np.float64, copy=False)
+
+
+def element_count_matrix(formulas, formula_cache=None, errors="raise"):
+    """Return the ElementCountMatrix with one row per formula.
+
+    Parameters
+        formulas is a list or array of chemical formulas
+        formula_cache is the FormulaCache to parse with (its symbols are
+            the matrix columns); default_formula_cache() if None
+        errors is "raise" to raise FormulaError for an invalid formula,
+            or "nan" to give it an empty row
+    """
+    formula_cache = formula_cache or default_formula_cache()
+    compiled, inverse = _compile_unique(formulas, formula_cache, errors)
+    unique = _unique_matrix(compiled, len(formula_cache.symbols))
+    # Expand the distinct rows to one row per input formula.
+    lengths = np.diff(unique.indptr)[inverse]
+    indptr = np.zeros(len(inverse) + 1, dtype=np.intp)
+    np.cumsum(lengths, out=indptr[1:])
+    offsets = np.repeat(unique.indptr[inverse] - indptr[:-1], lengths)
+    gather = np.arange(indptr[-1]) + offsets
+    return ElementCountMatrix(indptr, unique.indices[gather],
+        unique.quantities[gather], (len(inverse), unique.shape[1]))
+
+
+def molar_masses(formulas, formula_cache=None, errors="raise"):
+    """Return the molar mass of every formula as a NumPy array.
+
+    With errors="nan" an invalid formula gets a molar mass of NaN
+    instead of raising FormulaError.
+    """
+    formula_cache = formula_cache or default_formula_cache()
+    compiled, inverse = _compile_unique(formulas, formula_cache, errors)
+    unique = _unique_matrix(compiled, len(formula_cache.symbols))
+    masses = matrix_vector_product(unique, atomic_masses(formula_cache))
+    masses[np.array([c is None for c in compiled], dtype=bool)] = np.nan
+    # The matrix counts labelled atoms under their element; take the mass
+    # of those few compounds from the compiled formula instead.
+    for position, c in enumerate(compiled):
+        if c is not None and c.isotopes:
+            masses[position] = c.molar_mass
+    return masses[inverse]
+
+
+def compute_moles(formulas, grams, formula_cache=None, errors="raise"):
+    """Return (molar masses, moles) for formulas and the mass in grams
+    of each sample."""
+    grams = np.asarray(grams, dtype=np.float64)
+    if grams.shape != (len(formulas),):
+        raise ValueError("grams must have one mass for each formula")
+    masses = molar_masses(formulas, formula_cache, errors)
+    return masses, grams / masses
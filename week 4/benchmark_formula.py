@@ -0,0 +1,82 @@
+"""Benchmark the recursive parser, parse_formula, the FormulaCache and
+the batch molar-mass engine on a bulk workload.
+
+    python benchmark_formula.py [COUNT]
+
+The corpus is COUNT (default 100,000) formulas drawn from a list of real
+compounds with Zipf-like weights, the way a lab inventory repeats a few
+common reagents many times and rare ones seldom.
+"""
+import random
+import sys
+import time
+
+from chemistry import make_periodic_table, compute_molar_mass
+from formula import parse_formula, parse_formula_recursive, FormulaCache
+from batch_molar_mass import molar_masses
+
+COMPOUNDS = [
+    "H2O", "NaCl", "C6H12O6", "CO2", "H2SO4", "HCl", "NaOH", "C2H5OH",
+    "CH4", "NH3", "CaCO3", "KMnO4", "C12H22O11", "Fe2O3", "CuSO4", "AgNO3",
+    "C6H6", "HNO3", "H3PO4", "KCl", "MgSO4", "Na2CO3", "NaHCO3", "C3H8",
+    "CH3COOH", "C8H10N4O2", "C9H8O4", "Al2(SO4)3", "Ca(OH)2", "Mg(OH)2",
+    "K2Cr2O7", "Na2S2O3", "C6H5OH", "C7H6O3", "KNO3", "NH4Cl", "(NH4)2SO4",
+    "Ca3(PO4)2", "Fe(NO3)3", "Pb(NO3)2", "BaCl2", "ZnSO4", "SiO2", "TiO2",
+    "C2H4", "C2H2", "C4H10", "C8H18", "CH3OH", "C3H6O", "C2H6O2", "CH2O",
+    "C6H8O7", "C10H8", "C20H25N3O", "C27H46O", "C17H19NO3", "C21H30O2",
+    "PO4H2(CH2)12CH3", "Cu(NH3)4SO4", "K4Fe(CN)6", "Co(NH3)6Cl3",
+    "UO2(NO3)2", "Na2B4O7", "LiAlH4", "NaBH4", "SnCl2", "HgCl2", "AuCl3",
+]
+
+
+def make_corpus(count, seed=0):
+    weights = [1 / rank for rank in range(1, len(COMPOUNDS) + 1)]
+    return random.Random(seed).choices(COMPOUNDS, weights, k=count)
+
+
+def time_it(label, function, corpus):
+    start = time.perf_counter()
+    total = 0
+    for formula in corpus:
+        total += function(formula)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<36} {elapsed:8.3f} s  {len(corpus) / elapsed:12,.0f} formulas/s")
+    return total
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    count = int(argv[0]) if argv else 100_000
+    periodic_table = make_periodic_table()
+    corpus = make_corpus(count)
+    print(f"{count:,} formulas, {len(set(corpus))} distinct")
+
+    def parse_each_time(formula):
+        return compute_molar_mass(parse_formula(formula, periodic_table), periodic_table)
+
+    cache = FormulaCache(periodic_table)
+
+    def cached(formula):
+        return cache.compile(formula).molar_mass
+
+    def recursive_each_time(formula):
+        return compute_molar_mass(parse_formula_recursive(formula, periodic_table), periodic_table)
+
+    # The tokenizer grammar must not be slower than the recursive parser
+    # it replaced.
+    time_it("parse_formula_recursive + mass", recursive_each_time, corpus)
+    expected = time_it("parse_formula + compute_molar_mass", parse_each_time, corpus)
+    actual = time_it("FormulaCache.compile", cached, corpus)
+    assert actual == expected
+    print(cache.cache_info())
+
+    start = time.perf_counter()
+    batch = molar_masses(corpus, FormulaCache(periodic_table))
+    elapsed = time.perf_counter() - start
+    print(f"{'batch_molar_mass.molar_masses':<36} {elapsed:8.3f} s  {count / elapsed:12,.0f} formulas/s")
+    assert abs(batch.sum() - expected) <= 1e-9 * expected
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
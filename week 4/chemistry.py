@@ -4,45 +4,19 @@
 # In main, I added a loop so the user can enter as many compounds as they want 
 # and also show the formula back in the correct format before giving results.
 
-from formula import parse_formula
+from formula import FormulaCache, FormulaError
+from periodic_table import PERIODIC_TABLE
 
 def make_periodic_table():
-    periodic_table_dict = {
-        "Ac": ["Actinium",	227], "Ag": ["Silver",	107.8682], "Al": ["Aluminum",	26.9815386],
-        "Ar": ["Argon",	39.948], "As": ["Arsenic",	74.9216], "At": ["Astatine",	210], 
-        "Au": ["Gold",	196.966569], "B": ["Boron",	10.811], "Ba": ["Barium",	137.327],
-        "Be": ["Beryllium",	9.012182], "Bi": ["Bismuth",	208.9804], "Br": ["Bromine",	79.904],
-        "C": ["Carbon",	12.0107], "Ca": ["Calcium",	40.078], "Cd": ["Cadmium",	112.411],
-        "Ce": ["Cerium",	140.116], "Cl": ["Chlorine",	35.453], "Co": ["Cobalt",	58.933195],
-        "Cr": ["Chromium",	51.9961], "Cs": ["Cesium",	132.9054519], "Cu": ["Copper",	63.546],
-        "Dy": ["Dysprosium",	162.5], "Er": ["Erbium",	167.259], "Eu": ["Europium",	151.964],
-        "F": ["Fluorine",	18.9984032], "Fe": ["Iron",	55.845], "Fr": ["Francium",	223],
-        "Ga": ["Gallium",	69.723], "Gd": ["Gadolinium",	157.25], "Ge": ["Germanium",	72.64],
-        "H": ["Hydrogen",	1.00794], "He": ["Helium",	4.002602], "Hf": ["Hafnium",	178.49],
-        "Hg": ["Mercury",	200.59], "Ho": ["Holmium",	164.93032], "I": ["Iodine",	126.90447],
-        "In": ["Indium",	114.818], "Ir": ["Iridium",	192.217], "K": ["Potassium",	39.0983],
-        "Kr": ["Krypton",	83.798], "La": ["Lanthanum",	138.90547], "Li": ["Lithium",	6.941],
-        "Lu": ["Lutetium",	174.9668], "Mg": ["Magnesium",	24.305], "Mn": ["Manganese",	54.938045],
-        "Mo": ["Molybdenum",	95.96], "N": ["Nitrogen",	14.0067], "Na": ["Sodium",	22.98976928],
-        "Nb": ["Niobium",	92.90638], "Nd": ["Neodymium",	144.242], "Ne": ["Neon",	20.1797],
-        "Ni": ["Nickel",	58.6934], "Np": ["Neptunium",	237], "O": ["Oxygen",	15.9994],
-        "Os": ["Osmium",	190.23], "P": ["Phosphorus",	30.973762], "Pa": ["Protactinium",	231.03588],
-        "Pb": ["Lead",	207.2], "Pd": ["Palladium",	106.42], "Pm": ["Promethium",	145],
-        "Po": ["Polonium",	209], "Pr": ["Praseodymium",	140.90765], "Pt": ["Platinum",	195.084],
-        "Pu": ["Plutonium",	244], "Ra": ["Radium",	226], "Rb": ["Rubidium",	85.4678],
-        "Re": ["Rhenium",	186.207], "Rh": ["Rhodium",	102.9055], "Rn": ["Radon",	222],
-        "Ru": ["Ruthenium",	101.07], "S": ["Sulfur",	32.065], "Sb": ["Antimony",	121.76],
-        "Sc": ["Scandium",	44.955912], "Se": ["Selenium",	78.96], "Si": ["Silicon",	28.0855],
-        "Sm": ["Samarium",	150.36], "Sn": ["Tin",	118.71], "Sr": ["Strontium",	87.62],
-        "Ta": ["Tantalum",	180.94788], "Tb": ["Terbium",	158.92535], "Tc": ["Technetium",	98],
-        "Te": ["Tellurium",	127.6], "Th": ["Thorium",	232.03806], "Ti": ["Titanium",	47.867],
-        "Tl": ["Thallium",	204.3833], "Tm": ["Thulium",	168.93421], "U": ["Uranium",	238.02891],
-        "V": ["Vanadium",	50.9415], "W": ["Tungsten",	183.84], "Xe": ["Xenon",	131.293],
-        "Y": ["Yttrium",	88.90585], "Yb": ["Ytterbium",	173.054], "Zn": ["Zinc",	65.38], "Zr": ["Zirconium",	91.224]
-    }
-    return periodic_table_dict
+    # The element data lives in periodic_table.py and is built once at
+    # import; this returns a fresh dictionary view of it for callers that
+    # want a plain dict of symbol -> [name, atomic mass].
+    return PERIODIC_TABLE.as_dict()
 
 
+# The list from parse_formula has no isotope labels, so a labelled atom
+# like the C in ^13CH4 is weighed at the standard atomic mass here;
+# FormulaCache.compile weighs it with its isotope mass.
 def compute_molar_mass(symbol_quantity_list, periodic_table):
     total_mass = 0
     for symbol, quantity in symbol_quantity_list:
@@ -52,58 +26,122 @@ def compute_molar_mass(symbol_quantity_list, periodic_table):
 
 # I added this function to make sure the program can tell the difference between 
 # symbols like Co (Cobalt) and C + O (Carbon and Oxygen), and others like that.
-# Not perfect but it kind of did what I needed it to do.
-def normalize_by_symbols(formula, periodic_table):
-    s = formula.strip()
+# It used to backtrack through every way of splitting the letters, which took
+# exponential time on long inputs like "cococo...". Now symbol_parses first
+# works out, from the end of the string backwards, which positions can still
+# be split into symbols, and then only ever follows splits that are known to
+# work, so each parse takes time proportional to the length of the formula.
+def _symbol_choices(s, periodic_table):
+    """For every position in s, list the (text, next position) pairs that a
+    parse can take from there: a one- or two-letter element symbol, a whole
+    run of digits or a punctuation character. Options are in order of preference."""
     L = len(s)
-    def dfs(i):
-        if i >= L:
-            return ""
+    choices = [None] * L
+    digits_end = L
+    for i in range(L - 1, -1, -1):
         ch = s[i]
+        if not ch.isdigit():
+            digits_end = i
         if ch.isalpha():
+            options = []
             one = ch.upper()
             if one in periodic_table:
-                tail = dfs(i + 1)
-                if tail is not None:
-                    return one + tail
+                options.append((one, i + 1))
             if i + 1 < L and s[i+1].isalpha():
                 two = ch.upper() + s[i+1].lower()
                 if two in periodic_table:
-                    tail = dfs(i + 2)
-                    if tail is not None:
-                        return two + tail
-            return None
-        if ch.isdigit():
-            j = i
-            while j < L and s[j].isdigit():
-                j += 1
-            tail = dfs(j)
-            if tail is not None:
-                return s[i:j] + tail
-            return None
-        if ch in "()":
-            tail = dfs(i + 1)
-            if tail is not None:
-                return ch + tail
-            return None
-        return None
-    normalized = dfs(0)
-    return normalized if normalized is not None else s
+                    options.append((two, i + 2))
+            choices[i] = options
+        elif ch.isdigit():
+            choices[i] = [(s[i:digits_end], digits_end)]
+        elif ch in "()[]·•*.^+-":
+            # Brackets, hydrate dots, charges and isotope carets are
+            # kept as they are (see formula.parse_formula_details).
+            choices[i] = [(ch, i + 1)]
+        else:
+            choices[i] = []
+    return choices
+
+def symbol_parses(formula, periodic_table):
+    """Yield every way of writing formula with correctly capitalized
+    element symbols, the preferred one (one-letter symbols first) first.
+    """
+    s = formula.strip()
+    L = len(s)
+    choices = _symbol_choices(s, periodic_table)
+    # can_finish[i] is True when s[i:] can be split into symbols.
+    can_finish = [False] * (L + 1)
+    can_finish[L] = True
+    for i in range(L - 1, -1, -1):
+        choices[i] = [(text, j) for text, j in choices[i] if can_finish[j]]
+        can_finish[i] = bool(choices[i])
+    if not can_finish[0]:
+        return
+    # Depth-first over the choices that lead to a complete parse. Each
+    # stack entry keeps its path as a linked list (text, previous node).
+    stack = [(0, None)]
+    while stack:
+        i, path = stack.pop()
+        if i == L:
+            parts = []
+            while path is not None:
+                text, path = path
+                parts.append(text)
+            yield "".join(reversed(parts))
+            continue
+        for text, j in reversed(choices[i]):
+            stack.append((j, (text, path)))
+
+def normalize_by_symbols(formula, periodic_table):
+    for normalized in symbol_parses(formula, periodic_table):
+        return normalized
+    return formula.strip()
+
+def ambiguous_parses(formula, periodic_table, limit=10):
+    """Return up to limit ways of reading formula; more than one means the
+    formula is ambiguous (like "co", which is CO or Co)."""
+    parses = []
+    for normalized in symbol_parses(formula, periodic_table):
+        parses.append(normalized)
+        if len(parses) >= limit:
+            break
+    return parses
+
+def formula_readings(formula, formula_cache, limit=4):
+    """Return the ways to read a formula the user typed, the one to use
+    first. A formula that parses as typed keeps its capitalization and has
+    that one reading; others, like all-lowercase input, are read with
+    ambiguous_parses."""
+    formula = formula.strip()
+    try:
+        formula_cache.compile(formula)
+        return [formula]
+    except FormulaError:
+        return ambiguous_parses(formula, formula_cache.periodic_table_dict, limit) or [formula]
 
 def main():
-    periodic_table = make_periodic_table()
+    periodic_table = PERIODIC_TABLE
+    # Each distinct formula is parsed only once per session.
+    formula_cache = FormulaCache(periodic_table)
     while True:
         mole_formula = input("Enter the molecular formula of the sample (or 'q' to quit): ").strip()
         if mole_formula.lower() == "q":
             print("Goodbye!")
             break
         mass = float(input("Enter the mass in grams of the sample: "))
-        mole_formula = normalize_by_symbols(mole_formula, periodic_table)
-        symbol_quantity_list = parse_formula(mole_formula, periodic_table)
-        molar_mass = compute_molar_mass(symbol_quantity_list, periodic_table)
+        parses = formula_readings(mole_formula, formula_cache)
+        if len(parses) > 1:
+            print(f"Note: {mole_formula} could also be read as {', '.join(parses[1:])}")
+        mole_formula = parses[0] if parses else mole_formula
+        molar_mass = formula_cache.compile(mole_formula).molar_mass
         print(f"The molar mass of {mole_formula} is {molar_mass:.5f} grams/mole")
         num_moles = mass / molar_mass
         print(f"{num_moles:.5f} moles of {mole_formula}\n")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import sys
+    if sys.argv[1:2] == ["convert"]:
+        # Batch mode: python chemistry.py convert INPUT OUTPUT ...
+        import convert_samples
+        sys.exit(convert_samples.main(sys.argv[2:]))
+    main()
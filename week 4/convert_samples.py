@@ -0,0 +1,238 @@
+"""Convert a file of (formula, grams) records to molar masses and moles.
+
+    python chemistry.py convert INPUT OUTPUT [--workers N] [--chunk-size N]
+    python convert_samples.py INPUT OUTPUT [...]
+
+INPUT and OUTPUT are CSV or JSON Lines files (chosen by extension, .csv
+or .jsonl, or with --input-format/--output-format); "-" reads stdin or
+writes stdout, as CSV unless a format is given. Every input record needs a formula and a mass in grams
+(the column or key names can be changed with --formula-field and
+--grams-field).
+
+Records are read, converted and written a chunk at a time, so memory use
+does not grow with the size of the file. A record with an invalid
+formula or mass gets an error message in its output row instead of
+stopping the conversion. With --workers N, N processes convert chunks
+side by side; output stays in input order.
+"""
+import argparse
+import csv
+import itertools
+import json
+import math
+import sys
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from batch_molar_mass import default_formula_cache, molar_masses
+from chemistry import formula_readings
+from formula import FormulaError
+
+CHUNK_SIZE = 50_000
+OUTPUT_FIELDS = ["record", "formula", "grams", "molar_mass", "moles", "error"]
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+
+def file_format(filename, given):
+    if given:
+        return given
+    if filename == "-":
+        return "csv"
+    for extension, name in FORMATS.items():
+        if filename.lower().endswith(extension):
+            return name
+    raise ValueError(f"cannot tell the format of {filename}; use .csv or .jsonl "
+        "or give the format")
+
+
+def read_records(file, fmt, formula_field="formula", grams_field="grams"):
+    """Return an iterator of (formula, grams) from an open CSV or JSON Lines
+    file. A CSV header without one of the fields raises ValueError right
+    away; values missing from a record are None."""
+    if fmt == "csv":
+        reader = csv.reader(file)
+        header = next(reader, [])
+        for field in (formula_field, grams_field):
+            if field not in header:
+                raise ValueError(f"the input has no {field!r} column")
+        columns = [header.index(formula_field), header.index(grams_field)]
+        return (tuple(row[column] if column < len(row) else None for column in columns)
+            for row in reader)
+    return _read_jsonl(file, formula_field, grams_field)
+
+
+def _read_jsonl(file, formula_field, grams_field):
+    for line in file:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield None, None
+            continue
+        if not isinstance(record, dict):
+            record = {}
+        yield record.get(formula_field), record.get(grams_field)
+
+
+def _formula_error(formula, formula_cache):
+    try:
+        formula_cache.compile(formula)
+    except FormulaError as error:
+        return str(error.args[0])
+    return None
+
+
+def convert_chunk(first_record, records, normalize=False):
+    """Return the output rows (tuples of OUTPUT_FIELDS) for a list of
+    (formula, grams) records numbered from first_record."""
+    formula_cache = default_formula_cache()
+    errors = [None] * len(records)
+    normalized = {}
+    formulas = []
+    grams = np.full(len(records), np.nan)
+    for row, (formula, mass) in enumerate(records):
+        if not isinstance(formula, str) or not formula.strip():
+            errors[row] = "missing formula"
+            formula = ""
+        elif normalize:
+            if formula not in normalized:
+                # Formulas that parse as written keep their capitalization.
+                normalized[formula] = formula_readings(formula, formula_cache)[0]
+            formula = normalized[formula]
+        else:
+            formula = formula.strip()
+        formulas.append(formula)
+        try:
+            grams[row] = float(mass)
+        except (TypeError, ValueError):
+            grams[row] = math.nan
+        # inf and nan parse, but would be written as invalid JSON.
+        if not math.isfinite(grams[row]):
+            errors[row] = errors[row] or f"invalid mass: {mass!r}"
+    masses = molar_masses(formulas, formula_cache, errors="nan")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        moles = grams / masses
+    messages = {}
+    output = []
+    for row, formula in enumerate(formulas):
+        error = errors[row]
+        if error is None and math.isnan(masses[row]):
+            if formula not in messages:
+                messages[formula] = _formula_error(formula, formula_cache)
+            error = messages[formula]
+        valid = error is None
+        mass = records[row][1]
+        if isinstance(mass, float) and not math.isfinite(mass):
+            # JSON input can hold Infinity and NaN too; write them as text.
+            mass = str(mass)
+        output.append((first_record + row, formula, mass,
+            float(masses[row]) if valid else None,
+            float(moles[row]) if valid else None, error))
+    return output
+
+
+class RecordWriter:
+    def __init__(self, file, fmt):
+        self.file = file
+        self.fmt = fmt
+        if fmt == "csv":
+            self.writer = csv.writer(file, lineterminator="\n")
+            self.writer.writerow(OUTPUT_FIELDS)
+
+    def write(self, rows):
+        if self.fmt == "csv":
+            self.writer.writerows(rows)
+        else:
+            self.file.writelines(json.dumps(dict(zip(OUTPUT_FIELDS, row))) + "\n"
+                for row in rows)
+        self.file.flush()
+
+
+def chunked(records, chunk_size):
+    """Yield (number of the first record, list of records) chunks."""
+    records = iter(records)
+    first = 1
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk:
+            return
+        yield first, chunk
+        first += len(chunk)
+
+
+def convert(records, writer, chunk_size=CHUNK_SIZE, workers=1, normalize=False):
+    """Convert records chunk by chunk and write the results in order.
+    Return (number of records, number of records with an error)."""
+    total = failed = 0
+
+    def write(rows):
+        nonlocal total, failed
+        writer.write(rows)
+        total += len(rows)
+        failed += sum(row[-1] is not None for row in rows)
+
+    chunks = chunked(records, chunk_size)
+    if workers <= 1:
+        for first, chunk in chunks:
+            write(convert_chunk(first, chunk, normalize))
+        return total, failed
+    with ProcessPoolExecutor(workers) as executor:
+        # At most two chunks per worker are in flight, which bounds memory
+        # and keeps the output in input order.
+        pending = deque()
+        for first, chunk in chunks:
+            pending.append(executor.submit(convert_chunk, first, chunk, normalize))
+            if len(pending) >= 2 * workers:
+                write(pending.popleft().result())
+        while pending:
+            write(pending.popleft().result())
+    return total, failed
+
+
+def open_file(filename, mode):
+    if filename == "-":
+        return nullcontext(sys.stdin if "r" in mode else sys.stdout)
+    return open(filename, mode, encoding="utf-8", newline="")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compute molar masses and moles for a file of samples.")
+    parser.add_argument("input", help="CSV or JSONL file of formula/grams records, or -")
+    parser.add_argument("output", help="CSV or JSONL file to write, or -")
+    parser.add_argument("--input-format", choices=["csv", "jsonl"])
+    parser.add_argument("--output-format", choices=["csv", "jsonl"])
+    parser.add_argument("--formula-field", default="formula")
+    parser.add_argument("--grams-field", default="grams")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=1,
+        help="number of processes to convert with (default: 1)")
+    parser.add_argument("--normalize", action="store_true",
+        help="fix the capitalization of formulas like nacl that do not parse as written")
+    args = parser.parse_args(argv)
+    try:
+        input_format = file_format(args.input, args.input_format)
+        output_format = file_format(args.output, args.output_format)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.chunk_size < 1 or args.workers < 1:
+        parser.error("--chunk-size and --workers must be at least 1")
+    with open_file(args.input, "r") as infile:
+        try:
+            records = read_records(infile, input_format, args.formula_field, args.grams_field)
+        except ValueError as error:
+            parser.error(str(error))
+        with open_file(args.output, "w") as outfile:
+            total, failed = convert(records, RecordWriter(outfile, output_format),
+                args.chunk_size, args.workers, args.normalize)
+    print(f"Converted {total} records, {failed} with errors.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,9 @@
+import functools
+import re
+from collections import namedtuple
+from collections.abc import Mapping
+
+from periodic_table import ISOTOPE_MASSES
 
 class FormulaError(ValueError):
     """FormulaError is the type of error that the parse_formula
@@ -5,27 +11,254 @@ class FormulaError(ValueError):
     """
 
 
+# One regular expression splits a formula into tokens in a single pass
+# (re.findall, so the scanning happens in C). Each token is a tuple of
+# the groups below, and exactly one kind of group is set in each:
+#   isotope label (^13), element symbol and its count
+#   opening bracket
+#   closing bracket and its count
+#   hydrate dot (· or .) and its count
+#   caret charge (^2+) or trailing charge signs (-, ++)
+#   a count with nothing before it
+#   any other character
+_TOKEN = re.compile(r"""
+    (?:\^([0-9]+))?([A-Z][a-z]?)([0-9]*)
+  | ([(\[])
+  | ([)\]])([0-9]*)
+  | ([·•*.])([0-9]*)
+  | \^([0-9]*[+-]) | ([+-]+)
+  | ([0-9]+)
+  | (.)
+""", re.VERBOSE | re.DOTALL)
+
+_CLOSING = {"(": ")", "[": "]"}
+
+# The result of parse_formula_details:
+#   elements is the compound list that parse_formula returns
+#   charge is the net charge as an int (0 if none was given)
+#   isotopes maps (mass number, symbol) to the number of labelled atoms,
+#       which are also counted under their element in elements
+ParsedFormula = namedtuple("ParsedFormula", ["elements", "charge", "isotopes"])
+
+
+def _token_position(formula, number):
+    """Return the index in formula where token number starts."""
+    for count, match in enumerate(_TOKEN.finditer(formula)):
+        if count == number:
+            return match.start()
+    return len(formula)
+
+
+def _quantity(text, formula, number):
+    if not text:
+        return 1
+    if text[0] == "0":
+        raise FormulaError("invalid formula, "
+            "quantity begins with zero (0), perhaps "
+            "you meant to type capital O for Oxygen "
+            "instead of zero", formula, _token_position(formula, number))
+    return int(text)
+
+
+def _trailing_charge(tokens, formula):
+    """Remove a charge from the end of tokens and return it as an int."""
+    caret, signs = tokens.pop()[8:10]
+    if caret:
+        return int(caret[:-1] or 1) * (1 if caret[-1] == "+" else -1)
+    if len(set(signs)) != 1:
+        raise FormulaError("invalid formula; mixed charge signs",
+            formula, len(formula) - len(signs))
+    magnitude = len(signs)
+    if tokens and tokens[-1][4] == "]" and tokens[-1][5] and magnitude == 1:
+        # In [Fe(CN)6]4- the 4 after the bracket is the charge, not a count.
+        # After a round bracket it is ambiguous, as (SO4)2- shows.
+        magnitude = int(tokens[-1][5])
+        tokens[-1] = tokens[-1][:5] + ("",) + tokens[-1][6:]
+    elif tokens and (tokens[-1][2] or tokens[-1][5]):
+        # Fe3+ could be Fe with charge 3+ or three Fe with charge +,
+        # and NH4+ or Ca(OH)2- the other way round; make the writer say which.
+        raise FormulaError("invalid formula; ambiguous charge, "
+            "write it with a caret like Fe^3+ or NH4^+",
+            formula, len(formula) - len(signs) - 1)
+    return magnitude if signs[0] == "+" else -magnitude
+
+
+def parse_formula_details(formula, periodic_table_dict):
+    """Parse a chemical formula and return a ParsedFormula.
+
+    Besides element symbols, counts and round parentheses, a formula
+    may contain:
+        square brackets, like [Fe(CN)6]4-
+        hydrate dots (· or .) with an optional count, like CuSO4·5H2O
+        a charge at the end, either as signs (OH-, Fe++), as a count
+            and a sign after a square bracket ([Fe(CN)6]4-), or with
+            a caret (Fe^3+, SO4^2-, NH4^+); any other count right
+            before the signs, as in Fe3+ or (SO4)2-, is ambiguous and
+            rejected
+        isotope labels, like ^13C or (^2H)2O
+
+    Parameters
+        formula is a string that contains a chemical formula
+        periodic_table_dict is the compound dictionary returned
+            from make_periodic_table, or a PeriodicTable
+    Return: a ParsedFormula
+    """
+    assert isinstance(formula, str), \
+        "wrong data type for parameter formula; " \
+        f"formula is a {type(formula)} but must be a string"
+    assert isinstance(periodic_table_dict, (dict, Mapping)), \
+        "wrong data type for parameter periodic_table_dict; " \
+        f"periodic_table_dict is a {type(periodic_table_dict)} " \
+        "but must be a dictionary or PeriodicTable"
+
+    tokens = _TOKEN.findall(formula)
+    charge = 0
+    if tokens and (tokens[-1][8] or tokens[-1][9]):
+        charge = _trailing_charge(tokens, formula)
+    # One element dict per open group, innermost last; the first one
+    # holds the current hydrate part. Labelled atoms are also counted
+    # under an (isotope, symbol) key, so group and hydrate counts
+    # multiply them too; they are split out at the end.
+    stack = [{}]
+    openings = []
+    total = {}
+    multiplier = 1
+    labelled = False
+    elements = stack[0]
+    for number, (isotope, symbol, quantity, opening, closing, group_quantity,
+            dot, dot_quantity, _, signs, stray, other) in enumerate(tokens):
+        if symbol:
+            if symbol not in periodic_table_dict:
+                raise FormulaError("invalid formula; "
+                    f"unknown element symbol: {symbol}",
+                    formula, _token_position(formula, number))
+            # The common case, inlined: a count that does not start with 0.
+            if not quantity:
+                quantity = 1
+            elif quantity[0] != "0":
+                quantity = int(quantity)
+            else:
+                _quantity(quantity, formula, number)
+            elements[symbol] = elements.get(symbol, 0) + quantity
+            if isotope:
+                key = (int(isotope), symbol)
+                elements[key] = elements.get(key, 0) + quantity
+                labelled = True
+        elif opening:
+            elements = {}
+            stack.append(elements)
+            openings.append((opening, number))
+        elif closing:
+            if not openings:
+                raise FormulaError("invalid formula; "
+                    "unmatched close parenthesis",
+                    formula, _token_position(formula, number))
+            opened = openings.pop()[0]
+            if _CLOSING[opened] != closing:
+                raise FormulaError("invalid formula; "
+                    f"{opened} closed by {closing}",
+                    formula, _token_position(formula, number))
+            quantity = _quantity(group_quantity, formula, number)
+            group = stack.pop()
+            elements = stack[-1]
+            for key, count in group.items():
+                elements[key] = elements.get(key, 0) + count * quantity
+        elif dot:
+            if openings:
+                raise FormulaError("invalid formula; "
+                    "hydrate dot inside brackets",
+                    formula, _token_position(formula, number))
+            if number == len(tokens) - 1:
+                raise FormulaError("invalid formula; "
+                    "nothing after the hydrate dot",
+                    formula, _token_position(formula, number))
+            if not elements:
+                raise FormulaError("invalid formula; "
+                    "no element symbols before the hydrate dot",
+                    formula, _token_position(formula, number))
+            for key, count in elements.items():
+                total[key] = total.get(key, 0) + count * multiplier
+            elements = stack[0] = {}
+            multiplier = _quantity(dot_quantity, formula, number)
+        else:
+            if stray:
+                # Decimal digit not preceded by an
+                # element symbol or close parenthesis
+                message = "invalid formula"
+            elif signs or not other:
+                message = "invalid formula; charge must come last"
+            elif other.isalpha():
+                message = "invalid formula; " + \
+                    f"unknown element symbol: {other}"
+            else:
+                # Illegal character
+                message = "invalid formula; " + \
+                    f"illegal character: {other}"
+            raise FormulaError(message, formula, _token_position(formula, number))
+    if openings:
+        raise FormulaError("invalid formula; "
+            "unmatched open parenthesis",
+            formula, _token_position(formula, openings[-1][1]))
+    if not elements:
+        # Also catches a charge on its own, like "-" or "^2-".
+        raise FormulaError("invalid formula; no element symbols",
+            formula, len(formula))
+    if total:
+        for key, count in elements.items():
+            total[key] = total.get(key, 0) + count * multiplier
+        elements = total
+    elif multiplier != 1:
+        elements = {key: count * multiplier for key, count in elements.items()}
+    if not labelled:
+        return ParsedFormula(list(elements.items()), charge, {})
+    isotopes = {key: count for key, count in elements.items() if isinstance(key, tuple)}
+    return ParsedFormula([(key, count) for key, count in elements.items()
+        if not isinstance(key, tuple)], charge, isotopes)
+
+
 def parse_formula(formula, periodic_table_dict):
     """Convert a chemical formula for a molecule into a compound
     list that stores the quantity of atoms of each element
     in the molecule. For example, this function will convert
-    "H2O" to [["H", 2], ["O", 1]] and
-    "PO4H2(CH2)12CH3" to [["P", 1], ["O", 4], ["H", 29], ["C", 13]]
+    "H2O" to [["H", 2], ["O", 1]],
+    "PO4H2(CH2)12CH3" to [["P", 1], ["O", 4], ["H", 29], ["C", 13]] and
+    "CuSO4·5H2O" to [["Cu", 1], ["S", 1], ["O", 9], ["H", 10]]
+
+    See parse_formula_details for the grammar; charges and isotope
+    labels are accepted but only the element counts are returned, so
+    labelled atoms count as their element (^13CH4 gives C 1, H 4) and
+    compute_molar_mass weighs them at the standard atomic mass. Use
+    FormulaCache for the molar mass with isotope masses.
 
     Parameters
         formula is a string that contains a chemical formula
         periodic_table_dict is the compound dictionary returned
-            from make_periodic_table
+            from make_periodic_table, or a PeriodicTable
+    Return: a compound list that contains chemical symbols and
+        quantities like this [["Fe", 2], ["O", 3]]
+    """
+    return parse_formula_details(formula, periodic_table_dict).elements
+
+
+def parse_formula_recursive(formula, periodic_table_dict):
+    """The original recursive parser, which understands only element
+    symbols, counts and round parentheses. It is kept as the reference
+    that parse_formula is tested and benchmarked against.
+
+    Parameters
+        formula is a string that contains a chemical formula
+        periodic_table_dict is the compound dictionary returned
+            from make_periodic_table, or a PeriodicTable
     Return: a compound list that contains chemical symbols and
         quantities like this [["Fe", 2], ["O", 3]]
     """
     assert isinstance(formula, str), \
         "wrong data type for parameter formula; " \
         f"formula is a {type(formula)} but must be a string"
-    assert isinstance(periodic_table_dict, dict), \
+    assert isinstance(periodic_table_dict, (dict, Mapping)), \
         "wrong data type for parameter periodic_table_dict; " \
         f"periodic_table_dict is a {type(periodic_table_dict)} " \
-        "but must be a dictionary"
+        "but must be a dictionary or PeriodicTable"
 
     def parse_quant(formula, index):
         quant = 1
@@ -102,3 +335,66 @@ def parse_formula(formula, periodic_table_dict):
     # will be a list in this form: ["symbol", quantity]
     elem_dict, _ = parse_r(formula, 0, 0)
     return list(elem_dict.items())
+
+
+# A parsed formula as an element-count vector: the element symbols, their
+# positions in the periodic table the formula was compiled against, the
+# quantity of each, and the molar mass. Labelled atoms are counted under
+# their element and listed again in isotopes as ((mass number, symbol),
+# count) pairs; the molar mass weighs them with their isotope mass.
+CompiledFormula = namedtuple("CompiledFormula",
+    ["symbols", "indexes", "quantities", "molar_mass", "isotopes"])
+
+
+class FormulaCache:
+    """Parses each distinct formula once.
+
+    compile(formula) returns a CompiledFormula and remembers the most
+    recent maxsize results, so bulk workloads that see the same
+    compounds again and again pay for a dictionary lookup instead of a
+    parse. Invalid formulas raise FormulaError as parse_formula does
+    (errors are not cached).
+
+    Parameters
+        periodic_table_dict is the compound dictionary returned
+            from make_periodic_table, or a PeriodicTable
+        maxsize is the number of formulas to remember
+    """
+
+    def __init__(self, periodic_table_dict, maxsize=65536):
+        self.periodic_table_dict = periodic_table_dict
+        self.symbols = tuple(periodic_table_dict)
+        # A PeriodicTable already has its symbol -> position map.
+        self.positions = getattr(periodic_table_dict, "index", None) or \
+            {symbol: index for index, symbol in enumerate(self.symbols)}
+        self.compile = functools.lru_cache(maxsize=maxsize)(self._compile)
+
+    def _compile(self, formula):
+        compound, _, isotopes = parse_formula_details(formula, self.periodic_table_dict)
+        symbols = tuple(symbol for symbol, _ in compound)
+        quantities = tuple(quantity for _, quantity in compound)
+        # Summed in the same order as chemistry.compute_molar_mass, so
+        # the result is identical to it.
+        molar_mass = 0
+        for symbol, quantity in compound:
+            molar_mass += self.periodic_table_dict[symbol][1] * quantity
+        for (mass_number, symbol), quantity in isotopes.items():
+            if (mass_number, symbol) not in ISOTOPE_MASSES:
+                raise FormulaError("invalid formula; unknown isotope: "
+                    f"^{mass_number}{symbol}", formula, formula.index("^"))
+            molar_mass += (ISOTOPE_MASSES[mass_number, symbol]
+                - self.periodic_table_dict[symbol][1]) * quantity
+        return CompiledFormula(symbols,
+            tuple(self.positions[symbol] for symbol in symbols),
+            quantities, molar_mass, tuple(isotopes.items()))
+
+    def parse(self, formula):
+        """Return the element counts, like parse_formula."""
+        compiled = self.compile(formula)
+        return list(zip(compiled.symbols, compiled.quantities))
+
+    def cache_info(self):
+        return self.compile.cache_info()
+
+    def clear(self):
+        self.compile.cache_clear()
@@ -0,0 +1,203 @@
+"""The periodic table, built once when this module is imported.
+
+PERIODIC_TABLE is an immutable PeriodicTable shared by everything that
+needs element data. Symbols are interned, atomic masses sit in one
+contiguous read-only NumPy array in symbol order, and a symbol's
+position in that order is a single dict lookup, which is what the
+vectorized molar-mass code indexes with.
+
+A PeriodicTable is also a read-only mapping from symbol to
+(name, atomic mass), so it can be used anywhere the dictionary from
+chemistry.make_periodic_table is used.
+"""
+import sys
+from collections.abc import Mapping
+from types import MappingProxyType
+
+import numpy as np
+
+# (symbol, name, atomic mass) of every element.
+ELEMENTS = (
+    ("Ac", "Actinium", 227),
+    ("Ag", "Silver", 107.8682),
+    ("Al", "Aluminum", 26.9815386),
+    ("Ar", "Argon", 39.948),
+    ("As", "Arsenic", 74.9216),
+    ("At", "Astatine", 210),
+    ("Au", "Gold", 196.966569),
+    ("B", "Boron", 10.811),
+    ("Ba", "Barium", 137.327),
+    ("Be", "Beryllium", 9.012182),
+    ("Bi", "Bismuth", 208.9804),
+    ("Br", "Bromine", 79.904),
+    ("C", "Carbon", 12.0107),
+    ("Ca", "Calcium", 40.078),
+    ("Cd", "Cadmium", 112.411),
+    ("Ce", "Cerium", 140.116),
+    ("Cl", "Chlorine", 35.453),
+    ("Co", "Cobalt", 58.933195),
+    ("Cr", "Chromium", 51.9961),
+    ("Cs", "Cesium", 132.9054519),
+    ("Cu", "Copper", 63.546),
+    ("Dy", "Dysprosium", 162.5),
+    ("Er", "Erbium", 167.259),
+    ("Eu", "Europium", 151.964),
+    ("F", "Fluorine", 18.9984032),
+    ("Fe", "Iron", 55.845),
+    ("Fr", "Francium", 223),
+    ("Ga", "Gallium", 69.723),
+    ("Gd", "Gadolinium", 157.25),
+    ("Ge", "Germanium", 72.64),
+    ("H", "Hydrogen", 1.00794),
+    ("He", "Helium", 4.002602),
+    ("Hf", "Hafnium", 178.49),
+    ("Hg", "Mercury", 200.59),
+    ("Ho", "Holmium", 164.93032),
+    ("I", "Iodine", 126.90447),
+    ("In", "Indium", 114.818),
+    ("Ir", "Iridium", 192.217),
+    ("K", "Potassium", 39.0983),
+    ("Kr", "Krypton", 83.798),
+    ("La", "Lanthanum", 138.90547),
+    ("Li", "Lithium", 6.941),
+    ("Lu", "Lutetium", 174.9668),
+    ("Mg", "Magnesium", 24.305),
+    ("Mn", "Manganese", 54.938045),
+    ("Mo", "Molybdenum", 95.96),
+    ("N", "Nitrogen", 14.0067),
+    ("Na", "Sodium", 22.98976928),
+    ("Nb", "Niobium", 92.90638),
+    ("Nd", "Neodymium", 144.242),
+    ("Ne", "Neon", 20.1797),
+    ("Ni", "Nickel", 58.6934),
+    ("Np", "Neptunium", 237),
+    ("O", "Oxygen", 15.9994),
+    ("Os", "Osmium", 190.23),
+    ("P", "Phosphorus", 30.973762),
+    ("Pa", "Protactinium", 231.03588),
+    ("Pb", "Lead", 207.2),
+    ("Pd", "Palladium", 106.42),
+    ("Pm", "Promethium", 145),
+    ("Po", "Polonium", 209),
+    ("Pr", "Praseodymium", 140.90765),
+    ("Pt", "Platinum", 195.084),
+    ("Pu", "Plutonium", 244),
+    ("Ra", "Radium", 226),
+    ("Rb", "Rubidium", 85.4678),
+    ("Re", "Rhenium", 186.207),
+    ("Rh", "Rhodium", 102.9055),
+    ("Rn", "Radon", 222),
+    ("Ru", "Ruthenium", 101.07),
+    ("S", "Sulfur", 32.065),
+    ("Sb", "Antimony", 121.76),
+    ("Sc", "Scandium", 44.955912),
+    ("Se", "Selenium", 78.96),
+    ("Si", "Silicon", 28.0855),
+    ("Sm", "Samarium", 150.36),
+    ("Sn", "Tin", 118.71),
+    ("Sr", "Strontium", 87.62),
+    ("Ta", "Tantalum", 180.94788),
+    ("Tb", "Terbium", 158.92535),
+    ("Tc", "Technetium", 98),
+    ("Te", "Tellurium", 127.6),
+    ("Th", "Thorium", 232.03806),
+    ("Ti", "Titanium", 47.867),
+    ("Tl", "Thallium", 204.3833),
+    ("Tm", "Thulium", 168.93421),
+    ("U", "Uranium", 238.02891),
+    ("V", "Vanadium", 50.9415),
+    ("W", "Tungsten", 183.84),
+    ("Xe", "Xenon", 131.293),
+    ("Y", "Yttrium", 88.90585),
+    ("Yb", "Ytterbium", 173.054),
+    ("Zn", "Zinc", 65.38),
+    ("Zr", "Zirconium", 91.224),
+)
+
+# Masses (in u) of the isotopes that isotope labels like ^13C may name.
+# FormulaCache weighs labelled atoms with these instead of the standard
+# atomic mass; a label not listed here is rejected.
+ISOTOPE_MASSES = {
+    (1, "H"): 1.00782503, (2, "H"): 2.01410178, (3, "H"): 3.01604928,
+    (12, "C"): 12.0, (13, "C"): 13.00335484, (14, "C"): 14.00324199,
+    (14, "N"): 14.00307401, (15, "N"): 15.00010890,
+    (16, "O"): 15.99491462, (17, "O"): 16.99913176, (18, "O"): 17.99915961,
+    (19, "F"): 18.99840316, (31, "P"): 30.97376200, (32, "P"): 31.97390764,
+    (32, "S"): 31.97207117, (34, "S"): 33.96786701, (35, "S"): 34.96903232,
+    (35, "Cl"): 34.96885268, (37, "Cl"): 36.96590260,
+    (79, "Br"): 78.91833760, (81, "Br"): 80.91628970,
+    (125, "I"): 124.90462940, (127, "I"): 126.90447300, (131, "I"): 130.90612630,
+    (235, "U"): 235.04392820, (238, "U"): 238.05078840,
+}
+
+
+class PeriodicTable(Mapping):
+    """An immutable table of elements.
+
+    Parameters
+        elements is a sequence of (symbol, name, atomic mass) tuples
+        properties optionally maps a property name to one value per
+            element, in the same order (for example atomic numbers)
+    """
+
+    __slots__ = ("symbols", "names", "masses", "index", "properties", "_entries")
+
+    def __init__(self, elements, properties=None):
+        symbols = tuple(sys.intern(symbol) for symbol, _, _ in elements)
+        index = {symbol: position for position, symbol in enumerate(symbols)}
+        if len(index) != len(symbols):
+            raise ValueError("duplicate element symbol")
+        masses = np.array([mass for _, _, mass in elements], dtype=np.float64)
+        masses.flags.writeable = False
+        frozen = {}
+        for name, values in (properties or {}).items():
+            values = np.array(values)
+            if values.shape != (len(symbols),):
+                raise ValueError(f"property {name} needs one value per element")
+            values.flags.writeable = False
+            frozen[name] = values
+        set_attribute = object.__setattr__
+        set_attribute(self, "symbols", symbols)
+        set_attribute(self, "names", tuple(name for _, name, _ in elements))
+        set_attribute(self, "masses", masses)
+        set_attribute(self, "index", MappingProxyType(index))
+        set_attribute(self, "properties", MappingProxyType(frozen))
+        set_attribute(self, "_entries", tuple((name, mass) for _, name, mass in elements))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PeriodicTable is immutable")
+
+    def __reduce__(self):
+        elements = [(symbol, name, mass) for symbol, (name, mass)
+            in zip(self.symbols, self._entries)]
+        return PeriodicTable, (elements, dict(self.properties))
+
+    def __getitem__(self, symbol):
+        """Return (name, atomic mass) of the element with this symbol."""
+        return self._entries[self.index[symbol]]
+
+    def __contains__(self, symbol):
+        return symbol in self.index
+
+    def __iter__(self):
+        return iter(self.symbols)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def mass(self, symbol):
+        return self._entries[self.index[symbol]][1]
+
+    def with_properties(self, **properties):
+        """Return a new table with extra per-element properties."""
+        cls, (elements, current) = self.__reduce__()
+        return cls(elements, {**current, **properties})
+
+    def as_dict(self):
+        """Return a new dictionary in the make_periodic_table format:
+        symbol -> [name, atomic mass]."""
+        return {symbol: [name, mass] for symbol, (name, mass)
+            in zip(self.symbols, self._entries)}
+
+
+PERIODIC_TABLE = PeriodicTable(ELEMENTS)
@@ -0,0 +1,66 @@
+from chemistry import make_periodic_table, compute_molar_mass
+from formula import parse_formula, FormulaCache, FormulaError
+from batch_molar_mass import element_count_matrix, molar_masses, compute_moles
+from pytest import approx
+import numpy as np
+import pytest
+
+FORMULAS = ["H2O", "C6H6", "(C2(NaCl)4H2)2C4Na", "Co", "H2O", "PO4H2(CH2)12CH3", "H2O"]
+
+
+def test_element_count_matrix():
+    """Verify that each row of the matrix holds its formula's atom counts."""
+    cache = FormulaCache(make_periodic_table())
+    matrix = element_count_matrix(FORMULAS, cache)
+    assert matrix.shape == (len(FORMULAS), len(cache.symbols))
+    for row, formula in enumerate(FORMULAS):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        counts = [(cache.symbols[index], int(quantity)) for index, quantity
+                in zip(matrix.indices[start:end], matrix.quantities[start:end])]
+        assert counts == parse_formula(formula, cache.periodic_table_dict)
+
+
+def test_molar_masses():
+    """Verify that the batch molar masses match compute_molar_mass."""
+    periodic_table_dict = make_periodic_table()
+    masses = molar_masses(FORMULAS)
+    assert isinstance(masses, np.ndarray) and masses.shape == (len(FORMULAS),)
+    for formula, mass in zip(FORMULAS, masses):
+        expected = compute_molar_mass(parse_formula(formula, periodic_table_dict),
+                periodic_table_dict)
+        assert mass == approx(expected)
+    assert molar_masses([]).shape == (0,)
+
+
+def test_compute_moles():
+    """Verify that moles are the grams divided by the molar mass."""
+    masses, moles = compute_moles(["H2O", "C6H6"], [18.01528, 156.22368])
+    assert moles == approx([1, 2])
+    with pytest.raises(ValueError):
+        compute_moles(["H2O"], [1, 2])
+
+
+def test_invalid_formulas():
+    """Verify that invalid formulas raise, or become NaN when asked to."""
+    with pytest.raises(FormulaError):
+        molar_masses(["H2O", "H2L4"])
+    masses, moles = compute_moles(["H2O", "H2L4", "(H2O"], [18.01528, 1, 1], errors="nan")
+    assert masses[0] == approx(18.01528)
+    assert np.isnan(masses[1:]).all() and np.isnan(moles[1:]).all()
+    matrix = element_count_matrix(["H2L4", "O2"], errors="nan")
+    assert list(matrix.indptr) == [0, 0, 1]
+    with pytest.raises(ValueError):
+        molar_masses(["H2O"], errors="ignore")
+
+
+def test_isotope_labels():
+    """Verify that labelled compounds get their isotope-weighted mass."""
+    cache = FormulaCache(make_periodic_table())
+    formulas = ["^13CH4", "CH4", "(^2H)2O", "^13CH4"]
+    masses = molar_masses(formulas, cache)
+    assert list(masses) == [cache.compile(formula).molar_mass for formula in formulas]
+    assert masses[0] > masses[1]
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "--tb=line", "-rN", __file__])
@@ -0,0 +1,121 @@
+from convert_samples import main, convert_chunk, chunked
+from pytest import approx
+import csv
+import json
+import pytest
+
+RECORDS = [("H2O", "18.01528"), ("NaCl", "58.44"), ("H2L4", "3"), ("C6H6", "abc"),
+           ("", "5"), ("(H2O", "1"), ("C6H6", "156.22368"), ("H2O", "inf"), ("H2O", "nan")]
+
+
+def write_csv(path, records):
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["sample", "formula", "grams"])
+        for number, (formula, grams) in enumerate(records):
+            writer.writerow([f"S{number}", formula, grams])
+
+
+def read_csv(path):
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        return list(csv.DictReader(file))
+
+
+def test_convert_chunk():
+    """Verify that each record gets its molar mass and moles, or an error."""
+    rows = convert_chunk(10, RECORDS)
+    assert [row[0] for row in rows] == list(range(10, 10 + len(RECORDS)))
+    assert rows[0][3:] == (approx(18.01528), approx(1), None)
+    assert rows[6][4] == approx(2)
+    assert "unknown element symbol: L" in rows[2][5]
+    assert rows[3][5] == "invalid mass: 'abc'"
+    assert rows[4][5] == "missing formula"
+    assert "unmatched open parenthesis" in rows[5][5]
+    assert rows[7][5] == "invalid mass: 'inf'" and rows[8][5] == "invalid mass: 'nan'"
+    assert all(row[3] is None and row[4] is None for row in rows[2:6] + rows[7:])
+
+
+def test_chunked():
+    """Verify that chunks are numbered by their first record."""
+    chunks = list(chunked(iter(range(7)), 3))
+    assert [(first, len(chunk)) for first, chunk in chunks] == [(1, 3), (4, 3), (7, 1)]
+
+
+def test_convert_csv_file(tmp_path, capsys):
+    """Verify that a CSV file is converted row by row, errors included."""
+    write_csv(tmp_path / "in.csv", RECORDS)
+    assert main([str(tmp_path / "in.csv"), str(tmp_path / "out.csv"), "--chunk-size", "2"]) == 0
+    rows = read_csv(tmp_path / "out.csv")
+    assert [row["record"] for row in rows] == [str(n) for n in range(1, len(RECORDS) + 1)]
+    assert float(rows[1]["moles"]) == approx(58.44 / 58.44276928)
+    assert [bool(row["error"]) for row in rows] == [False, False, True, True, True, True, False,
+                                                    True, True]
+    assert "9 records, 6 with errors" in capsys.readouterr().err
+
+
+def test_convert_jsonl_file(tmp_path):
+    """Verify JSON Lines input and output, other field names and normalizing."""
+    with open(tmp_path / "in.jsonl", "w", encoding="utf-8") as file:
+        file.write(json.dumps({"compound": "nacl", "mass": 58.44276928}) + "\n")
+        file.write("not json\n\n")
+        file.write(json.dumps({"compound": "h2so4", "mass": 9.807848}) + "\n")
+    main([str(tmp_path / "in.jsonl"), str(tmp_path / "out.jsonl"), "--normalize",
+          "--formula-field", "compound", "--grams-field", "mass"])
+    with open(tmp_path / "out.jsonl", "r", encoding="utf-8") as file:
+        rows = [json.loads(line) for line in file]
+    assert [row["formula"] for row in rows] == ["NaCl", "", "H2SO4"]
+    assert rows[0]["moles"] == approx(1) and rows[2]["moles"] == approx(0.1)
+    assert rows[1]["error"] == "missing formula"
+
+
+def test_missing_column(tmp_path, capsys):
+    """Verify that a CSV without the formula or grams column is rejected."""
+    write_csv(tmp_path / "in.csv", RECORDS)
+    with pytest.raises(SystemExit):
+        main([str(tmp_path / "in.csv"), str(tmp_path / "out.csv"), "--grams-field", "mass"])
+    assert "no 'mass' column" in capsys.readouterr().err
+    assert not (tmp_path / "out.csv").exists()
+
+
+def test_non_finite_mass_in_jsonl(tmp_path):
+    """Verify that an infinite mass is an error, not an Infinity in the JSON."""
+    with open(tmp_path / "in.jsonl", "w", encoding="utf-8") as file:
+        file.write(json.dumps({"formula": "H2O", "grams": "1e999"}) + "\n")
+        file.write('{"formula": "H2O", "grams": Infinity}\n')
+    main([str(tmp_path / "in.jsonl"), str(tmp_path / "out.jsonl")])
+    with open(tmp_path / "out.jsonl", "r", encoding="utf-8") as file:
+        text = file.read()
+    assert "Infinity" not in text
+    rows = [json.loads(line) for line in text.splitlines()]
+    assert rows[0]["error"] == "invalid mass: '1e999'"
+    assert rows[1]["error"] == "invalid mass: inf" and rows[1]["grams"] == "inf"
+
+
+def test_normalize_keeps_correct_formulas(tmp_path):
+    """Verify that --normalize only changes formulas that do not parse as written."""
+    records = [("CuSO4", "159.6086"), ("Co", "58.933194"), ("nacl", "58.44276928"),
+               ("co", "28.0101")]
+    write_csv(tmp_path / "in.csv", records)
+    main([str(tmp_path / "in.csv"), str(tmp_path / "out.csv"), "--normalize"])
+    rows = read_csv(tmp_path / "out.csv")
+    assert [row["formula"] for row in rows] == ["CuSO4", "Co", "NaCl", "CO"]
+    assert all(float(row["moles"]) == approx(1, rel=1e-4) for row in rows)
+
+
+def test_convert_with_workers(tmp_path):
+    """Verify that several processes give the same output, in order."""
+    write_csv(tmp_path / "in.csv", RECORDS * 50)
+    main([str(tmp_path / "in.csv"), str(tmp_path / "one.csv"), "--chunk-size", "16"])
+    main([str(tmp_path / "in.csv"), str(tmp_path / "two.csv"), "--chunk-size", "16",
+          "--workers", "2"])
+    assert read_csv(tmp_path / "one.csv") == read_csv(tmp_path / "two.csv")
+
+
+def test_unknown_format(tmp_path):
+    """Verify that a file the format cannot be told of is rejected."""
+    with pytest.raises(SystemExit):
+        main([str(tmp_path / "in.txt"), str(tmp_path / "out.csv")])
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "--tb=line", "-rN", __file__])
@@ -0,0 +1,135 @@
+from chemistry import make_periodic_table, compute_molar_mass
+from formula import parse_formula, FormulaCache, FormulaError
+from formula import parse_formula_details, parse_formula_recursive
+from pytest import approx
+import random
+import pytest
+
+
+def test_compiled_formula_matches_parse_formula():
+    """Verify that a compiled formula has the same symbols, quantities
+    and molar mass as parse_formula and compute_molar_mass.
+    """
+    periodic_table_dict = make_periodic_table()
+    cache = FormulaCache(periodic_table_dict)
+    for formula in ["H2O", "C6H6", "(C2(NaCl)4H2)2C4Na", "Co", "PO4H2(CH2)12CH3"]:
+        expected = parse_formula(formula, periodic_table_dict)
+        compiled = cache.compile(formula)
+        assert cache.parse(formula) == expected
+        assert [cache.symbols[index] for index in compiled.indexes] \
+                == [symbol for symbol, _ in expected]
+        assert compiled.molar_mass \
+                == compute_molar_mass(expected, periodic_table_dict)
+    assert cache.compile("C13H16N2O2").molar_mass == approx(232.27834)
+
+
+def test_formula_cache_hits():
+    """Verify that each distinct formula is parsed only once."""
+    cache = FormulaCache(make_periodic_table())
+    for _ in range(100):
+        cache.compile("H2O")
+        cache.compile("NaCl")
+    info = cache.cache_info()
+    assert info.misses == 2 and info.hits == 198
+    cache.clear()
+    assert cache.cache_info().currsize == 0
+
+
+def test_formula_cache_errors():
+    """Verify that invalid formulas raise FormulaError every time."""
+    cache = FormulaCache(make_periodic_table())
+    for formula in ["L", "4H", "H2L4", "-H", "(H2O", "H2)O3"]:
+        for _ in range(2):
+            with pytest.raises(FormulaError):
+                cache.compile(formula)
+    assert cache.cache_info().currsize == 0
+
+
+def test_extended_grammar():
+    """Verify square brackets, hydrate dots, charges and isotope labels."""
+    periodic_table_dict = make_periodic_table()
+    hydrate = [("Cu",1), ("S",1), ("O",9), ("H",10)]
+    assert parse_formula("CuSO4·5H2O", periodic_table_dict) == hydrate
+    assert parse_formula("CuSO4.5H2O", periodic_table_dict) == hydrate
+    assert parse_formula("CaSO4·2H2O", periodic_table_dict) \
+            == [("Ca",1), ("S",1), ("O",6), ("H",4)]
+    assert parse_formula_details("[Fe(CN)6]4-", periodic_table_dict) \
+            == ([("Fe",1), ("C",6), ("N",6)], -4, {})
+    assert parse_formula_details("[Co(NH3)6]Cl3", periodic_table_dict).elements \
+            == [("Co",1), ("N",6), ("H",18), ("Cl",3)]
+    assert parse_formula_details("NH4^+", periodic_table_dict) \
+            == ([("N",1), ("H",4)], 1, {})
+    assert parse_formula_details("SO4^2-", periodic_table_dict).charge == -2
+    assert parse_formula_details("Fe^3+", periodic_table_dict).charge == 3
+    assert parse_formula_details("Fe++", periodic_table_dict).charge == 2
+    assert parse_formula_details("Ca(OH)2^-", periodic_table_dict) \
+            == ([("Ca",1), ("O",2), ("H",2)], -1, {})
+    assert parse_formula_details("(SO4)^2-", periodic_table_dict) \
+            == ([("S",1), ("O",4)], -2, {})
+    assert parse_formula_details("^13CH4", periodic_table_dict) \
+            == ([("C",1), ("H",4)], 0, {(13, "C"): 1})
+    assert parse_formula_details("(^2H)2O·H2O", periodic_table_dict) \
+            == ([("H",4), ("O",2)], 0, {(2, "H"): 2})
+    assert FormulaCache(periodic_table_dict).compile("CuSO4·5H2O").molar_mass \
+            == approx(249.685)
+
+
+def test_extended_grammar_errors():
+    """Verify that malformed brackets, dots, charges and labels raise."""
+    periodic_table_dict = make_periodic_table()
+    for formula in ["[H2O)", "(H2O]", "[H2O", "CuSO4·", "(H2O·H2O)", "H+-",
+            "H-2", "-H", "^13", "^13+H", "H2O·05H2O", "2H2O", "H2 O", "h2o",
+            # A count right before a trailing sign is ambiguous.
+            "Fe3+", "SO42-", "NH4+", "[Fe(CN)6]2--", "Ca(OH)2-", "(SO4)2-",
+            # Nothing but a charge, or an empty part.
+            "", "-", "+", "^2-", "()", "·H2O"]:
+        with pytest.raises(FormulaError):
+            parse_formula(formula, periodic_table_dict)
+
+
+def test_isotope_masses():
+    """Verify that labelled atoms are weighed with their isotope mass,
+    and that parse_formula counts them as their element.
+    """
+    periodic_table_dict = make_periodic_table()
+    cache = FormulaCache(periodic_table_dict)
+    methane = cache.compile("CH4").molar_mass
+    labelled = cache.compile("^13CH4")
+    assert labelled.isotopes == (((13, "C"), 1),)
+    assert labelled.molar_mass == approx(methane - 12.0107 + 13.00335484)
+    assert cache.compile("(^2H)2O").molar_mass == approx(20.0276, abs=1e-4)
+    assert cache.compile("H2O").isotopes == ()
+    for formula in ["^99C", "^13Na"]:
+        with pytest.raises(FormulaError):
+            cache.compile(formula)
+    assert parse_formula("^13CH4", periodic_table_dict) == [("C",1), ("H",4)]
+    assert parse_formula("^13C", periodic_table_dict) == [("C",1)]
+    assert parse_formula("(^2H)2O", periodic_table_dict) == [("H",2), ("O",1)]
+
+
+def test_matches_recursive_parser():
+    """Verify that on the original grammar the tokenizer gives the same
+    result as the recursive parser, and fails where it fails.
+    """
+    periodic_table_dict = make_periodic_table()
+    pieces = ["H", "O", "C", "Na", "Cl", "Co", "N", "Fe", "(", ")", "2", "3",
+            "12", "0", "L", "x", " ", "o"]
+    rng = random.Random(3)
+    for _ in range(5000):
+        formula = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 8)))
+        try:
+            expected = parse_formula_recursive(formula, periodic_table_dict)
+        except FormulaError:
+            expected = FormulaError
+        if expected == []:
+            # The recursive parser accepted formulas without elements.
+            expected = FormulaError
+        try:
+            actual = parse_formula(formula, periodic_table_dict)
+        except FormulaError:
+            actual = FormulaError
+        assert actual == expected, formula
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "--tb=line", "-rN", __file__])
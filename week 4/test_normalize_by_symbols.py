@@ -0,0 +1,84 @@
+from chemistry import make_periodic_table, normalize_by_symbols
+from chemistry import symbol_parses, ambiguous_parses, formula_readings
+from formula import FormulaCache
+import itertools
+import time
+import pytest
+
+# Generous enough for a slow machine; the old backtracking search did not
+# finish these inputs at all.
+TIME_LIMIT = 1.0
+
+
+def test_normalize_by_symbols():
+    """Verify that lowercase formulas get their element symbols back."""
+    periodic_table_dict = make_periodic_table()
+    assert normalize_by_symbols("nacl", periodic_table_dict) == "NaCl"
+    assert normalize_by_symbols(" h2so4 ", periodic_table_dict) == "H2SO4"
+    assert normalize_by_symbols("ca(oh)2", periodic_table_dict) == "Ca(OH)2"
+    assert normalize_by_symbols("co", periodic_table_dict) == "CO"
+    # Formulas that cannot be read are returned unchanged.
+    assert normalize_by_symbols("xq2", periodic_table_dict) == "xq2"
+    assert normalize_by_symbols("", periodic_table_dict) == ""
+
+
+def test_ambiguous_parses():
+    """Verify that every reading of an ambiguous formula is returned."""
+    periodic_table_dict = make_periodic_table()
+    assert ambiguous_parses("co", periodic_table_dict) == ["CO", "Co"]
+    assert ambiguous_parses("nacl", periodic_table_dict) == ["NaCl"]
+    assert ambiguous_parses("xq", periodic_table_dict) == []
+    assert sorted(ambiguous_parses("coco", periodic_table_dict)) \
+            == ["COCO", "COCo", "CoCO", "CoCo"]
+    assert len(ambiguous_parses("co" * 20, periodic_table_dict, limit=5)) == 5
+
+
+def test_hydrate_dots():
+    """Verify that every hydrate dot the parser accepts is kept."""
+    periodic_table_dict = make_periodic_table()
+    for dot in "·•*.":
+        assert normalize_by_symbols(f"nacl{dot}2h2o", periodic_table_dict) \
+                == f"NaCl{dot}2H2O"
+
+
+def test_formula_readings():
+    """Verify that only formulas that do not parse as typed get readings."""
+    formula_cache = FormulaCache(make_periodic_table())
+    assert formula_readings("Co", formula_cache) == ["Co"]
+    assert formula_readings(" CO ", formula_cache) == ["CO"]
+    assert formula_readings("co", formula_cache) == ["CO", "Co"]
+    assert formula_readings("nacl", formula_cache) == ["NaCl"]
+    assert formula_readings("xq", formula_cache) == ["xq"]
+
+
+def check_fast(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    assert elapsed < TIME_LIMIT, f"took {elapsed:.3f} s"
+    return result
+
+
+def test_worst_case_inputs():
+    """Verify that 10,000 character inputs with an exponential number of
+    readings, or none at all, are handled in linear time.
+    """
+    periodic_table_dict = make_periodic_table()
+    long_ambiguous = "co" * 5000
+    assert check_fast(normalize_by_symbols, long_ambiguous, periodic_table_dict) \
+            == "CO" * 5000
+    # Only the last letter makes the input unreadable; backtracking would
+    # try every split of the 9,999 letters before it.
+    unreadable = "co" * 4999 + "cq"
+    assert check_fast(normalize_by_symbols, unreadable, periodic_table_dict) \
+            == unreadable
+    mixed = "(snco)2" * 1428 + "h"
+    assert len(check_fast(normalize_by_symbols, mixed, periodic_table_dict)) \
+            == len(mixed)
+    parses = check_fast(lambda: list(itertools.islice(
+            symbol_parses(long_ambiguous, periodic_table_dict), 100)))
+    assert len(set(parses)) == 100
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "--tb=line", "-rN", __file__])
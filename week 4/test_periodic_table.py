@@ -0,0 +1,74 @@
+from chemistry import make_periodic_table, compute_molar_mass
+from formula import parse_formula, FormulaCache
+from periodic_table import PERIODIC_TABLE, PeriodicTable
+from pytest import approx
+import pickle
+import pytest
+
+
+def test_periodic_table_matches_dict():
+    """Verify that PERIODIC_TABLE holds the same elements as
+    make_periodic_table, and that its arrays line up.
+    """
+    periodic_table_dict = make_periodic_table()
+    assert len(PERIODIC_TABLE) == len(periodic_table_dict) == 94
+    for symbol, (name, mass) in periodic_table_dict.items():
+        assert PERIODIC_TABLE[symbol] == (name, mass)
+        position = PERIODIC_TABLE.index[symbol]
+        assert PERIODIC_TABLE.symbols[position] == symbol
+        assert PERIODIC_TABLE.names[position] == name
+        assert PERIODIC_TABLE.masses[position] == approx(mass)
+    assert "Co" in PERIODIC_TABLE and "Xx" not in PERIODIC_TABLE
+    assert PERIODIC_TABLE.mass("O") == approx(15.9994)
+
+
+def test_make_periodic_table_returns_new_dict():
+    """Verify that changing one dictionary view does not change the table."""
+    periodic_table_dict = make_periodic_table()
+    periodic_table_dict["H"][1] = 2
+    del periodic_table_dict["O"]
+    assert make_periodic_table()["H"] == ["Hydrogen", 1.00794]
+    assert "O" in PERIODIC_TABLE
+
+
+def test_periodic_table_is_immutable():
+    """Verify that the shared table cannot be changed."""
+    with pytest.raises(AttributeError):
+        PERIODIC_TABLE.symbols = ()
+    with pytest.raises(TypeError):
+        PERIODIC_TABLE["H"] = ("Hydrogen", 2)
+    with pytest.raises(TypeError):
+        PERIODIC_TABLE.index["H"] = 3
+    with pytest.raises(ValueError):
+        PERIODIC_TABLE.masses[0] = 1
+
+
+def test_periodic_table_properties():
+    """Verify that extra properties are stored per element in symbol order."""
+    numbers = {"H": 1, "He": 2, "O": 8}
+    table = PeriodicTable([("H", "Hydrogen", 1.00794), ("He", "Helium", 4.002602),
+            ("O", "Oxygen", 15.9994)], {"atomic_number": list(numbers.values())})
+    assert list(table.properties["atomic_number"]) == [1, 2, 8]
+    bigger = table.with_properties(group=[1, 18, 16])
+    assert set(bigger.properties) == {"atomic_number", "group"}
+    assert not table.properties.get("group")
+    with pytest.raises(ValueError):
+        table.with_properties(period=[1, 1])
+    with pytest.raises(ValueError):
+        PeriodicTable([("H", "Hydrogen", 1), ("H", "Hydrogen", 1)])
+    copy = pickle.loads(pickle.dumps(bigger))
+    assert copy.as_dict() == bigger.as_dict()
+    assert list(copy.properties["group"]) == [1, 18, 16]
+
+
+def test_parse_with_periodic_table():
+    """Verify that the parser and molar mass work on the shared table."""
+    assert parse_formula("(C2(NaCl)4H2)2C4Na", PERIODIC_TABLE) \
+            == [("C",8), ("Na",9), ("Cl",8), ("H",4)]
+    assert compute_molar_mass([["C",6],["H",6]], PERIODIC_TABLE) == approx(78.11184)
+    assert FormulaCache(PERIODIC_TABLE).compile("C13H16N2O2").molar_mass \
+            == approx(232.27834)
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", "--tb=line", "-rN", __file__])
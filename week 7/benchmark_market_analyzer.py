@@ -0,0 +1,202 @@
+"""Timing benchmarks for the market analyzer data path.
+
+Run with: python benchmark_market_analyzer.py [benchmark] [rows ...]
+where benchmark is one of the names in BENCHMARKS (default: all of them).
+The synthetic data is built by repeating the rows of the real FAO file,
+so it keeps its schema (and the CSV keeps its HXL tag row) at any size.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from market_data import read_market_data, read_market_files, CommodityIndex
+from market_data import stream_market_statistics, statistics_table, calculate_statistics
+from market_analytics import compute_analytics
+
+CSV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "producer-prices-nga.csv")
+
+
+def make_synthetic_csv(path, rows, source=CSV_FILE):
+    """Write a CSV with the FAO schema and the given number of data rows.
+    As in make_synthetic_frame, every repetition of the source rows gets
+    its own country code."""
+    with open(source, "r", encoding="utf-8") as file:
+        header = file.readline()
+        tag_row = file.readline()
+        # Drop the source's Iso3 value; each copy gets its own below.
+        body = [line.split(",", 1)[1] for line in file]
+    with open(path, "w", encoding="utf-8") as out:
+        out.write(header)
+        out.write(tag_row)
+        remaining = rows
+        copy = 0
+        while remaining > 0:
+            prefix = f"C{copy:04d},"
+            out.writelines(prefix + line for line in body[:remaining])
+            remaining -= min(remaining, len(body))
+            copy += 1
+    return path
+
+
+def make_synthetic_frame(rows, source=CSV_FILE):
+    """Return a frame with the FAO schema and the given number of rows.
+    Every repetition of the source rows is labelled as a different country,
+    so larger frames have more groups, the way global data does."""
+    data = read_market_data(source, use_cache=False)
+    frame = data.take(np.resize(np.arange(len(data)), rows)).reset_index(drop=True)
+    copies = np.arange(rows) // len(data)
+    names = [f"C{number:04d}" for number in range(copies.max() + 1)]
+    frame['Iso3'] = pd.Categorical.from_codes(copies, names)
+    frame['Area'] = frame['Iso3']
+    return frame
+
+
+def best_of(func, repeat=3):
+    """Return the fastest wall time of func() over repeat runs, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_cache(sizes):
+    print(f"{'rows':>10} {'cold csv (s)':>14} {'warm cache (s)':>15} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            path = make_synthetic_csv(os.path.join(tmp, f"prices-{rows}.csv"), rows)
+            cache_dir = os.path.join(tmp, "cache")
+            cold = best_of(lambda: read_market_data(path, use_cache=False))
+            read_market_data(path, cache_dir=cache_dir)
+            warm = best_of(lambda: read_market_data(path, cache_dir=cache_dir))
+            print(f"{rows:>10} {cold:>14.4f} {warm:>15.4f} {cold / warm:>7.1f}x")
+
+
+def bench_filter(sizes):
+    print(f"{'rows':>10} {'build index (s)':>16} {'mask filter (ms)':>17} {'index lookup (ms)':>18}")
+    for rows in sizes:
+        data = make_synthetic_frame(rows)
+        country, commodity = data['Iso3'].iloc[-1], data['commodity'].iloc[-1]
+        start = time.perf_counter()
+        index = CommodityIndex(data)
+        build = time.perf_counter() - start
+        mask = best_of(lambda: data[(data['Iso3'] == country) & (data['commodity'] == commodity)])
+        lookup = best_of(lambda: index.select(commodity, country))
+        print(f"{rows:>10} {build:>16.4f} {mask * 1000:>17.3f} {lookup * 1000:>18.3f}")
+
+
+def bench_memory(sizes):
+    print(f"{'rows':>10} {'inferred (MB)':>14} {'schema (MB)':>12} {'saved':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            path = make_synthetic_csv(os.path.join(tmp, f"prices-{rows}.csv"), rows)
+            before = pd.read_csv(path, skiprows=[1]).memory_usage(deep=True).sum()
+            after = read_market_data(path, use_cache=False).memory_usage(deep=True).sum()
+            print(f"{rows:>10} {before / 2**20:>14.2f} {after / 2**20:>12.2f} {1 - after / before:>7.1%}")
+
+
+def bench_files(counts):
+    print(f"{'files':>10} {'serial (s)':>11} {'pool (s)':>9} {'speedup':>8}   ({os.cpu_count()} cores)")
+    for count in counts:
+        timings = []
+        for workers in (1, None):
+            # A fresh directory per run so every file is a cold (uncached) parse.
+            with tempfile.TemporaryDirectory() as tmp:
+                for number in range(count):
+                    shutil.copy(CSV_FILE, os.path.join(tmp, f"producer-prices-{number:03d}.csv"))
+                start = time.perf_counter()
+                read_market_files(tmp, workers=workers)
+                timings.append(time.perf_counter() - start)
+        serial, pooled = timings
+        print(f"{count:>10} {serial:>11.3f} {pooled:>9.3f} {serial / pooled:>7.1f}x")
+
+
+def peak_memory(func):
+    """Return (seconds, peak bytes traced by tracemalloc) for one call of func()."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        func()
+        return time.perf_counter() - start, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_stream(sizes):
+    print(f"{'rows':>10} {'full load (s)':>14} {'peak (MB)':>10} {'streamed (s)':>13} {'peak (MB)':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            path = make_synthetic_csv(os.path.join(tmp, f"prices-{rows}.csv"), rows)
+            full, full_peak = peak_memory(lambda: read_market_data(path, use_cache=False))
+            streamed, stream_peak = peak_memory(lambda: stream_market_statistics(path))
+            print(f"{rows:>10} {full:>14.3f} {full_peak / 2**20:>10.1f} "
+                  f"{streamed:>13.3f} {stream_peak / 2**20:>10.1f}")
+
+
+def bench_statistics(sizes):
+    print(f"{'rows':>10} {'groups':>7} {'per-group loop (s)':>19} {'grouped pass (s)':>17} {'speedup':>8}")
+    for rows in sizes:
+        data = make_synthetic_frame(rows)
+        index = CommodityIndex(data)
+
+        def loop():
+            for (country, commodity) in index.slices:
+                rows = index.select(commodity, country)
+                for element in rows['Element'].unique():
+                    calculate_statistics(rows[rows['Element'] == element])
+
+        looped = best_of(loop, repeat=1)
+        grouped = best_of(lambda: statistics_table(data), repeat=1)
+        groups = len(statistics_table(data))
+        print(f"{rows:>10} {groups:>7} {looped:>19.3f} {grouped:>17.3f} {looped / grouped:>7.1f}x")
+
+
+def bench_analytics(sizes):
+    print(f"{'rows':>10} {'series':>7} {'compute_analytics (s)':>22}")
+    for rows in sizes:
+        data = CommodityIndex(make_synthetic_frame(rows)).data
+        seconds = best_of(lambda: compute_analytics(data), repeat=1)
+        series = len(statistics_table(data))
+        print(f"{rows:>10} {series:>7} {seconds:>22.3f}")
+
+
+# name -> (description, function, default sizes)
+BENCHMARKS = {
+    "cache": ("read_market_data: CSV parse vs columnar cache",
+              bench_cache, [10_000, 100_000, 1_000_000, 3_000_000]),
+    "filter": ("commodity selection: boolean mask vs CommodityIndex",
+               bench_filter, [10_000, 1_000_000, 10_000_000]),
+    "files": ("multi-country load: serial vs process pool (sizes are file counts)",
+              bench_files, [8, 50, 200]),
+    "stream": ("statistics: full load vs chunked streaming (peak traced memory)",
+               bench_stream, [100_000, 1_000_000, 3_000_000]),
+    "statistics": ("statistics for every group: calculate_statistics loop vs statistics_table",
+                   bench_statistics, [10_000, 300_000]),
+    "analytics": ("YoY, rolling and real-price analytics for every series",
+                  bench_analytics, [10_000, 1_000_000]),
+    "memory": ("frame memory: inferred dtypes vs loading schema",
+               bench_memory, [8_931, 1_000_000]),
+}
+
+
+def main(argv):
+    names = list(BENCHMARKS)
+    if argv and argv[0] in BENCHMARKS:
+        names = [argv[0]]
+        argv = argv[1:]
+    for name in names:
+        description, bench, default_sizes = BENCHMARKS[name]
+        print(description)
+        bench([int(arg) for arg in argv] or default_sizes)
+        print()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
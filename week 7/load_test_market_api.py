@@ -0,0 +1,108 @@
+"""Load test for market_api.py: p50/p99 latency and throughput.
+
+    python load_test_market_api.py [--clients 20] [--requests 500] [--port PORT]
+
+Without --port an API server is started in-process on a free port. Each
+client keeps one connection open and cycles through a mix of /commodities,
+/series and /stats queries; with --etag the client also sends
+If-None-Match, the way a poller that already has the data would.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from urllib.parse import quote
+
+import numpy as np
+
+from market_api import start_server
+from market_data import get_commodity_index
+
+
+def query_mix(source):
+    """Return a list of request targets covering every endpoint."""
+    index = get_commodity_index(source)
+    country = index.countries[0]
+    targets = ["/countries", f"/commodities?country={country}"]
+    for commodity in index.commodities(country)[:20]:
+        name = quote(commodity)
+        targets.append(f"/stats?country={country}&commodity={name}")
+        for element, period in index.series_keys(commodity, country)[:2]:
+            targets.append(f"/series?country={country}&commodity={name}"
+                           f"&element={quote(element)}&period={period}")
+    return targets
+
+
+async def read_response(reader):
+    status = int((await reader.readline()).split()[1])
+    length, etag = 0, None
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+        elif name.lower() == "etag":
+            etag = value.strip()
+    await reader.readexactly(length)
+    return status, etag
+
+
+async def client(host, port, targets, count, offset, use_etag, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    etags = {}
+    try:
+        for number in range(count):
+            target = targets[(offset + number) % len(targets)]
+            extra = f"If-None-Match: {etags[target]}\r\n" if use_etag and target in etags else ""
+            start = time.perf_counter()
+            writer.write(f"GET {target} HTTP/1.1\r\nHost: {host}\r\n{extra}\r\n".encode("latin-1"))
+            await writer.drain()
+            status, etag = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status == 200 and etag:
+                etags[target] = etag
+    finally:
+        writer.close()
+
+
+async def run(args):
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    server = None
+    port = args.port
+    if port is None:
+        server = await start_server(args.data or script_dir, args.host, 0)
+        port = server.sockets[0].getsockname()[1]
+    targets = query_mix(args.data or script_dir)
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(args.host, port, targets, args.requests, offset * 7,
+                                  args.etag, latencies)
+                           for offset in range(args.clients)))
+    elapsed = time.perf_counter() - start
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+    milliseconds = np.array(latencies) * 1000
+    print(f"{len(latencies)} requests from {args.clients} clients in {elapsed:.2f} s "
+          f"({len(latencies) / elapsed:.0f} req/s)")
+    print(f"p50 {np.percentile(milliseconds, 50):.3f} ms   p99 {np.percentile(milliseconds, 99):.3f} ms   "
+          f"max {milliseconds.max():.3f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure market_api latency under load.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None, help="test a running server instead of starting one")
+    parser.add_argument("--data", default=None, help="data source for the query mix (and in-process server)")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=500, help="requests per client")
+    parser.add_argument("--etag", action="store_true", help="send If-None-Match on repeated queries")
+    asyncio.run(run(parser.parse_args(argv)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
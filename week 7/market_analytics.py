@@ -0,0 +1,264 @@
+"""Trend analytics for every price series at once.
+
+All functions work on a whole market frame (for example
+CommodityIndex.data) and compute their result for every
+(Iso3, commodity, Element, period) series in one vectorized pass with
+pandas group operations, instead of looping over commodities in Python.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from market_data import (get_commodity_index, market_signature, _cached_index,
+                         signature_cache, source_key, add_period_columns, ANNUAL)
+
+SERIES_KEYS = ['Iso3', 'commodity', 'Element', 'period']
+# The FAO files carry an all-agriculture producer price index, reported as
+# the commodity "Agriculture"; it is the deflator for real prices.
+DEFLATOR_COMMODITY = 'Agriculture'
+INDEX_ELEMENT = 'Producer Price Index (2014-2016 = 100)'
+DEFAULT_WINDOW = 5
+
+
+def _with_periods(data):
+    return data if 'period' in data.columns else add_period_columns(data)
+
+
+def _group_keys(data, keys):
+    return [data[key] for key in keys if key in data.columns]
+
+
+def yoy_change(data):
+    """Return the year-over-year change of every row's price, as a fraction.
+
+    A row is compared with the same series (and, for monthly rows, the same
+    month) exactly one year earlier; where that year is missing the change
+    is NaN rather than a change over a longer gap.
+    """
+    data = _with_periods(data)
+    groups = _group_keys(data, SERIES_KEYS) + [data['month']]
+    frame = pd.DataFrame({'date': data['date'].astype(np.int32),
+                          'price': data['price'].astype(np.float64)})
+    # Sorting by year inside each group makes shift(1) the previous year.
+    order = np.argsort(data['date'].to_numpy(), kind='stable')
+    shifted = frame.iloc[order].groupby([key.iloc[order] for key in groups],
+                                        observed=True, sort=False).shift(1)
+    shifted = shifted.reindex(frame.index)
+    change = frame['price'] / shifted['price'] - 1
+    return change.where(frame['date'] - shifted['date'] == 1)
+
+
+def rolling_statistics(data, window=DEFAULT_WINDOW):
+    """Return a frame with the rolling mean price and the rolling volatility
+    (standard deviation of the year-over-year change) over window rows of
+    each series."""
+    data = _with_periods(data)
+    order = np.lexsort((data['time'].to_numpy(),))
+    sorted_data = data.iloc[order]
+    groups = _group_keys(sorted_data, SERIES_KEYS)
+    prices = sorted_data['price'].astype(np.float64)
+    changes = yoy_change(data).iloc[order]
+    rolling_mean = prices.groupby(groups, observed=True, sort=False) \
+        .rolling(window, min_periods=1).mean()
+    volatility = changes.groupby(groups, observed=True, sort=False) \
+        .rolling(window, min_periods=2).std()
+    result = pd.DataFrame({
+        'rolling_mean': rolling_mean.reset_index(level=list(range(len(groups))), drop=True),
+        'rolling_volatility': volatility.reset_index(level=list(range(len(groups))), drop=True),
+    })
+    return result.reindex(data.index)
+
+
+def real_prices(data, deflator=DEFLATOR_COMMODITY):
+    """Return prices deflated by the country's all-agriculture price index
+    (in 2014-2016 terms). Index rows and rows without a deflator for their
+    year are NaN."""
+    data = _with_periods(data)
+    is_index = data['Element'] == INDEX_ELEMENT
+    deflators = data[is_index & (data['commodity'] == deflator) & (data['period'] == ANNUAL)]
+    deflators = deflators.groupby([deflators['Iso3'], deflators['date']], observed=True)['price'].mean()
+    keys = pd.MultiIndex.from_arrays([data['Iso3'].astype(object), data['date']])
+    factor = deflators.reindex(keys).to_numpy(dtype=np.float64) / 100
+    real = data['price'].to_numpy(dtype=np.float64) / factor
+    return pd.Series(np.where(is_index.to_numpy(), np.nan, real), index=data.index, name='real_price')
+
+
+def cagr(data, start_year, end_year):
+    """Return the compound annual growth rate between two years for every
+    annual series that has a price in both, indexed by the series keys."""
+    if end_year <= start_year:
+        raise ValueError("end_year must be after start_year")
+    data = _with_periods(data)
+    annual = data[(data['period'] == ANNUAL) & data['date'].isin([start_year, end_year])]
+    keys = [key for key in SERIES_KEYS if key in annual.columns]
+    prices = annual.pivot_table(index=keys, columns='date', values='price',
+                                aggfunc='mean', observed=True)
+    if start_year not in prices.columns or end_year not in prices.columns:
+        return pd.Series(dtype=np.float64, name='cagr')
+    ratio = prices[end_year].astype(np.float64) / prices[start_year].astype(np.float64)
+    growth = ratio ** (1 / (end_year - start_year)) - 1
+    return growth.where(ratio > 0).dropna().rename('cagr')
+
+
+def compute_analytics(data, window=DEFAULT_WINDOW):
+    """Return yoy_change, rolling_mean, rolling_volatility and real_price
+    for every row of data, aligned with data's index."""
+    data = _with_periods(data)
+    result = rolling_statistics(data, window)
+    result.insert(0, 'yoy_change', yoy_change(data))
+    result['real_price'] = real_prices(data)
+    return result
+
+
+@signature_cache(maxsize=8)
+def _cached_analytics(signature, window):
+    return compute_analytics(_cached_index(signature).data, window)
+
+
+def get_analytics(source, window=DEFAULT_WINDOW):
+    """Return compute_analytics for the indexed frame of source, aligned
+    with get_commodity_index(source).data. Cached per dataset version."""
+    if get_commodity_index(source) is None:
+        return None
+    return _cached_analytics(market_signature(source), window)
+
+
+def price_matrix(data, country, element, period=ANNUAL):
+    """Return a years x commodities frame of one country's prices for one
+    Element (and period), the layout the correlation engine works on."""
+    data = _with_periods(data)
+    rows = data[(data['Iso3'] == country) & (data['Element'] == element) & (data['period'] == period)]
+    return rows.pivot_table(index='time', columns='commodity', values='price',
+                            aggfunc='mean', observed=True).astype(np.float64)
+
+
+class CorrelationAccumulator:
+    """Pairwise Pearson correlations between commodities, updated year by year.
+
+    For every pair of commodities it keeps the sufficient statistics over the
+    years in which both have a price (count, sums, sums of squares and the
+    cross products) as commodities x commodities matrices. Adding a year is
+    a handful of outer products, O(commodities**2), so appending a new FAO
+    year never requires recomputing the matrix from all previous years. The
+    result matches DataFrame.corr() (pairwise-complete observations).
+    """
+
+    def __init__(self):
+        self.commodities = []
+        self._positions = {}
+        self.years = set()
+        size = (0, 0)
+        self.n = np.zeros(size)
+        self.sum_x = np.zeros(size)
+        self.sum_xx = np.zeros(size)
+        self.sum_xy = np.zeros(size)
+
+    def _grow(self, commodities):
+        new = [name for name in commodities if name not in self._positions]
+        if not new:
+            return
+        for name in new:
+            self._positions[name] = len(self.commodities)
+            self.commodities.append(name)
+        size = len(self.commodities)
+        for name in ('n', 'sum_x', 'sum_xx', 'sum_xy'):
+            old = getattr(self, name)
+            grown = np.zeros((size, size))
+            grown[:old.shape[0], :old.shape[1]] = old
+            setattr(self, name, grown)
+
+    def update(self, matrix):
+        """Add the rows (years) of a years x commodities price frame.
+        Years that were added before are rejected."""
+        repeated = self.years.intersection(matrix.index)
+        if repeated:
+            raise ValueError(f"years already added: {sorted(repeated)}")
+        self._grow(list(matrix.columns))
+        columns = [self._positions[name] for name in matrix.columns]
+        values = matrix.to_numpy(dtype=np.float64)
+        present = ~np.isnan(values)
+        x = np.where(present, values, 0.0)
+        mask = present.astype(np.float64)
+        # Element [i, j] of each product sums over the years in which both
+        # commodity i and commodity j have a price.
+        block = np.ix_(columns, columns)
+        self.n[block] += mask.T @ mask
+        self.sum_x[block] += x.T @ mask
+        self.sum_xx[block] += (x * x).T @ mask
+        self.sum_xy[block] += x.T @ x
+        self.years.update(matrix.index)
+        return self
+
+    def correlation(self, min_periods=3):
+        n = self.n
+        sum_y = self.sum_x.T
+        sum_yy = self.sum_xx.T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            covariance = n * self.sum_xy - self.sum_x * sum_y
+            variance_x = n * self.sum_xx - self.sum_x ** 2
+            variance_y = n * sum_yy - sum_y ** 2
+            result = covariance / np.sqrt(variance_x * variance_y)
+        result[(n < min_periods) | (variance_x <= 0) | (variance_y <= 0)] = np.nan
+        result = np.clip(result, -1, 1)
+        order = np.argsort(self.commodities)
+        names = [self.commodities[position] for position in order]
+        return pd.DataFrame(result[np.ix_(order, order)], index=names, columns=names)
+
+
+# (source_key, country, element, period) -> (accumulator, price matrix it
+# holds), least recently used first. Sessions can run in parallel threads,
+# so every read and update happens under the lock.
+CORRELATION_STATE_SIZE = 64
+_correlation_state = OrderedDict()
+_correlation_lock = threading.Lock()
+
+
+def get_correlation_matrix(source, country, element, period=ANNUAL, min_periods=3):
+    """Return the commodity correlation matrix for one country and Element.
+
+    The accumulator is kept between calls. When the data files change and
+    the new price matrix only adds years (the rows already seen are
+    unchanged), just those years are folded in; any other change rebuilds
+    it from scratch.
+    """
+    index = get_commodity_index(source)
+    if index is None:
+        return None
+    matrix = price_matrix(index.data, country, element, period)
+    key = (source_key(source), country, element, period)
+    with _correlation_lock:
+        state = _correlation_state.get(key)
+        if state is not None:
+            accumulator, seen = state
+            old = matrix[matrix.index.isin(seen.index)]
+            extra = old.columns.difference(seen.columns)
+            appended_only = (seen.index.isin(matrix.index).all()
+                             and old[extra].isna().all().all()
+                             and old.reindex(columns=seen.columns).equals(seen))
+            if appended_only:
+                new_years = matrix[~matrix.index.isin(seen.index)]
+                if len(new_years):
+                    accumulator.update(new_years)
+            else:
+                state = None
+        if state is None:
+            accumulator = CorrelationAccumulator().update(matrix)
+        _correlation_state[key] = (accumulator, matrix)
+        _correlation_state.move_to_end(key)
+        while len(_correlation_state) > CORRELATION_STATE_SIZE:
+            _correlation_state.popitem(last=False)
+        return accumulator.correlation(min_periods)
+
+
+@signature_cache(maxsize=64)
+def _cached_heatmap(signature, source, country, element, period):
+    from price_charts import draw_correlation_heatmap
+    matrix = get_correlation_matrix(source, country, element, period)
+    return draw_correlation_heatmap(matrix, f"Correlation of {element} by commodity")
+
+
+def get_correlation_heatmap(source, country, element, period=ANNUAL):
+    """Return the cached PNG heatmap of get_correlation_matrix."""
+    return _cached_heatmap(market_signature(source), source_key(source), country, element, period)
@@ -1,79 +1,126 @@
-import pandas as pd
-import streamlit as st
-import matplotlib.pyplot as plt
 import sys
 import os
-from streamlit.web import cli as stcli
+# The data core only needs pandas and NumPy; Streamlit and matplotlib are
+# imported inside the functions that draw the dashboard. The names below
+# are re-exported so existing imports from this module keep working.
+from market_data import (
+    DATA_FILE, DATA_PATTERN, ANNUAL, read_market_data, calculate_statistics,
+    cache_path_for, read_market_files, stream_market_statistics,
+    statistics_table, CommodityIndex, get_market_data, get_commodity_index,
+    get_countries, get_commodities, get_commodity_rows, get_statistics,
+    get_price_chart, render_price_trends, clear_caches,
+)
+from market_analytics import get_analytics, get_correlation_heatmap
+from market_metrics import StageTimer, enable_log, stage_totals
 
-DATA_FILE = "producer-prices-nga.csv"
+__all__ = [
+    'DATA_FILE', 'DATA_PATTERN', 'ANNUAL', 'read_market_data', 'calculate_statistics',
+    'cache_path_for', 'read_market_files', 'stream_market_statistics',
+    'statistics_table', 'CommodityIndex', 'get_market_data', 'get_commodity_index',
+    'get_countries', 'get_commodities', 'get_commodity_rows', 'get_statistics',
+    'get_price_chart', 'render_price_trends', 'clear_caches',
+    'plot_price_trends', 'main', 'show_metrics',
+]
 
-def read_market_data(filename):
-    try:
-        df = pd.read_csv(filename, skiprows=[1])
-        df.rename(columns={
-            'Year': 'date',
-            'Item': 'commodity',
-            'Value': 'price',
-            'Unit': 'unit'
-        }, inplace=True)
-        return df
-    except FileNotFoundError:
-        return None
-    except Exception as e:
-        st.error(f"An error occurred while processing the data: {e}")
-        st.stop()
-
-def calculate_statistics(data):
-    if 'price' in data.columns:
-        return data['price'].describe()
-    else:
-        return pd.DataFrame()
-
-def plot_price_trends(data, commodity_name):
-    commodity_data = data[data['commodity'] == commodity_name]
-    unit = commodity_data['unit'].iloc[0] if not commodity_data.empty else "Price"
-
-    fig, ax = plt.subplots()
-    ax.plot(commodity_data['date'], commodity_data['price'], marker='o', linestyle='-')
-    ax.set_title(f"Producer Price Trend for {commodity_name}")
-    ax.set_xlabel("Year")
-    ax.set_ylabel(f"Price ({unit})")
-    st.pyplot(fig)
+def plot_price_trends(series_data, commodity_name):
+    import streamlit as st
+    # series_data holds a single price series (see CommodityIndex.series),
+    # so every point shares one Element and one period.
+    st.image(render_price_trends(series_data, commodity_name))
 
 def main():
-    st.title("Nigerian Producer Price Analyzer")
-    st.write("This dashboard helps you analyze and visualize annual producer prices for various commodities in Nigeria, based on FAO data.")
+    import streamlit as st
+    st.title("Producer Price Analyzer")
 
+    # Every producer-prices-*.csv next to the script is loaded, one per
+    # country, unless MARKET_DATA names other files or a market store.
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    data_path = os.path.join(script_dir, DATA_FILE)
+    source = os.environ.get("MARKET_DATA", script_dir)
+    # Each stage's time and memory is logged and shown in the debug panel.
+    enable_log()
+    timer = StageTimer()
 
-    market_data = read_market_data(data_path)
-    if market_data is None:
-        st.error(f"Error: The file '{DATA_FILE}' was not found. Please ensure it is in the same directory as the script.")
+    try:
+        with timer.stage("load"):
+            index = get_commodity_index(source)
+    except Exception as e:
+        st.error(f"An error occurred while processing the data: {e}")
+        st.stop()
+    if index is None:
+        st.error(f"Error: No '{DATA_PATTERN}' file was found. Please ensure '{DATA_FILE}' is in the same directory as the script.")
     else:
         st.sidebar.header("Filters")
-        commodities = sorted(market_data['commodity'].unique())
+        selected_country = st.sidebar.selectbox(
+            "Select a Country", index.countries,
+            format_func=lambda iso3: index.country_names.get(iso3, iso3))
+        country_name = index.country_names.get(selected_country, selected_country)
+        st.write(f"This dashboard helps you analyze and visualize annual producer prices for various commodities in {country_name}, based on FAO data.")
+
+        with timer.stage("options"):
+            commodities = index.commodities(selected_country)
         selected_commodity = st.sidebar.selectbox("Select a Commodity", commodities)
 
+        with timer.stage("series_options"):
+            series_keys = index.series_keys(selected_commodity, selected_country)
+            elements = list(dict.fromkeys(element for element, _ in series_keys))
+        selected_element = st.sidebar.selectbox("Select a Price Series", elements)
+        periods = [period for element, period in series_keys if element == selected_element]
+        selected_period = st.sidebar.radio("Period", periods, horizontal=True) if len(periods) > 1 else ANNUAL
+
         st.header(f"Analysis for: {selected_commodity}")
 
         col1, col2 = st.columns([2, 1])
 
-        filtered_data = market_data[market_data['commodity'] == selected_commodity]
+        with timer.stage("filter"):
+            series_data = index.series(selected_commodity, selected_country, selected_element, selected_period)
 
-        with col1:
-            plot_price_trends(filtered_data, selected_commodity)
+        with col1, timer.stage("plot"):
+            st.image(get_price_chart(source, selected_commodity, selected_country,
+                                     selected_element, selected_period))
 
-        with col2:
+        with col2, timer.stage("stats"):
             st.subheader("Summary Statistics")
-            st.write(calculate_statistics(filtered_data))
+            st.write(index.series_statistics(selected_commodity, selected_country, selected_element, selected_period))
+
+        # Streamlit runs an expander's body even while it is collapsed, so
+        # the heatmap is only built once the user asks for it.
+        if st.toggle(f"Show correlation between commodities ({selected_element})"):
+            with timer.stage("correlation"):
+                # The matrix is kept between reruns and only updated with new years.
+                st.image(get_correlation_heatmap(source, selected_country,
+                                                 selected_element, selected_period))
 
         st.subheader("Raw Data for " + selected_commodity)
-        st.dataframe(filtered_data)
+        with timer.stage("dataframe"):
+            # Year-over-year change, rolling mean/volatility and real prices are
+            # computed for the whole dataset once and looked up by row here.
+            analytics = get_analytics(source)
+            st.dataframe(series_data.join(analytics.loc[series_data.index]))
+
+    if st.sidebar.checkbox("Show performance metrics"):
+        show_metrics(timer)
+
+def show_metrics(timer):
+    import streamlit as st
+    st.sidebar.subheader("Performance")
+    st.sidebar.caption(f"This run: {timer.total_seconds * 1000:.1f} ms")
+    st.sidebar.dataframe(timer.table(), hide_index=True)
+    totals = [{'stage': name, 'runs': total['count'],
+               'mean ms': round(total['total_seconds'] / total['count'] * 1000, 2),
+               'max ms': round(total['max_seconds'] * 1000, 2)}
+              for name, total in stage_totals().items()]
+    st.sidebar.caption("Since the server started")
+    st.sidebar.dataframe(totals, hide_index=True)
 
 if __name__ == "__main__":
+    import streamlit as st
     if st.runtime.exists():
         main()
+    elif sys.argv[1:2] == ["report"]:
+        # Headless batch mode: python market_analyzer.py report OUTPUT_DIR ...
+        import market_report
+        sys.exit(market_report.main(sys.argv[2:]))
     else:
+        from streamlit.web import cli as stcli
         sys.argv = ["streamlit", "run", sys.argv[0]]
         sys.exit(stcli.main())
\ No newline at end of file
@@ -0,0 +1,269 @@
+"""Local HTTP/JSON query service over the market dataset.
+
+    python market_api.py [--data SOURCE] [--host 127.0.0.1] [--port 8050]
+
+Endpoints (all GET, all return JSON):
+    /countries
+    /commodities?country=NGA
+    /series?commodity=Rice&element=Producer Price (LCU/tonne)[&country=NGA][&period=Monthly]
+    /stats?commodity=Rice[&country=NGA][&element=...][&period=...]
+
+The dataset is loaded and indexed once at startup, so each request is a
+dict lookup on the CommodityIndex. Whether the data files changed is
+checked at most once every REFRESH_INTERVAL seconds, and the check and
+any reload run in a worker thread; other connections keep being served
+from the current index meanwhile. Response bodies are cached per (dataset version, URL) and
+carry an ETag; clients that send If-None-Match get a 304 without a body.
+Connections are kept alive, so pollers do not pay a TCP handshake per
+request. The server is plain asyncio with no third-party dependencies.
+"""
+import argparse
+import asyncio
+import collections
+import hashlib
+import json
+import logging
+import math
+import os
+import sys
+import time
+from urllib.parse import urlsplit, parse_qs
+
+from market_data import get_commodity_index, market_signature, ANNUAL, DATA_PATTERN
+
+RESPONSE_CACHE_SIZE = 4096
+# Seconds between two checks for changed data files.
+REFRESH_INTERVAL = 1.0
+REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 500: "Internal Server Error"}
+
+logger = logging.getLogger("market_analyzer.api")
+
+
+class QueryError(Exception):
+    """Raised by a handler to answer with an HTTP error status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _number(value):
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+class MarketQueryService:
+    """Answers the JSON queries; kept separate from the HTTP plumbing."""
+
+    def __init__(self, source, refresh_interval=REFRESH_INTERVAL):
+        self.source = source
+        self.refresh_interval = refresh_interval
+        self.signature = None
+        self._responses = collections.OrderedDict()
+        self._checked = 0.0
+        self._reloading = None
+        self.refresh()
+
+    def _load(self):
+        """Return (signature, index) if the data files changed since the
+        index was loaded, else None. Safe to run in a worker thread."""
+        signature = market_signature(self.source)
+        if signature == self.signature:
+            return None
+        index = get_commodity_index(self.source)
+        if index is None:
+            raise FileNotFoundError(f"no market data found at {self.source}")
+        return signature, index
+
+    def _install(self, loaded):
+        if loaded is not None:
+            self.signature, self.index = loaded
+            self._responses.clear()
+
+    def refresh(self):
+        """Reload the index now if the data files changed (blocking)."""
+        self._checked = time.monotonic()
+        self._install(self._load())
+
+    async def refresh_async(self):
+        """Check for changed data files if refresh_interval has passed, in a
+        worker thread. Only one check runs at a time; requests that arrive
+        while it runs are answered from the current index."""
+        if self._reloading is not None or time.monotonic() - self._checked < self.refresh_interval:
+            return
+        self._checked = time.monotonic()
+        self._reloading = asyncio.get_running_loop().run_in_executor(None, self._load)
+        try:
+            self._install(await self._reloading)
+        except FileNotFoundError:
+            # The files may be in the middle of being replaced; keep serving
+            # the index already loaded.
+            pass
+        finally:
+            self._reloading = None
+
+    def response(self, target):
+        """Return (status, body bytes, etag) for a request target like '/stats?commodity=Rice'."""
+        cached = self._responses.get(target)
+        if cached is not None:
+            self._responses.move_to_end(target)
+            return cached
+        url = urlsplit(target)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        handler = self.ROUTES.get(url.path)
+        try:
+            if handler is None:
+                raise QueryError(404, f"unknown endpoint: {url.path}")
+            status, payload = 200, handler(self, params)
+        except QueryError as error:
+            status, payload = error.status, {'error': str(error)}
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        result = (status, body, etag)
+        if status == 200:
+            self._responses[target] = result
+            if len(self._responses) > RESPONSE_CACHE_SIZE:
+                self._responses.popitem(last=False)
+        return result
+
+    def _country(self, params):
+        country = params.get('country')
+        if country is None:
+            if len(self.index.countries) != 1:
+                raise QueryError(400, "country is required when several countries are loaded")
+            return self.index.countries[0]
+        if country not in self.index.country_names:
+            raise QueryError(404, f"unknown country: {country}")
+        return country
+
+    def _commodity(self, params, country):
+        commodity = params.get('commodity')
+        if commodity is None:
+            raise QueryError(400, "commodity is required")
+        if (country, commodity) not in self.index.slices:
+            raise QueryError(404, f"unknown commodity for {country}: {commodity}")
+        return commodity
+
+    def countries(self, params):
+        return [{'iso3': iso3, 'name': self.index.country_names[iso3]} for iso3 in self.index.countries]
+
+    def commodities(self, params):
+        return list(self.index.commodities(self._country(params)))
+
+    def series(self, params):
+        country = self._country(params)
+        commodity = self._commodity(params, country)
+        element = params.get('element')
+        if element is None:
+            raise QueryError(400, "element is required")
+        period = params.get('period', ANNUAL)
+        times, prices = self.index.series_arrays(commodity, country, element, period)
+        if len(times) == 0:
+            raise QueryError(404, f"no {period} {element} series for {commodity}")
+        return {'country': country, 'commodity': commodity, 'element': element, 'period': period,
+                'time': [_number(value) for value in times],
+                'price': [_number(value) for value in prices]}
+
+    def stats(self, params):
+        country = self._country(params)
+        commodity = self._commodity(params, country)
+        keys = self.index.series_keys(commodity, country)
+        if 'element' in params:
+            keys = [(element, period) for element, period in keys if element == params['element']]
+        if 'period' in params:
+            keys = [(element, period) for element, period in keys if period == params['period']]
+        if not keys:
+            raise QueryError(404, f"no matching series for {commodity}")
+        return {'country': country, 'commodity': commodity, 'series': [
+            {'element': element, 'period': period,
+             'statistics': {name: _number(value) for name, value in
+                            self.index.series_statistics(commodity, country, element, period).items()}}
+            for element, period in keys]}
+
+    ROUTES = {'/countries': countries, '/commodities': commodities,
+              '/series': series, '/stats': stats}
+
+
+async def handle_connection(service, reader, writer):
+    """Serve HTTP/1.1 requests on one connection until the client closes it."""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            parts = request_line.decode("latin-1").split()
+            if len(parts) != 3:
+                break
+            method, target, version = parts
+            keep_alive = (version == "HTTP/1.1" and headers.get("connection", "").lower() != "close")
+            if method != "GET":
+                status, body, etag = 405, b'{"error":"only GET is supported"}', None
+            else:
+                try:
+                    await service.refresh_async()
+                    status, body, etag = service.response(target)
+                except Exception:
+                    # A bug in one query must not take the connection down.
+                    logger.exception("error answering %s", target)
+                    status, body, etag = 500, b'{"error":"internal server error"}', None
+                if status == 200 and headers.get("if-none-match") == etag:
+                    status, body = 304, b""
+            head = [f"HTTP/1.1 {status} {REASONS[status]}",
+                    "Content-Type: application/json",
+                    f"Content-Length: {len(body)}",
+                    "Cache-Control: no-cache",
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+            if etag:
+                head.append(f"ETag: {etag}")
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(source, host="127.0.0.1", port=8050):
+    service = MarketQueryService(source)
+    return await asyncio.start_server(
+        lambda reader, writer: handle_connection(service, reader, writer), host, port)
+
+
+async def serve(source, host, port):
+    server = await start_server(source, host, port)
+    print(f"Serving market data on http://{host}:{port}/ (Ctrl+C to stop)")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Serve the market dataset as a local JSON API.")
+    parser.add_argument("--data", default=script_dir,
+                        help=f"CSV file, glob, directory of {DATA_PATTERN} files or market store "
+                             "directory (default: next to this script)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.data, args.host, args.port))
+    except FileNotFoundError as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
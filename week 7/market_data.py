@@ -0,0 +1,552 @@
+"""Data and statistics core of the market analyzer.
+
+Loading, caching, indexing and summarising the FAO producer-price files
+lives here and only needs pandas and NumPy. market_analyzer.py builds
+the Streamlit dashboard on top of it. Streamlit and matplotlib are
+imported only by the code paths that draw something, so worker processes,
+batch jobs and tests that just need the data do not pay their import
+cost.
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+import os
+import hashlib
+import glob
+import functools
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from price_stats import PriceAccumulator, DESCRIBE_INDEX
+
+DATA_FILE = "producer-prices-nga.csv"
+# Parsed copies of the CSV files are kept here (next to the CSV) so warm
+# loads can skip the text parsing entirely.
+CACHE_DIR = ".market_cache"
+
+# Loading schema for the FAO producer-price files. Only these columns are
+# read; the start/end dates, Year Code and the numeric code columns only
+# repeat information that is already in Year, Item and Element.
+CATEGORY_COLUMNS = ['Iso3', 'Area', 'Item', 'Element', 'Months', 'Unit', 'Flag']
+MARKET_COLUMNS = CATEGORY_COLUMNS + ['Year', 'Value']
+# Prices are stored as float32 when that keeps every value within this
+# relative error of the float64 parse.
+PRICE_RTOL = 1e-6
+# Rows per chunk for stream_market_statistics.
+STREAM_CHUNKSIZE = 100_000
+# Bump when the loading schema changes so old cache files are not reused.
+SCHEMA_VERSION = 2
+
+def cache_path_for(filename, cache_dir=None):
+    """Return the columnar cache file for filename, keyed on its path, mtime and size."""
+    filename = os.path.abspath(filename)
+    stat = os.stat(filename)
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(filename), CACHE_DIR)
+    path_key = hashlib.sha1(filename.encode("utf-8")).hexdigest()[:12]
+    version_key = f"v{SCHEMA_VERSION}.{stat.st_mtime_ns:x}.{stat.st_size:x}"
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(cache_dir, f"{stem}-{path_key}-{version_key}.feather")
+
+def downcast_years(years):
+    if years.notna().all() and years.between(np.iinfo(np.int16).min, np.iinfo(np.int16).max).all():
+        return years.astype(np.int16)
+    return years
+
+def downcast_prices(prices):
+    if prices.abs().max() > np.finfo(np.float32).max:
+        return prices
+    compact = prices.astype(np.float32)
+    if np.allclose(compact, prices, rtol=PRICE_RTOL, atol=0, equal_nan=True):
+        return compact
+    return prices
+
+def _market_dtypes():
+    dtypes = {column: 'category' for column in CATEGORY_COLUMNS}
+    dtypes['Value'] = np.float64
+    return dtypes
+
+def _parse_market_csv(filename):
+    df = pd.read_csv(filename, skiprows=[1], usecols=MARKET_COLUMNS, dtype=_market_dtypes())
+    df = df[MARKET_COLUMNS]
+    df['Year'] = downcast_years(df['Year'])
+    df['Value'] = downcast_prices(df['Value'])
+    df.rename(columns={
+        'Year': 'date',
+        'Item': 'commodity',
+        'Value': 'price',
+        'Unit': 'unit'
+    }, inplace=True)
+    return df
+
+def _write_cache(df, cache_file):
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    # Older versions of the same CSV share the "{stem}-{path_key}" prefix
+    # (only the version key after the last dash differs); drop them first.
+    prefix = cache_file.rsplit("-", 1)[0]
+    for stale in glob.glob(glob.escape(prefix) + "-*.feather"):
+        os.remove(stale)
+    # Write next to the final name and rename so a concurrent reader never
+    # sees a half-written file.
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    df.to_feather(tmp_file)
+    os.replace(tmp_file, cache_file)
+
+def read_market_data(filename, use_cache=True, cache_dir=None):
+    try:
+        if not use_cache:
+            return _parse_market_csv(filename)
+        cache_file = cache_path_for(filename, cache_dir)
+        if os.path.exists(cache_file):
+            try:
+                # Memory-map the Arrow file rather than reading it in.
+                from pyarrow import feather
+                table = feather.read_table(cache_file, memory_map=True)
+                return table.to_pandas()
+            except Exception:
+                # A corrupt or incompatible cache is just a miss.
+                pass
+        df = _parse_market_csv(filename)
+        try:
+            _write_cache(df, cache_file)
+        except OSError:
+            # Read-only deployments still work, only without the cache.
+            pass
+        return df
+    except FileNotFoundError:
+        return None
+
+def calculate_statistics(data):
+    if 'price' in data.columns:
+        # Same numbers as data['price'].describe(). The column is already in
+        # memory, so the sketch is sized to hold every value and its
+        # quartiles stay exact; the approximate sketch is only for
+        # streaming and merging (see price_stats).
+        prices = data['price'].to_numpy()
+        return PriceAccumulator.from_values(prices, k=max(len(prices), 1)).describe()
+    else:
+        return pd.DataFrame()
+
+# Groups that get their own row in the precomputed statistics table. Element
+# carries the unit (LCU, SLC or USD per tonne, or the price index) and period
+# separates annual from monthly rows.
+STATISTICS_KEYS = ['Iso3', 'commodity', 'Element', 'period']
+
+def statistics_table(data, keys=STATISTICS_KEYS):
+    """Return calculate_statistics for every group of keys in one pass.
+
+    The result has one row per group (indexed by keys) and the same columns
+    as describe(): count, mean, std, min, 25%, 50%, 75% and max. All groups
+    are computed with vectorized groupby aggregations instead of one
+    boolean filter and describe() call per group.
+    """
+    keys = [key for key in keys if key in data.columns]
+    prices = data['price'].astype(np.float64)
+    groups = prices.groupby([data[key] for key in keys], observed=True, sort=True)
+    if groups.ngroups == 0:
+        # A header-only file has no groups; quantile() would give no columns.
+        index = pd.MultiIndex.from_arrays([data[key].iloc[:0] for key in keys], names=keys)
+        return pd.DataFrame(columns=DESCRIBE_INDEX, index=index, dtype=np.float64)
+    table = groups.agg(['count', 'mean', 'std', 'min'])
+    quartiles = groups.quantile([0.25, 0.5, 0.75]).unstack()
+    quartiles.columns = ['25%', '50%', '75%']
+    table = table.join(quartiles)
+    table['max'] = groups.max()
+    table['count'] = table['count'].astype(np.float64)
+    return table
+
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+               'August', 'September', 'October', 'November', 'December']
+ANNUAL = 'Annual'
+MONTHLY = 'Monthly'
+
+def add_period_columns(data):
+    """Add 'month' (0 for annual rows, 1-12 otherwise), 'period' (Annual or
+    Monthly) and 'time' (the year, plus the month as a fraction) columns."""
+    if 'Months' in data.columns:
+        months = data['Months'].map({name: number for number, name in enumerate(MONTH_NAMES, 1)})
+        months = months.astype(np.float64).fillna(0).astype(np.int8).to_numpy()
+    else:
+        months = np.zeros(len(data), dtype=np.int8)
+    period = pd.Categorical.from_codes((months > 0).astype(np.int8), [ANNUAL, MONTHLY])
+    time = data['date'].to_numpy(dtype=np.float64) + np.where(months > 0, (months - 1) / 12, 0)
+    return data.assign(month=months, period=period, time=time)
+
+def _group_bounds(code_arrays):
+    """Return (starts, stops) of the runs of equal keys in sorted code arrays."""
+    length = len(code_arrays[0])
+    changed = np.zeros(max(length - 1, 0), dtype=bool)
+    for codes in code_arrays:
+        changed |= codes[1:] != codes[:-1]
+    starts = np.concatenate(([0], np.flatnonzero(changed) + 1)) if length else np.empty(0, dtype=int)
+    stops = np.concatenate((starts[1:], [length])) if length else starts
+    return starts.tolist(), stops.tolist()
+
+class CommodityIndex:
+    """Rows of a market frame grouped by country, commodity and price series.
+
+    The frame is sorted once by (Iso3, commodity, Element, period, time).
+    Every (country, commodity) pair maps to a contiguous row slice, and so
+    does every (country, commodity, Element, period) price series inside
+    it, so selecting either is a dict lookup plus an iloc slice instead of
+    a full string comparison scan. Keeping the series apart matters: the
+    FAO files hold LCU, SLC and USD prices and a price index for the same
+    commodity, plus some monthly rows, which make no sense as one line.
+    """
+
+    SORT_KEYS = ['Iso3', 'commodity', 'Element', 'period', 'time']
+
+    def __init__(self, data, statistics=None):
+        if 'Iso3' not in data.columns:
+            data = data.assign(Iso3='')
+        if 'Element' not in data.columns:
+            data = data.assign(Element='')
+        if 'date' in data.columns and 'period' not in data.columns:
+            data = add_period_columns(data)
+        keys = [key for key in self.SORT_KEYS if key in data.columns]
+        key_codes = [pd.factorize(data[key], sort=True)[0] for key in keys]
+        # lexsort treats its last key as the primary one.
+        order = np.lexsort(key_codes[::-1])
+        self.data = data.take(order).reset_index(drop=True)
+        sorted_codes = [codes[order] for codes in key_codes]
+        country_codes, commodity_codes = sorted_codes[0], sorted_codes[1]
+
+        countries = self.data['Iso3'].to_numpy()
+        commodities = self.data['commodity'].to_numpy()
+        self.slices = {}
+        self.country_names = {}
+        by_country = {}
+        for start, stop in zip(*_group_bounds(sorted_codes[:2])):
+            # Rows with a missing country or commodity are left out.
+            if country_codes[start] < 0 or commodity_codes[start] < 0:
+                continue
+            country, commodity = countries[start], commodities[start]
+            self.slices[(country, commodity)] = slice(start, stop)
+            by_country.setdefault(country, []).append(commodity)
+            if country not in self.country_names:
+                area = self.data['Area'].iat[start] if 'Area' in self.data.columns else country
+                self.country_names[country] = area if isinstance(area, str) else country
+        self.countries = tuple(by_country)
+        self._commodities = {country: tuple(names) for country, names in by_country.items()}
+        self.names = tuple(sorted({name for names in by_country.values() for name in names}))
+
+        self.series_slices = {}
+        self._series = {}
+        if 'period' in self.data.columns:
+            elements = self.data['Element'].to_numpy()
+            periods = self.data['period'].to_numpy()
+            for start, stop in zip(*_group_bounds(sorted_codes[:4])):
+                if min(codes[start] for codes in sorted_codes[:3]) < 0:
+                    continue
+                key = (countries[start], commodities[start], elements[start], periods[start])
+                self.series_slices[key] = slice(start, stop)
+                self._series.setdefault(key[:2], []).append(key[2:])
+        self.statistics = statistics_table(self.data) if statistics is None else statistics
+
+    def apply_delta(self, rows, key):
+        """Return a new index with rows added, replacing the rows whose key
+        column holds one of their keys (see market_store). Only the
+        statistics of the series that gained or lost rows are recomputed."""
+        replaced = self.data[key].isin(rows[key]).to_numpy()
+        if 'date' in rows.columns:
+            rows = add_period_columns(rows)
+        rows = rows[list(self.data.columns)]
+        data = concat_market_frames([self.data[~replaced], rows])
+        keys = [column for column in STATISTICS_KEYS if column in data.columns]
+        touched = pd.MultiIndex.from_frame(
+            pd.concat([self.data.loc[replaced, keys], rows[keys]]).astype(object)).unique()
+        affected = pd.MultiIndex.from_frame(data[keys].astype(object)).isin(touched)
+        statistics = self.statistics[~self.statistics.index.isin(touched)]
+        statistics = pd.concat([statistics, statistics_table(data[affected])]).sort_index()
+        return CommodityIndex(data, statistics)
+
+    def commodity_statistics(self, commodity, country):
+        """Return the precomputed statistics rows (one per series) for a commodity."""
+        try:
+            return self.statistics.loc[(country, commodity)]
+        except KeyError:
+            return self.statistics.iloc[0:0]
+
+    def series_statistics(self, commodity, country, element, period=ANNUAL):
+        """Return the precomputed statistics of one price series as a Series."""
+        try:
+            return self.statistics.loc[(country, commodity, element, period)]
+        except KeyError:
+            return pd.Series(dtype=np.float64)
+
+    def commodities(self, country=None):
+        if country is None:
+            return self.names
+        return self._commodities.get(country, ())
+
+    def series_keys(self, commodity, country):
+        """Return the (Element, period) pairs that have data for a commodity."""
+        return tuple(self._series.get((country, commodity), ()))
+
+    def series(self, commodity, country, element, period=ANNUAL):
+        """Return the rows of one price series, in time order."""
+        return self.data.iloc[self.series_slices.get((country, commodity, element, period), slice(0, 0))]
+
+    def series_arrays(self, commodity, country, element, period=ANNUAL):
+        """Return (time, price) NumPy arrays for one price series."""
+        rows = self.series(commodity, country, element, period)
+        return rows['time'].to_numpy(), rows['price'].to_numpy()
+
+    def select(self, commodity, country=None):
+        if country is not None:
+            return self.data.iloc[self.slices.get((country, commodity), slice(0, 0))]
+        parts = [self.slices[(c, commodity)] for c in self.countries
+                 if (c, commodity) in self.slices]
+        if len(parts) <= 1:
+            return self.data.iloc[parts[0] if parts else slice(0, 0)]
+        return self.data.iloc[np.concatenate([np.arange(p.start, p.stop) for p in parts])]
+
+# Pattern used to find the per-country FAO files in a data directory.
+DATA_PATTERN = "producer-prices-*.csv"
+# A directory holding this file is a market_store.MarketStore, and is read
+# through the store instead of as a directory of CSV files.
+STORE_META_FILE = "store.json"
+
+def store_directory(source):
+    """Return the absolute path of source if it names a market store, else None."""
+    if isinstance(source, (list, tuple)):
+        if len(source) != 1:
+            return None
+        source = source[0]
+    directory = os.path.abspath(os.fspath(source))
+    return directory if os.path.isfile(os.path.join(directory, STORE_META_FILE)) else None
+
+def find_market_files(source):
+    """Return the CSV files named by source: a file, a directory of FAO
+    producer-price files, a glob pattern or a list of paths."""
+    if isinstance(source, (list, tuple)):
+        return [os.fspath(path) for path in source]
+    source = os.fspath(source)
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(glob.escape(source), DATA_PATTERN)))
+    if glob.has_magic(source):
+        return sorted(glob.glob(source))
+    return [source]
+
+def concat_market_frames(frames):
+    """Concatenate frames loaded with the market schema, keeping the
+    categorical columns categorical (plain pd.concat would turn columns
+    with differing categories into object columns)."""
+    if len(frames) == 1:
+        return frames[0]
+    columns = {}
+    for column in frames[0].columns:
+        parts = [frame[column] for frame in frames]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            columns[column] = pd.Series(union_categoricals(parts))
+        else:
+            columns[column] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
+
+def read_market_files(source, workers=None):
+    """Read every FAO file named by source (see find_market_files) into one
+    frame. Several files are parsed in a process pool with up to workers
+    processes (default: one per core). Returns None if no file was found."""
+    files = find_market_files(source)
+    if len(files) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            frames = list(pool.map(read_market_data, files))
+    else:
+        frames = [read_market_data(filename) for filename in files]
+    frames = [frame for frame in frames if frame is not None]
+    if not frames:
+        return None
+    return concat_market_frames(frames)
+
+def stream_market_statistics(filename, countries=None, commodities=None, elements=None,
+                             chunksize=STREAM_CHUNKSIZE):
+    """Compute price statistics for a CSV too large to load at once.
+
+    The file is read chunksize rows at a time. Rows are filtered by the
+    optional lists of Iso3 codes, commodity names and Element labels while
+    streaming, and every (Iso3, commodity, Element, period) series feeds
+    its own PriceAccumulator, so peak memory depends on the chunk size and
+    the number of series, not on the size of the file.
+    Returns a dict mapping (Iso3, commodity, Element, period) to a
+    PriceAccumulator, the keys of statistics_table; call describe() on one
+    to get the calculate_statistics Series.
+    """
+    filters = {'Iso3': countries, 'Item': commodities, 'Element': elements}
+    results = {}
+    reader = pd.read_csv(filename, skiprows=[1], usecols=MARKET_COLUMNS,
+                         dtype=_market_dtypes(), chunksize=chunksize)
+    with reader:
+        for chunk in reader:
+            for column, wanted in filters.items():
+                if wanted is not None:
+                    chunk = chunk[chunk[column].isin(wanted)]
+            # Annual and monthly prices are separate series, as in CommodityIndex.
+            period = pd.Series(np.where(chunk['Months'].isin(MONTH_NAMES), MONTHLY, ANNUAL),
+                               index=chunk.index, name='period')
+            groups = chunk['Value'].groupby([chunk['Iso3'], chunk['Item'], chunk['Element'], period],
+                                            observed=True, sort=False)
+            for key, values in groups:
+                if key not in results:
+                    results[key] = PriceAccumulator()
+                results[key].update(values.to_numpy())
+    return results
+
+# In-process cache shared by every Streamlit session (and any other caller
+# in the same process). Entries are keyed on the file signatures, so editing
+# or replacing a CSV produces new keys. A market store is signed by its
+# directory and version instead. market_signature remembers the latest
+# signature of each source (by source_key) and, once it changes, drops
+# every entry of the old one right away, so a stale frame is not held until the LRU ages it out.
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+_signature_caches = []
+# source_key of a source -> the signature market_signature last returned
+_latest_signatures = {}
+_signatures_lock = threading.Lock()
+
+class SignatureCache:
+    """LRU cache of func(signature, *args), like functools.lru_cache, from
+    which all entries of one signature can be dropped (see evict)."""
+
+    def __init__(self, func, maxsize):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        _signature_caches.append(self)
+
+    def __call__(self, signature, *args):
+        key = (signature,) + args
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        value = self.func(signature, *args)
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def evict(self, signature):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == signature]:
+                del self._entries[key]
+
+    def cache_info(self):
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+    def cache_clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+def signature_cache(maxsize):
+    """Decorator that wraps a function in a SignatureCache."""
+    return functools.partial(SignatureCache, maxsize=maxsize)
+
+def source_key(source):
+    """Return source (a path, glob, store directory or list of paths) in a
+    normalized, hashable form that stays the same when its files change
+    or files are added to or removed from a directory."""
+    if isinstance(source, (list, tuple)):
+        return tuple(os.path.abspath(os.fspath(path)) for path in source)
+    return os.path.abspath(os.fspath(source))
+
+def file_signature(filename):
+    filename = os.path.abspath(filename)
+    stat = os.stat(filename)
+    return filename, stat.st_mtime_ns, stat.st_size
+
+def market_signature(source):
+    directory = store_directory(source)
+    if directory is not None:
+        from market_store import MarketStore
+        signature = ((directory, STORE_META_FILE, MarketStore(directory).version),)
+    else:
+        signature = tuple(file_signature(filename) for filename in find_market_files(source))
+    key = source_key(source)
+    with _signatures_lock:
+        previous = _latest_signatures.get(key)
+        _latest_signatures[key] = signature
+    if previous is not None and previous != signature:
+        for cache in _signature_caches:
+            cache.evict(previous)
+    return signature
+
+@signature_cache(maxsize=8)
+def _cached_index(signature):
+    if len(signature) == 1 and signature[0][1] == STORE_META_FILE:
+        from market_store import get_store_index
+        return get_store_index(signature[0][0])
+    data = read_market_files([filename for filename, _, _ in signature])
+    return None if data is None else CommodityIndex(data)
+
+@signature_cache(maxsize=1024)
+def _cached_statistics(signature, commodity, country):
+    index = _cached_index(signature)
+    return calculate_statistics(index.select(commodity, country))
+
+def get_market_data(source):
+    """Return the parsed frame for source (sorted by country and commodity),
+    or None if no file exists. The frame is shared and must not be modified."""
+    index = get_commodity_index(source)
+    return None if index is None else index.data
+
+def get_commodity_index(source):
+    try:
+        signature = market_signature(source)
+    except FileNotFoundError:
+        return None
+    return _cached_index(signature) if signature else None
+
+def get_countries(source):
+    return get_commodity_index(source).countries
+
+def get_commodities(source, country=None):
+    return get_commodity_index(source).commodities(country)
+
+def get_commodity_rows(source, commodity, country=None):
+    return get_commodity_index(source).select(commodity, country)
+
+def get_statistics(source, commodity, country=None):
+    return _cached_statistics(market_signature(source), commodity, country)
+
+# Rendered charts kept in memory (a PNG is roughly 20-40 kB).
+CHART_CACHE_SIZE = 256
+
+def series_label(series_data):
+    if series_data.empty:
+        return "Price"
+    if 'Element' in series_data.columns:
+        return series_data['Element'].iloc[0]
+    return f"Price ({series_data['unit'].iloc[0]})"
+
+def render_price_trends(series_data, commodity_name):
+    """Return the trend chart of one price series as PNG bytes."""
+    # matplotlib is only imported once a chart is actually drawn.
+    from price_charts import draw_price_chart
+    x = series_data['time'] if 'time' in series_data.columns else series_data['date']
+    return draw_price_chart(x.to_numpy(), series_data['price'].to_numpy(),
+                            f"Producer Price Trend for {commodity_name}",
+                            series_label(series_data))
+
+@signature_cache(maxsize=CHART_CACHE_SIZE)
+def _cached_chart(signature, commodity, country, element, period):
+    index = _cached_index(signature)
+    return render_price_trends(index.series(commodity, country, element, period), commodity)
+
+def get_price_chart(source, commodity, country, element, period=ANNUAL):
+    """Return the cached PNG trend chart for one price series."""
+    return _cached_chart(market_signature(source), commodity, country, element, period)
+
+def clear_caches():
+    """Empty every signature cache (including market_analytics' ones)."""
+    for cache in _signature_caches:
+        cache.cache_clear()
+    with _signatures_lock:
+        _latest_signatures.clear()
@@ -0,0 +1,121 @@
+"""Per-stage timing and memory metrics for the dashboard.
+
+main() in market_analyzer.py wraps each of its stages (load, options,
+series_options, filter, plot, stats, correlation, dataframe) in
+StageTimer.stage(). For every stage it records the wall time and the change in the process's
+resident memory, both of which cost a couple of microseconds to read, so
+the timer can stay on in production. When the interpreter is already
+tracing allocations (python -X tracemalloc, or PYTHONTRACEMALLOC=1) the
+peak traced allocation of each stage is recorded as well.
+
+Each finished stage is logged as one JSON line on the
+"market_analyzer.metrics" logger and added to running per-stage totals
+(count, total and worst time), which the dashboard's debug panel shows.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+logger = logging.getLogger("market_analyzer.metrics")
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+def resident_memory():
+    """Return the resident set size of this process in bytes (None where
+    /proc is not available)."""
+    try:
+        with open("/proc/self/statm", "rb") as file:
+            return int(file.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+# stage name -> {'count', 'total_seconds', 'max_seconds'} over all runs
+_totals = {}
+_totals_lock = threading.Lock()
+
+
+def stage_totals():
+    """Return a copy of the running per-stage totals."""
+    with _totals_lock:
+        return {name: dict(total) for name, total in _totals.items()}
+
+
+def reset_stage_totals():
+    with _totals_lock:
+        _totals.clear()
+
+
+class StageTimer:
+    """Records one run's stages; see the module docstring."""
+
+    def __init__(self, run="dashboard"):
+        self.run = run
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            traced_before = tracemalloc.get_traced_memory()[0]
+        rss_before = resident_memory()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            rss_after = resident_memory()
+            record = {'stage': name, 'seconds': seconds,
+                      'rss_delta': None if rss_before is None or rss_after is None
+                      else rss_after - rss_before}
+            if tracing:
+                record['peak_allocated'] = tracemalloc.get_traced_memory()[1] - traced_before
+            self.stages.append(record)
+            self._record(record)
+
+    def _record(self, record):
+        with _totals_lock:
+            total = _totals.setdefault(record['stage'], {'count': 0, 'total_seconds': 0.0,
+                                                         'max_seconds': 0.0})
+            total['count'] += 1
+            total['total_seconds'] += record['seconds']
+            total['max_seconds'] = max(total['max_seconds'], record['seconds'])
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({'event': 'stage', 'run': self.run, **record},
+                                   separators=(",", ":")))
+
+    @property
+    def total_seconds(self):
+        return sum(record['seconds'] for record in self.stages)
+
+    def table(self):
+        """Return the recorded stages as a list of display rows."""
+        rows = []
+        for record in self.stages:
+            row = {'stage': record['stage'], 'ms': round(record['seconds'] * 1000, 2)}
+            if record['rss_delta'] is not None:
+                row['rss change (MB)'] = round(record['rss_delta'] / 2**20, 2)
+            if 'peak_allocated' in record:
+                row['peak allocated (MB)'] = round(record['peak_allocated'] / 2**20, 2)
+            rows.append(row)
+        return rows
+
+
+def enable_log(stream=None):
+    """Send the metric lines to stderr (or stream) unless the application
+    already configured a handler for them."""
+    if not logger.handlers:
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
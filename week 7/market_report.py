@@ -0,0 +1,114 @@
+"""Headless batch reports for the market analyzer.
+
+Renders the trend chart of every price series and the statistics table of
+every commodity to files, without Streamlit:
+
+    python market_report.py OUTPUT_DIR [--data SOURCE] [--workers N] [--country ISO3 ...]
+    python market_analyzer.py report OUTPUT_DIR ...     (same thing)
+
+The output is laid out as OUTPUT_DIR/<iso3>/<commodity>/ with one PNG per
+(Element, period) series plus statistics.csv. Each commodity directory
+records a fingerprint of the rows it was rendered from, and commodities
+whose rows (and the report format) have not changed are skipped on the
+next run. The remaining commodities are rendered in a process pool.
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from market_data import (get_commodity_index, render_price_trends,
+                         statistics_table, DATA_PATTERN)
+
+# Bump when the charts or tables change so existing reports are redone.
+REPORT_VERSION = 1
+FINGERPRINT_FILE = ".fingerprint"
+
+
+def slugify(name):
+    return re.sub(r"[^A-Za-z0-9]+", "-", str(name)).strip("-").lower() or "unnamed"
+
+
+def fingerprint(rows):
+    """Return a hash of the rows (and report version) a commodity is rendered from."""
+    digest = hashlib.sha1(f"report-v{REPORT_VERSION}".encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(rows, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def is_current(directory, rows_fingerprint):
+    try:
+        with open(os.path.join(directory, FINGERPRINT_FILE), "r", encoding="utf-8") as file:
+            return file.read().strip() == rows_fingerprint
+    except FileNotFoundError:
+        return False
+
+
+def render_commodity(rows, commodity, directory, rows_fingerprint):
+    """Write the charts and statistics of one commodity into directory."""
+    os.makedirs(directory, exist_ok=True)
+    for (element, period), series in rows.groupby(['Element', 'period'], observed=True, sort=True):
+        png = render_price_trends(series, commodity)
+        with open(os.path.join(directory, f"{slugify(element)}-{slugify(period)}.png"), "wb") as file:
+            file.write(png)
+    statistics_table(rows, ['Element', 'period']).to_csv(os.path.join(directory, "statistics.csv"))
+    # Written last, so an interrupted run is redone rather than skipped.
+    with open(os.path.join(directory, FINGERPRINT_FILE), "w", encoding="utf-8") as file:
+        file.write(rows_fingerprint)
+    return directory
+
+
+def write_report(source, output_dir, workers=None, countries=None):
+    """Render every commodity of source into output_dir.
+    Returns (number rendered, number skipped because unchanged)."""
+    index = get_commodity_index(source)
+    if index is None:
+        raise FileNotFoundError(f"no market data found at {source}")
+    tasks = []
+    skipped = 0
+    for (country, commodity), rows_slice in index.slices.items():
+        if countries and country not in countries:
+            continue
+        rows = index.data.iloc[rows_slice]
+        directory = os.path.join(output_dir, slugify(country), slugify(commodity))
+        rows_fingerprint = fingerprint(rows)
+        if is_current(directory, rows_fingerprint):
+            skipped += 1
+        else:
+            tasks.append((rows, commodity, directory, rows_fingerprint))
+    if len(tasks) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(render_commodity, *zip(*tasks)))
+    else:
+        for task in tasks:
+            render_commodity(*task)
+    return len(tasks), skipped
+
+
+def main(argv=None):
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Render market analyzer charts and statistics to files.")
+    parser.add_argument("output_dir", help="directory the report is written to")
+    parser.add_argument("--data", default=script_dir,
+                        help=f"CSV file, glob, directory of {DATA_PATTERN} files or market store "
+                             "directory (default: next to this script)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: one per core)")
+    parser.add_argument("--country", action="append", dest="countries", metavar="ISO3",
+                        help="only report this country (repeatable)")
+    args = parser.parse_args(argv)
+    try:
+        rendered, skipped = write_report(args.data, args.output_dir, args.workers, args.countries)
+    except FileNotFoundError as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    print(f"Rendered {rendered} commodities, skipped {skipped} unchanged, in {args.output_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""Append-only store for successive FAO releases.
+
+Every FAO release re-ships the whole history, but from one release to the
+next only a few rows are new or revised. A MarketStore keeps the data as a
+sequence of columnar segment files: the first ingest writes everything,
+and each later ingest hashes the release's rows, compares them with the
+row hashes already stored and appends a segment holding only the new or
+changed rows. A row (identified by country, commodity, element, year and
+month) is taken from the latest segment that contains it.
+
+Each ingest that changes something bumps the store's version number;
+caches of anything derived from the store key on (directory, version).
+get_store_index applies each new segment to the index of the previous
+version instead of rebuilding it.
+
+    python market_store.py STORE_DIR RELEASE.csv [RELEASE.csv ...]
+
+STORE_DIR can then be given as the data source of the dashboard
+(MARKET_DATA=STORE_DIR), market_api.py and market_report.py (--data).
+"""
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+from market_data import read_market_data, concat_market_frames, CommodityIndex, STORE_META_FILE
+
+# Columns that identify a row, and the columns whose change makes it a revision.
+KEY_COLUMNS = ['Iso3', 'commodity', 'Element', 'date', 'Months']
+VALUE_COLUMNS = ['price', 'unit', 'Flag']
+META_FILE = STORE_META_FILE
+# Once this many segments have piled up, ingest rewrites them as one.
+MAX_SEGMENTS = 20
+
+
+def _hashable(data, columns):
+    """Return data[columns] with the dtypes read_market_data picks per file
+    (int16 or int64 years, float32 or float64 prices) made the same, so
+    equal values hash equally in every release."""
+    data = data[columns]
+    normalized = {}
+    if 'date' in data.columns:
+        normalized['date'] = data['date'].astype(np.float64)
+    if 'price' in data.columns:
+        # Round float64 prices to float32 precision, as downcast_prices does
+        # whenever the values fit.
+        prices = data['price'].to_numpy(dtype=np.float64)
+        fits = np.abs(prices) <= np.finfo(np.float32).max
+        with np.errstate(over='ignore'):
+            normalized['price'] = np.where(fits, prices.astype(np.float32), prices)
+    return data.assign(**normalized)
+
+
+def row_hashes(data):
+    """Return (key hashes, value hashes) of every row as uint64 arrays."""
+    keys = pd.util.hash_pandas_object(_hashable(data, KEY_COLUMNS), index=False).to_numpy()
+    values = pd.util.hash_pandas_object(_hashable(data, VALUE_COLUMNS), index=False).to_numpy()
+    return keys, values
+
+
+class MarketStore:
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        try:
+            with open(os.path.join(self.directory, META_FILE), "r", encoding="utf-8") as file:
+                self.meta = json.load(file)
+        except FileNotFoundError:
+            self.meta = {'version': 0, 'segments': []}
+
+    @property
+    def version(self):
+        return self.meta['version']
+
+    def _segment_path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read_segments(self, columns=None, segments=None):
+        from pyarrow import feather
+        segments = self.meta['segments'] if segments is None else segments
+        return [feather.read_table(self._segment_path(name), columns=columns, memory_map=True).to_pandas()
+                for name in segments]
+
+    def stored_hashes(self):
+        """Return the value hash of every stored row, indexed by key hash
+        (only the hash columns of the segments are read)."""
+        segments = self._read_segments(['key_hash', 'value_hash'])
+        if not segments:
+            return pd.Series(dtype=np.uint64)
+        hashes = pd.concat(segments, ignore_index=True)
+        hashes = hashes.drop_duplicates('key_hash', keep='last')
+        return pd.Series(hashes['value_hash'].to_numpy(), index=hashes['key_hash'].to_numpy())
+
+    def read(self, segments=None, key_hashes=False):
+        """Return the current rows of the store (or of the named segments)
+        as one frame, None if there are none. With key_hashes the frame
+        keeps its key_hash column."""
+        frames = self._read_segments(segments=segments)
+        if not frames:
+            return None
+        data = concat_market_frames(frames)
+        data = data.drop_duplicates('key_hash', keep='last')
+        dropped = ['value_hash'] if key_hashes else ['key_hash', 'value_hash']
+        return data.drop(columns=dropped).reset_index(drop=True)
+
+    def _write_segment(self, data, key_hashes, value_hashes):
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"segment-{self.version + 1:06d}.feather"
+        segment = data.reset_index(drop=True).assign(key_hash=key_hashes, value_hash=value_hashes)
+        tmp_file = self._segment_path(name + ".tmp")
+        segment.to_feather(tmp_file)
+        os.replace(tmp_file, self._segment_path(name))
+        return name
+
+    def _write_meta(self, meta):
+        tmp_file = os.path.join(self.directory, META_FILE + ".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as file:
+            json.dump(meta, file, indent=2)
+        # The meta file is replaced last, so readers see either the old
+        # version or the complete new one.
+        os.replace(tmp_file, os.path.join(self.directory, META_FILE))
+        self.meta = meta
+
+    def ingest(self, filename):
+        """Apply a release CSV to the store and return a summary dict with
+        the new version and the number of inserted, changed and unchanged rows."""
+        release = read_market_data(filename, use_cache=False)
+        if release is None:
+            raise FileNotFoundError(filename)
+        key_hashes, value_hashes = row_hashes(release)
+        # A release lists each row once; keep its last copy if it does not.
+        last = ~pd.Series(key_hashes).duplicated(keep='last').to_numpy()
+        stored = self.stored_hashes()
+        previous = stored.reindex(key_hashes).to_numpy()
+        known = np.asarray(pd.Series(key_hashes).isin(stored.index))
+        inserted = last & ~known
+        changed = last & known & (previous != value_hashes)
+        delta = inserted | changed
+        summary = {'version': self.version, 'inserted': int(inserted.sum()),
+                   'changed': int(changed.sum()), 'unchanged': int((last & ~delta).sum())}
+        if not delta.any():
+            return summary
+        name = self._write_segment(release[delta], key_hashes[delta], value_hashes[delta])
+        meta = {'version': self.version + 1, 'segments': self.meta['segments'] + [name]}
+        self._write_meta(meta)
+        if len(meta['segments']) > MAX_SEGMENTS:
+            self.compact()
+        summary['version'] = self.version
+        return summary
+
+    def compact(self):
+        """Rewrite all segments as a single one (same version, same rows)."""
+        segments = self._read_segments()
+        if len(segments) <= 1:
+            return
+        data = concat_market_frames(segments).drop_duplicates('key_hash', keep='last')
+        old = self.meta['segments']
+        name = f"segment-{self.version:06d}-compact.feather"
+        tmp_file = self._segment_path(name + ".tmp")
+        data.reset_index(drop=True).to_feather(tmp_file)
+        os.replace(tmp_file, self._segment_path(name))
+        self._write_meta({'version': self.version, 'segments': [name]})
+        for segment in old:
+            if segment != name:
+                os.remove(self._segment_path(segment))
+
+
+# directory -> (segment names, version, CommodityIndex) of the last index
+# built for each store. Only the latest version is kept.
+_store_indexes = {}
+_store_indexes_lock = threading.Lock()
+
+
+def get_store_index(directory):
+    """Return the CommodityIndex of a store, cached per store version.
+
+    When the store only gained segments since the cached version, just
+    those segments are read and applied to the cached index
+    (CommodityIndex.apply_delta); after a compaction it is rebuilt.
+    """
+    store = MarketStore(directory)
+    segments = tuple(store.meta['segments'])
+    with _store_indexes_lock:
+        cached = _store_indexes.get(store.directory)
+        if cached is not None and cached[1] == store.version:
+            return cached[2]
+        if cached is not None and cached[2] is not None and segments[:len(cached[0])] == cached[0]:
+            delta = store.read(segments[len(cached[0]):], key_hashes=True)
+            index = cached[2] if delta is None else cached[2].apply_delta(delta, 'key_hash')
+        else:
+            data = store.read(key_hashes=True)
+            index = None if data is None else CommodityIndex(data)
+        _store_indexes[store.directory] = (segments, store.version, index)
+        return index
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2:
+        print("usage: python market_store.py STORE_DIR RELEASE.csv [RELEASE.csv ...]", file=sys.stderr)
+        return 2
+    store = MarketStore(argv[0])
+    for filename in argv[1:]:
+        summary = store.ingest(filename)
+        print(f"{filename}: version {summary['version']}, {summary['inserted']} new, "
+              f"{summary['changed']} changed, {summary['unchanged']} unchanged rows")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
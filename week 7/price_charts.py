@@ -0,0 +1,79 @@
+"""Rendering of price trend charts to PNG images.
+
+Charts are drawn on a matplotlib Figure that is created directly rather
+than through pyplot, so it is never registered with pyplot's global figure
+manager and is released as soon as the PNG bytes have been written; a
+long-running Streamlit server therefore does not accumulate open figures.
+Series longer than a point budget are downsampled with LTTB first. The
+PNG bytes are what market_analyzer caches per (data, commodity, series).
+"""
+import io
+
+import numpy as np
+from matplotlib.figure import Figure
+
+# Series with more points than this are downsampled before plotting.
+MAX_POINTS = 1000
+
+
+def lttb(x, y, threshold):
+    """Downsample (x, y) to threshold points with Largest-Triangle-Three-Buckets.
+
+    The first and last points are kept; every bucket in between contributes
+    the point that forms the largest triangle with the previously chosen
+    point and the average of the next bucket, which keeps the visual shape
+    (peaks and troughs) of the line. x must be sorted.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    length = len(x)
+    if threshold >= length or threshold < 3:
+        return x, y
+    edges = np.linspace(1, length - 1, threshold - 1).astype(int)
+    chosen = np.empty(threshold, dtype=int)
+    chosen[0], chosen[-1] = 0, length - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_stop = edges[bucket + 2] if bucket + 2 < len(edges) else length
+        next_x = x[stop:next_stop].mean()
+        next_y = y[stop:next_stop].mean()
+        areas = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                       - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        chosen[bucket + 1] = previous
+    return x[chosen], y[chosen]
+
+
+def draw_price_chart(x, y, title, ylabel, max_points=MAX_POINTS):
+    """Draw a price trend and return the PNG image as bytes."""
+    x, y = lttb(x, y, max_points)
+    fig = Figure()
+    ax = fig.subplots()
+    ax.plot(x, y, marker='o' if len(x) <= 100 else None, linestyle='-')
+    ax.set_title(title)
+    ax.set_xlabel("Year")
+    ax.set_ylabel(ylabel)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    # Drop the figure's artists now rather than waiting for the collector.
+    fig.clear()
+    return buffer.getvalue()
+
+
+def draw_correlation_heatmap(matrix, title):
+    """Draw a commodities x commodities correlation frame as a heatmap and
+    return the PNG image as bytes."""
+    size = max(6, min(24, 0.18 * len(matrix)))
+    fig = Figure(figsize=(size + 1.5, size))
+    ax = fig.subplots()
+    image = ax.imshow(matrix.to_numpy(), cmap='RdBu_r', vmin=-1, vmax=1)
+    ax.set_xticks(range(len(matrix.columns)), matrix.columns, rotation=90, fontsize=6)
+    ax.set_yticks(range(len(matrix.index)), matrix.index, fontsize=6)
+    ax.set_title(title)
+    fig.colorbar(image, ax=ax, label="Correlation")
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    fig.clear()
+    return buffer.getvalue()
@@ -0,0 +1,175 @@
+"""Mergeable summary statistics for price columns.
+
+PriceAccumulator keeps the numbers that pandas' Series.describe() reports
+(count, mean, std, min, quartiles, max) without holding on to the values:
+mean and variance are tracked with Welford's method and the quartiles come
+from a small KLL-style quantile sketch. Accumulators can be updated one
+chunk at a time, merged with each other (across chunks, files or
+processes) and serialized to plain JSON-compatible dicts, so statistics
+computed once per commodity can be stored and combined later without
+rescanning any rows.
+"""
+import numpy as np
+import pandas as pd
+
+DESCRIBE_INDEX = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+
+
+class QuantileSketch:
+    """A mergeable quantile sketch (a simplified KLL sketch).
+
+    Values are kept in levels; an item on level h stands for 2**h original
+    values. When a level holds more than k items it is sorted and every
+    other item is promoted to the next level. Until the first compaction
+    the sketch holds every value and its quantiles are exact.
+    """
+
+    def __init__(self, k=2048):
+        self.k = k
+        self.levels = [np.empty(0)]
+        # Alternate which half survives a compaction so the rank error of
+        # successive compactions cancels out instead of drifting one way.
+        self._offsets = [0]
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self._compress()
+
+    def merge(self, other):
+        for height, items in enumerate(other.levels):
+            if height == len(self.levels):
+                self.levels.append(np.empty(0))
+                self._offsets.append(0)
+            self.levels[height] = np.concatenate((self.levels[height], items))
+        self._compress()
+
+    def _compress(self):
+        height = 0
+        while height < len(self.levels):
+            items = self.levels[height]
+            if len(items) > self.k:
+                if height + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                    self._offsets.append(0)
+                items = np.sort(items)
+                # An odd item out stays behind so no weight is lost.
+                if len(items) % 2:
+                    kept, items = items[-1:], items[:-1]
+                else:
+                    kept = items[:0]
+                offset = self._offsets[height]
+                self._offsets[height] = 1 - offset
+                self.levels[height] = kept
+                self.levels[height + 1] = np.concatenate((self.levels[height + 1], items[offset::2]))
+            height += 1
+
+    def to_dict(self):
+        return {'k': self.k, 'levels': [items.tolist() for items in self.levels],
+                'offsets': list(self._offsets)}
+
+    @classmethod
+    def from_dict(cls, state):
+        sketch = cls(state['k'])
+        sketch.levels = [np.asarray(items, dtype=np.float64) for items in state['levels']]
+        sketch._offsets = list(state['offsets'])
+        return sketch
+
+    def quantiles(self, qs):
+        """Return the values at the fractions qs. Exact (with the same
+        linear interpolation as pandas) while nothing has been compacted."""
+        if len(self.levels) == 1:
+            if len(self.levels[0]) == 0:
+                return [np.nan for _ in qs]
+            return list(np.quantile(self.levels[0], qs))
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** height)
+                                  for height, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        values = values[order]
+        cumulative = np.cumsum(weights[order])
+        total = cumulative[-1]
+        positions = np.searchsorted(cumulative, np.asarray(qs) * total, side='left')
+        return list(values[np.minimum(positions, len(values) - 1)])
+
+
+class PriceAccumulator:
+    """Running count, mean, variance, min, max and quartiles of prices."""
+
+    def __init__(self, k=2048):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.sketch = QuantileSketch(k)
+
+    @classmethod
+    def from_values(cls, values, k=2048):
+        return cls(k).update(values)
+
+    @classmethod
+    def merge_all(cls, accumulators, k=2048):
+        """Return a new accumulator combining every accumulator given."""
+        total = cls(k)
+        for accumulator in accumulators:
+            total.merge(accumulator)
+        return total
+
+    def update(self, values):
+        """Add an array of values; missing values are ignored like describe() does."""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        chunk_mean = values.mean()
+        chunk_m2 = ((values - chunk_mean) ** 2).sum()
+        self._combine(len(values), chunk_mean, chunk_m2, values.min(), values.max())
+        self.sketch.update(values)
+        return self
+
+    def merge(self, other):
+        """Fold another accumulator into this one and return self."""
+        if other.count:
+            self._combine(other.count, other.mean, other.m2, other.min, other.max)
+            self.sketch.merge(other.sketch)
+        return self
+
+    def _combine(self, count, mean, m2, low, high):
+        # Chan et al.'s pairwise update of Welford's running mean and M2.
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.min = min(self.min, low)
+        self.max = max(self.max, high)
+
+    def to_dict(self):
+        """Return the state as a dict of plain numbers and lists (JSON-safe)."""
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2,
+                'min': None if self.count == 0 else self.min,
+                'max': None if self.count == 0 else self.max,
+                'sketch': self.sketch.to_dict()}
+
+    @classmethod
+    def from_dict(cls, state):
+        accumulator = cls(state['sketch']['k'])
+        accumulator.count = state['count']
+        accumulator.mean = state['mean']
+        accumulator.m2 = state['m2']
+        if state['count']:
+            accumulator.min = state['min']
+            accumulator.max = state['max']
+        accumulator.sketch = QuantileSketch.from_dict(state['sketch'])
+        return accumulator
+
+    def describe(self, name='price'):
+        """Return the statistics as a Series shaped like Series.describe()."""
+        if self.count == 0:
+            values = [0.0] + [np.nan] * 7
+        else:
+            std = np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+            values = [float(self.count), self.mean, std, self.min,
+                      *self.sketch.quantiles([0.25, 0.5, 0.75]), self.max]
+        return pd.Series(values, index=DESCRIBE_INDEX, name=name, dtype=np.float64)
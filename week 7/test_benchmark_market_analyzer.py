@@ -0,0 +1,136 @@
+"""Benchmark suite for the market analyzer data path.
+
+Every stage (CSV parse, cache load, indexing, commodity filter,
+statistics, chart rendering) is timed (best of a few runs) and its peak
+memory is traced on synthetic data in the FAO schema. The results are
+compared with the baselines in benchmark_baselines.json, and a stage that
+is more than TIME_TOLERANCE times slower, or needs more than
+MEMORY_TOLERANCE times the memory, fails.
+
+The baselines are wall-clock times of one machine, so the suite only
+runs when asked for; a plain pytest run skips it.
+
+    MARKET_BENCH=1                             run the benchmarks
+    MARKET_BENCH_SIZES=10000,1000000,10000000  rows to run (default: 10000)
+    MARKET_BENCH_UPDATE=1                      record new baselines instead
+                                               (implies MARKET_BENCH=1)
+
+tracemalloc only sees allocations made through Python and NumPy, not
+pyarrow's memory pool or memory-mapped files, so the read_cache stage
+is timed but its memory is not checked.
+"""
+import json
+import os
+import time
+import tracemalloc
+import pytest
+from os import path
+
+from benchmark_market_analyzer import make_synthetic_csv
+from market_data import read_market_data, calculate_statistics, statistics_table, CommodityIndex
+from market_data import render_price_trends, ANNUAL
+
+BASELINE_FILE = path.join(path.dirname(path.abspath(__file__)), "benchmark_baselines.json")
+SIZES = [int(size) for size in os.environ.get("MARKET_BENCH_SIZES", "10000").split(",")]
+UPDATE = os.environ.get("MARKET_BENCH_UPDATE") == "1"
+pytestmark = pytest.mark.skipif(not UPDATE and os.environ.get("MARKET_BENCH") != "1",
+                                reason="benchmarks run only with MARKET_BENCH=1")
+# Timings vary between machines and runs; these leave room for that noise.
+TIME_TOLERANCE = 3.0
+TIME_SLACK = 0.005
+MEMORY_TOLERANCE = 1.5
+MEMORY_SLACK = 1024 * 1024
+REPEAT = 3
+LCU = 'Producer Price (LCU/tonne)'
+
+STAGES = ['read_csv', 'read_cache', 'index', 'filter_mask', 'filter_index',
+          'statistics', 'statistics_table', 'plot']
+# Stages whose memory tracemalloc cannot see (see the module docstring).
+UNTRACED_STAGES = {'read_cache'}
+
+
+@pytest.fixture(scope="module")
+def baselines():
+    try:
+        with open(BASELINE_FILE, "r", encoding="utf-8") as file:
+            stored = json.load(file)
+    except FileNotFoundError:
+        stored = {}
+    yield stored
+    if UPDATE:
+        with open(BASELINE_FILE, "w", encoding="utf-8") as file:
+            json.dump(stored, file, indent=2, sort_keys=True)
+            file.write("\n")
+
+
+@pytest.fixture(scope="module", params=SIZES, ids=lambda rows: f"{rows}rows")
+def dataset(request, tmp_path_factory):
+    """Prepare the synthetic CSV, its cache, the frame and the index for one size."""
+    directory = tmp_path_factory.mktemp(f"bench{request.param}")
+    csv_file = make_synthetic_csv(str(directory / "prices.csv"), request.param)
+    cache_dir = str(directory / "cache")
+    data = read_market_data(csv_file, cache_dir=cache_dir)
+    index = CommodityIndex(data)
+    country, commodity = index.countries[-1], 'Rice'
+    return {'rows': request.param, 'csv': csv_file, 'cache_dir': cache_dir, 'data': data,
+            'index': index, 'country': country, 'commodity': commodity,
+            'series': index.series(commodity, country, LCU, ANNUAL)}
+
+
+def stage_function(stage, d):
+    """Return a no-argument callable that runs one stage on dataset d."""
+    index, data = d['index'], d['data']
+    return {
+        'read_csv': lambda: read_market_data(d['csv'], use_cache=False),
+        'read_cache': lambda: read_market_data(d['csv'], cache_dir=d['cache_dir']),
+        'index': lambda: CommodityIndex(data),
+        'filter_mask': lambda: data[(data['Iso3'] == d['country']) & (data['commodity'] == d['commodity'])],
+        'filter_index': lambda: index.select(d['commodity'], d['country']),
+        'statistics': lambda: calculate_statistics(index.select(d['commodity'], d['country'])),
+        'statistics_table': lambda: statistics_table(index.data),
+        'plot': lambda: render_price_trends(d['series'], d['commodity']),
+    }[stage]
+
+
+def measure(func, trace=True):
+    """Return (best wall time in seconds, peak traced bytes) of func();
+    the peak is None unless trace is true."""
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    if not trace:
+        return best, None
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+@pytest.mark.parametrize("stage", STAGES)
+def test_stage(stage, dataset, baselines):
+    """Time one stage and compare it with its stored baseline."""
+    seconds, peak = measure(stage_function(stage, dataset), trace=stage not in UNTRACED_STAGES)
+    key = f"{stage}@{dataset['rows']}"
+    print(f"{key}: {seconds * 1000:.3f} ms" + ("" if peak is None else f", peak {peak / 2**20:.2f} MB"))
+    if UPDATE:
+        baselines[key] = {'seconds': seconds} if peak is None else {'seconds': seconds, 'peak_bytes': peak}
+        return
+    if key not in baselines:
+        pytest.skip(f"no baseline for {key}; run with MARKET_BENCH_UPDATE=1 to record one")
+    baseline = baselines[key]
+    assert seconds <= baseline['seconds'] * TIME_TOLERANCE + TIME_SLACK, \
+        f"{key} took {seconds:.4f} s; baseline is {baseline['seconds']:.4f} s"
+    if peak is None:
+        return
+    assert peak <= baseline['peak_bytes'] * MEMORY_TOLERANCE + MEMORY_SLACK, \
+        f"{key} peaked at {peak} bytes; baseline is {baseline['peak_bytes']} bytes"
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("MARKET_BENCH", "1")
+    pytest.main(["-v", "-s", "--tb=line", "-rN", __file__])
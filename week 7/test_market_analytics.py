@@ -0,0 +1,153 @@
+import os
+import shutil
+import pytest
+import numpy as np
+import pandas as pd
+from os import path
+from market_data import read_market_data, CommodityIndex
+from market_analytics import (yoy_change, rolling_statistics, real_prices, cagr,
+                              compute_analytics, get_analytics, INDEX_ELEMENT,
+                              price_matrix, CorrelationAccumulator, get_correlation_matrix,
+                              get_correlation_heatmap, _correlation_state)
+
+CSV_FILE = path.join(path.dirname(__file__), "producer-prices-nga.csv")
+LCU = 'Producer Price (LCU/tonne)'
+
+@pytest.fixture(scope="module")
+def data():
+    return CommodityIndex(read_market_data(CSV_FILE, use_cache=False)).data
+
+def annual_series(data, commodity, element=LCU):
+    rows = data[(data['commodity'] == commodity) & (data['Element'] == element) & (data['period'] == 'Annual')]
+    return rows.set_index('date')['price'].astype(np.float64)
+
+def test_yoy_change(data):
+    """Test year-over-year change against a per-series loop."""
+    change = yoy_change(data)
+    prices = annual_series(data, 'Rice')
+    rows = data[(data['commodity'] == 'Rice') & (data['Element'] == LCU) & (data['period'] == 'Annual')]
+    for row_index, year in zip(rows.index, rows['date']):
+        if year - 1 in prices.index:
+            assert change[row_index] == pytest.approx(prices[year] / prices[year - 1] - 1)
+        else:
+            assert np.isnan(change[row_index])
+
+def test_yoy_change_skips_gaps():
+    """Test that a missing year gives NaN instead of a multi-year change."""
+    frame = pd.DataFrame({'Iso3': 'NGA', 'commodity': 'Rice', 'Element': LCU,
+                          'date': [2000, 2001, 2003], 'price': [100.0, 110.0, 121.0]})
+    assert yoy_change(frame).tolist()[1] == pytest.approx(0.1)
+    assert np.isnan(yoy_change(frame).tolist()[2])
+
+def test_rolling_statistics(data):
+    """Test the rolling mean against pandas on a single series."""
+    result = rolling_statistics(data, window=3)
+    rows = data[(data['commodity'] == 'Rice') & (data['Element'] == LCU) & (data['period'] == 'Annual')]
+    expected = rows['price'].astype(np.float64).rolling(3, min_periods=1).mean()
+    assert result.loc[rows.index, 'rolling_mean'].to_numpy() == pytest.approx(expected.to_numpy())
+    assert result['rolling_volatility'].notna().any()
+
+def test_real_prices(data):
+    """Test that prices are deflated by the Agriculture price index."""
+    real = real_prices(data)
+    deflator = annual_series(data, 'Agriculture', INDEX_ELEMENT)
+    rows = data[(data['commodity'] == 'Rice') & (data['Element'] == LCU) & (data['period'] == 'Annual')]
+    for row_index, year, price in zip(rows.index, rows['date'], rows['price']):
+        if year in deflator.index:
+            assert real[row_index] == pytest.approx(price / deflator[year] * 100)
+    assert real[data['Element'] == INDEX_ELEMENT].isna().all()
+
+def test_cagr(data):
+    """Test the compound annual growth rate of one series."""
+    growth = cagr(data, 2000, 2010)
+    prices = annual_series(data, 'Rice')
+    expected = (prices[2010] / prices[2000]) ** (1 / 10) - 1
+    assert growth[('NGA', 'Rice', LCU, 'Annual')] == pytest.approx(expected)
+    with pytest.raises(ValueError):
+        cagr(data, 2010, 2000)
+    assert cagr(data, 1800, 1801).empty
+
+def test_get_analytics_is_cached():
+    """Test that analytics are aligned with the index and computed once."""
+    directory = path.dirname(path.abspath(__file__))
+    analytics = get_analytics(directory)
+    assert get_analytics(directory) is analytics
+    assert list(analytics.columns) == ['yoy_change', 'rolling_mean', 'rolling_volatility', 'real_price']
+    pd.testing.assert_frame_equal(analytics, compute_analytics(CommodityIndex(
+        read_market_data(CSV_FILE)).data))
+
+def pandas_correlation(matrix):
+    """DataFrame.corr() with plain string labels, sorted like the accumulator's result."""
+    expected = matrix.corr(min_periods=3)
+    expected.index = expected.index.astype(str)
+    expected.columns = expected.columns.astype(str)
+    return expected.sort_index().sort_index(axis=1)
+
+def test_correlation_matches_pandas(data):
+    """Test the one-pass and the year-by-year correlation against DataFrame.corr()."""
+    matrix = price_matrix(data, 'NGA', LCU)
+    expected = pandas_correlation(matrix)
+    actual = CorrelationAccumulator().update(matrix).correlation()
+    pd.testing.assert_frame_equal(actual, expected, check_names=False, atol=1e-9)
+    incremental = CorrelationAccumulator()
+    for year in matrix.index:
+        incremental.update(matrix.loc[[year]])
+    pd.testing.assert_frame_equal(incremental.correlation(), expected, check_names=False, atol=1e-9)
+    with pytest.raises(ValueError):
+        incremental.update(matrix.iloc[:1])
+
+def test_correlation_incremental_append(tmp_path, monkeypatch):
+    """Test that appending a year to the file updates the cached matrix in place."""
+    with open(CSV_FILE, "r", encoding="utf-8") as file:
+        lines = file.readlines()
+    body = [line for line in lines[2:] if ",2022," not in line]
+    year_2022 = [line for line in lines[2:] if ",2022," in line]
+    csv_copy = tmp_path / "producer-prices-nga.csv"
+    csv_copy.write_text("".join(lines[:2] + body), encoding="utf-8")
+    first = get_correlation_matrix(csv_copy, 'NGA', LCU)
+
+    updates = []
+    original_update = CorrelationAccumulator.update
+    monkeypatch.setattr(CorrelationAccumulator, "update",
+                        lambda self, matrix: updates.append(list(matrix.index)) or original_update(self, matrix))
+    csv_copy.write_text("".join(lines[:2] + body + year_2022), encoding="utf-8")
+    os.utime(csv_copy, ns=(0, os.stat(csv_copy).st_mtime_ns + 1))
+    second = get_correlation_matrix(csv_copy, 'NGA', LCU)
+    assert updates == [[2022.0]], "Only the appended year should be added."
+    full = CommodityIndex(read_market_data(csv_copy)).data
+    expected = pandas_correlation(price_matrix(full, 'NGA', LCU))
+    pd.testing.assert_frame_equal(second, expected, check_names=False, atol=1e-9)
+    assert not second.equals(first)
+
+def test_correlation_survives_a_new_country_file(tmp_path, monkeypatch):
+    """Test that adding another country's file to a directory source keeps
+    the accumulator instead of rebuilding it."""
+    shutil.copy(CSV_FILE, tmp_path / "producer-prices-nga.csv")
+    first = get_correlation_matrix(tmp_path, 'NGA', LCU)
+    updates = []
+    original_update = CorrelationAccumulator.update
+    monkeypatch.setattr(CorrelationAccumulator, "update",
+                        lambda self, matrix: updates.append(len(matrix)) or original_update(self, matrix))
+    text = (tmp_path / "producer-prices-nga.csv").read_text(encoding="utf-8")
+    (tmp_path / "producer-prices-gha.csv").write_text(
+        text.replace("NGA,", "GHA,").replace(",Nigeria,", ",Ghana,"), encoding="utf-8")
+    second = get_correlation_matrix(tmp_path, 'NGA', LCU)
+    assert updates == [], "The NGA matrix did not change, so nothing should be rebuilt."
+    pd.testing.assert_frame_equal(second, first)
+
+def test_correlation_state_is_bounded(monkeypatch):
+    """Test that only the most recently used accumulators are kept."""
+    monkeypatch.setattr("market_analytics.CORRELATION_STATE_SIZE", 2)
+    source = path.dirname(path.abspath(__file__))
+    elements = [LCU, 'Producer Price (USD/tonne)', INDEX_ELEMENT]
+    for element in elements:
+        get_correlation_matrix(source, 'NGA', element)
+    assert [key[2] for key in _correlation_state] == elements[1:]
+
+def test_correlation_heatmap():
+    """Test that the heatmap renders to PNG."""
+    png = get_correlation_heatmap(path.dirname(path.abspath(__file__)), 'NGA', LCU)
+    assert png.startswith(b"\x89PNG")
+
+if __name__ == "__main__":
+    pytest.main(["-v", "--tb=line", "-rN", __file__])
@@ -1,7 +1,16 @@
 import pytest
+import os
+import subprocess
+import sys
+import shutil
+import numpy as np
 import pandas as pd
 from os import path
-from market_analyzer import read_market_data, calculate_statistics
+from market_analyzer import read_market_data, calculate_statistics, cache_path_for
+from market_analyzer import get_market_data, get_commodities, get_statistics, clear_caches
+from market_analyzer import CommodityIndex, read_market_files, get_countries
+from market_analyzer import stream_market_statistics, statistics_table
+from market_data import _cached_index, _cached_statistics
 
 CSV_FILE = path.join(path.dirname(__file__), "producer-prices-nga.csv")
 
@@ -14,6 +23,28 @@ def test_read_market_data():
     for col in expected_cols:
         assert col in df.columns, f"Missing column: {col}"
 
+def test_read_market_data_schema():
+    """Test that the loading schema keeps only compact columns."""
+    df = read_market_data(CSV_FILE, use_cache=False)
+    assert 'StartDate' not in df.columns and 'Year Code' not in df.columns
+    for col in ['Iso3', 'Area', 'commodity', 'Element', 'Months', 'unit', 'Flag']:
+        assert isinstance(df[col].dtype, pd.CategoricalDtype), f"{col} should be categorical."
+    assert df['date'].dtype == 'int16'
+    assert df['price'].dtype == 'float32'
+    raw = pd.read_csv(CSV_FILE, skiprows=[1])
+    assert len(df) == len(raw)
+    assert df['price'].to_numpy() == pytest.approx(raw['Value'].to_numpy(), rel=1e-6, nan_ok=True)
+    assert df.memory_usage(deep=True).sum() < raw.memory_usage(deep=True).sum() / 4
+
+def test_downcast_keeps_unsafe_values():
+    """Test that columns which do not fit the compact dtypes are left alone."""
+    from market_data import downcast_years, downcast_prices
+    years = pd.Series([1991, None])
+    assert downcast_years(years).dtype == years.dtype
+    prices = pd.Series([1.0, 1e300])
+    assert downcast_prices(prices).dtype == 'float64'
+    assert downcast_prices(pd.Series([1.5, None])).dtype == 'float32'
+
 def test_calculate_statistics():
     """Test that statistics are calculated correctly."""
     df = read_market_data(CSV_FILE)
@@ -22,6 +53,11 @@ def test_calculate_statistics():
     assert isinstance(stats, pd.Series), "calculate_statistics must return a pandas Series."
     assert 'count' in stats.index and 'mean' in stats.index, "Statistics must include count and mean."
     assert stats['count'] == 3, f"Expected 3 rows, got {stats['count']}."
+    # On more rows than the streaming sketch holds the quartiles stay exact.
+    full = calculate_statistics(df)
+    assert len(df) > 2048
+    pd.testing.assert_series_equal(full, df['price'].astype(np.float64).describe(),
+                                   check_names=False, rtol=1e-9)
 
 def test_missing_price_column():
     """Test that function handles missing 'price' column properly."""
@@ -30,5 +66,225 @@ def test_missing_price_column():
     assert isinstance(stats, pd.DataFrame), "When 'price' is missing, must return an empty DataFrame."
     assert stats.empty, "Expected empty DataFrame when 'price' column is missing."
 
+def test_read_market_data_cache(tmp_path):
+    """Test that a warm load comes from the cache and matches the CSV parse."""
+    csv_copy = tmp_path / "prices.csv"
+    shutil.copy(CSV_FILE, csv_copy)
+    cache_dir = tmp_path / "cache"
+    cold = read_market_data(csv_copy, cache_dir=cache_dir)
+    cache_file = cache_path_for(csv_copy, cache_dir)
+    assert path.exists(cache_file), "The first load should write the cache file."
+    warm = read_market_data(csv_copy, cache_dir=cache_dir)
+    pd.testing.assert_frame_equal(cold, warm)
+
+    # Changing the CSV must invalidate the old cache entry.
+    with open(csv_copy, "a", encoding="utf-8") as file:
+        file.write("NGA,2099-01-01,2099-12-31,159,'566,Nigeria,426,'01251,Carrots and turnips,"
+                   "5530,Producer Price (LCU/tonne),2099,2099,7021,Annual value,LCU,1.0,I\n")
+    os.utime(csv_copy, ns=(0, os.stat(csv_copy).st_mtime_ns + 1))
+    updated = read_market_data(csv_copy, cache_dir=cache_dir)
+    assert len(updated) == len(cold) + 1
+    assert not path.exists(cache_file), "Stale cache files should be removed."
+    assert len(os.listdir(cache_dir)) == 1
+
+def test_cache_files_of_other_csvs_are_kept(tmp_path):
+    """Test that writing one CSV's cache does not remove another CSV's cache
+    in the same cache directory, even when one stem starts with the other."""
+    cache_dir = tmp_path / "cache"
+    sources = [tmp_path / "producer-prices-nga.csv", tmp_path / "producer-prices-nga-2023.csv",
+               tmp_path / "other" / "producer-prices-nga.csv"]
+    for source in sources:
+        source.parent.mkdir(exist_ok=True)
+        shutil.copy(CSV_FILE, source)
+        read_market_data(source, cache_dir=cache_dir)
+    for source in sources:
+        assert path.exists(cache_path_for(source, cache_dir)), f"cache for {source} was removed"
+    assert len(os.listdir(cache_dir)) == len(sources)
+
+def test_read_market_data_missing_file(tmp_path):
+    """Test that a missing file returns None rather than raising."""
+    assert read_market_data(tmp_path / "missing.csv", cache_dir=tmp_path) is None
+
+def test_memoized_data_layer(tmp_path):
+    """Test that repeated lookups are served from memory until the file changes."""
+    clear_caches()
+    csv_copy = tmp_path / "prices.csv"
+    shutil.copy(CSV_FILE, csv_copy)
+    first = get_market_data(csv_copy)
+    assert get_market_data(csv_copy) is first, "A second call should reuse the cached frame."
+    commodities = get_commodities(csv_copy)
+    assert list(commodities) == sorted(first['commodity'].unique())
+    stats = get_statistics(csv_copy, commodities[0])
+    expected = calculate_statistics(first[first['commodity'] == commodities[0]])
+    pd.testing.assert_series_equal(stats, expected, check_index=False)
+    assert get_statistics(csv_copy, commodities[0]) is stats
+
+    os.utime(csv_copy, ns=(0, os.stat(csv_copy).st_mtime_ns + 1))
+    assert get_market_data(csv_copy) is not first, "Touching the file should invalidate the cache."
+    # The entries of the old version are dropped, not left to age out.
+    assert _cached_index.cache_info().currsize == 1
+    assert _cached_statistics.cache_info().currsize == 0
+    assert get_market_data(tmp_path / "missing.csv") is None
+
+def test_memoized_directory_source(tmp_path):
+    """Test that adding a country file to a directory source drops the
+    cached entries of the old file set."""
+    clear_caches()
+    shutil.copy(CSV_FILE, tmp_path / "producer-prices-nga.csv")
+    first = get_market_data(tmp_path)
+    get_statistics(tmp_path, 'Rice', 'NGA')
+    write_country_copy(tmp_path, "GHA", "Ghana")
+    assert get_countries(tmp_path) == ('GHA', 'NGA')
+    assert _cached_index.cache_info().currsize == 1
+    assert _cached_statistics.cache_info().currsize == 0
+    assert get_market_data(tmp_path) is not first
+
+def test_commodity_index():
+    """Test that index lookups return the same rows as a boolean mask."""
+    df = read_market_data(CSV_FILE, use_cache=False)
+    index = CommodityIndex(df)
+    assert list(index.names) == sorted(df['commodity'].unique())
+    order = ['Element', 'date', 'Months']
+    for name in index.names:
+        expected = df[df['commodity'] == name].sort_values(order).reset_index(drop=True)
+        actual = index.select(name)[df.columns].sort_values(order).reset_index(drop=True)
+        pd.testing.assert_frame_equal(actual, expected)
+    assert index.select("Not a commodity").empty
+
+def test_commodity_index_missing_names():
+    """Test that rows without a commodity are left out of every slice."""
+    df = pd.DataFrame({'commodity': ['Rice', None, 'Beans', 'Rice'], 'price': [1.0, 2.0, 3.0, 4.0]})
+    index = CommodityIndex(df)
+    assert index.names == ('Beans', 'Rice')
+    assert list(index.select('Rice')['price']) == [1.0, 4.0]
+    assert list(index.select('Beans')['price']) == [3.0]
+
+def write_country_copy(directory, iso3, area):
+    """Write a copy of the Nigeria file relabelled as another country."""
+    with open(CSV_FILE, "r", encoding="utf-8") as file:
+        text = file.read()
+    text = text.replace("NGA,", f"{iso3},").replace(",Nigeria,", f",{area},")
+    filename = directory / f"producer-prices-{iso3.lower()}.csv"
+    filename.write_text(text, encoding="utf-8")
+    return filename
+
+def test_read_market_files(tmp_path):
+    """Test that a directory of country files loads into one indexed frame."""
+    shutil.copy(CSV_FILE, tmp_path / "producer-prices-nga.csv")
+    write_country_copy(tmp_path, "GHA", "Ghana")
+    single = read_market_data(CSV_FILE, use_cache=False)
+    combined = read_market_files(tmp_path, workers=2)
+    assert len(combined) == 2 * len(single)
+    assert isinstance(combined['commodity'].dtype, pd.CategoricalDtype)
+    assert set(combined['Iso3']) == {'NGA', 'GHA'}
+
+    index = CommodityIndex(combined)
+    assert index.countries == ('GHA', 'NGA')
+    assert index.country_names == {'GHA': 'Ghana', 'NGA': 'Nigeria'}
+    assert index.commodities('GHA') == index.commodities('NGA') == index.names
+    rice = index.select('Rice', 'GHA')
+    assert len(rice) == (single['commodity'] == 'Rice').sum()
+    assert set(rice['Iso3']) == {'GHA'}
+    assert len(index.select('Rice')) == 2 * len(rice)
+
+    clear_caches()
+    assert get_countries(tmp_path) == ('GHA', 'NGA')
+    assert get_countries(str(tmp_path / "producer-prices-n*.csv")) == ('NGA',)
+    assert get_market_data(tmp_path / "empty-dir-*.csv") is None
+
+def test_header_only_file(tmp_path):
+    """Test that a file without data rows loads and indexes to empty results."""
+    with open(CSV_FILE, "r", encoding="utf-8") as file:
+        header = [next(file), next(file)]
+    empty_csv = tmp_path / "prices.csv"
+    empty_csv.write_text("".join(header), encoding="utf-8")
+    data = read_market_data(empty_csv, use_cache=False)
+    table = statistics_table(data)
+    assert table.empty
+    assert list(table.columns) == ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+    index = CommodityIndex(data)
+    assert index.names == () and index.commodity_statistics('Rice', 'NGA').empty
+
+def test_stream_market_statistics():
+    """Test that streaming statistics agree with statistics on the loaded frame."""
+    df = read_market_data(CSV_FILE, use_cache=False)
+    df = CommodityIndex(df).data
+    results = stream_market_statistics(CSV_FILE, commodities=['Rice', 'Maize (corn)'], chunksize=500)
+    assert {commodity for _, commodity, _, _ in results} == {'Rice', 'Maize (corn)'}
+    assert {period for _, _, _, period in results} == {'Annual', 'Monthly'}
+    for (iso3, commodity, element, period), acc in results.items():
+        rows = df[(df['Iso3'] == iso3) & (df['commodity'] == commodity) & (df['Element'] == element)
+                  & (df['period'] == period)]
+        expected = calculate_statistics(rows)
+        pd.testing.assert_series_equal(acc.describe(), expected, rtol=1e-6)
+    lcu = stream_market_statistics(CSV_FILE, elements=['Producer Price (LCU/tonne)'])
+    assert {element for _, _, element, _ in lcu} == {'Producer Price (LCU/tonne)'}
+
+def test_statistics_table():
+    """Test that the grouped statistics table matches per-group calculate_statistics."""
+    df = read_market_data(CSV_FILE, use_cache=False)
+    table = statistics_table(df)
+    assert list(table.columns) == ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+    assert table['count'].sum() == df['price'].notna().sum()
+    for (iso3, commodity, element), row in table.sample(20, random_state=0).iterrows():
+        rows = df[(df['Iso3'] == iso3) & (df['commodity'] == commodity) & (df['Element'] == element)]
+        expected = calculate_statistics(rows)
+        assert row.to_numpy() == pytest.approx(expected.to_numpy(), rel=1e-9, nan_ok=True)
+
+    index = CommodityIndex(df)
+    rice = index.commodity_statistics('Rice', 'NGA')
+    assert len(rice) == len(index.series_keys('Rice', 'NGA'))
+    assert index.commodity_statistics('Not a commodity', 'NGA').empty
+
+def test_series_separation():
+    """Test that each commodity is split into one series per Element and period."""
+    df = read_market_data(CSV_FILE, use_cache=False)
+    index = CommodityIndex(df)
+    cassava = df[df['commodity'] == 'Cassava, fresh']
+    keys = index.series_keys('Cassava, fresh', 'NGA')
+    assert ('Producer Price (LCU/tonne)', 'Monthly') in keys
+    assert len(keys) == cassava.groupby(['Element', cassava['Months'] == 'Annual value'], observed=True).ngroups
+    assert sum(len(index.series('Cassava, fresh', 'NGA', *key)) for key in keys) == len(cassava)
+
+    usd = index.series('Cassava, fresh', 'NGA', 'Producer Price (USD/tonne)')
+    assert set(usd['Element']) == {'Producer Price (USD/tonne)'}
+    assert set(usd['Months']) == {'Annual value'}
+    times, prices = index.series_arrays('Cassava, fresh', 'NGA', 'Producer Price (LCU/tonne)', 'Monthly')
+    assert (np.diff(times) > 0).all(), "Series should be in time order."
+    assert len(times) == len(prices) > 0
+    stats = index.series_statistics('Cassava, fresh', 'NGA', 'Producer Price (USD/tonne)')
+    assert stats['count'] == len(usd)
+    assert index.series('Cassava, fresh', 'NGA', 'Not an element').empty
+
+def test_import_does_not_load_ui_stack():
+    """Benchmark the import time of the data path and check that it stays
+    free of the Streamlit and matplotlib imports (python -X importtime)."""
+    code = ("import sys, market_analyzer; "
+            "print(sorted({m.split('.')[0] for m in sys.modules} & {'streamlit', 'matplotlib'}))")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=path.dirname(path.abspath(__file__)),
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]", f"Heavy modules imported: {result.stdout.strip()}"
+    # Each -X importtime line is "import time: self [us] | cumulative | name".
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if line.startswith("import time:") and len(parts) == 3 and parts[1].strip().isdigit():
+            cumulative[parts[2].strip()] = int(parts[1])
+    own = cumulative['market_analyzer'] - cumulative['pandas'] - cumulative.get('numpy', 0)
+    assert own < 500_000, f"market_analyzer took {own} us to import on top of pandas and numpy."
+
+def test_heatmap_is_drawn_only_on_request(monkeypatch):
+    """Test that the first render of the dashboard skips the correlation
+    heatmap, and that the toggle draws it."""
+    from streamlit.testing.v1 import AppTest
+    monkeypatch.setenv("MARKET_DATA", path.dirname(path.abspath(__file__)))
+    app = AppTest.from_file(path.join(path.dirname(path.abspath(__file__)), "market_analyzer.py"),
+                            default_timeout=120).run()
+    assert not app.exception
+    assert len(app.image) == 1, "Only the price chart should be drawn at first."
+    app.toggle[0].set_value(True).run()
+    assert not app.exception and len(app.image) == 2
+
 if __name__ == "__main__":
     pytest.main(["-v", "--tb=line", "-rN", __file__])
\ No newline at end of file
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import threading
+import pytest
+from os import path
+from urllib.parse import quote
+from market_api import MarketQueryService, start_server
+
+DATA_DIR = path.dirname(path.abspath(__file__))
+LCU = 'Producer Price (LCU/tonne)'
+
+@pytest.fixture(scope="module")
+def service():
+    return MarketQueryService(DATA_DIR)
+
+def get_json(service, target):
+    status, body, _ = service.response(target)
+    return status, json.loads(body)
+
+def test_endpoints(service):
+    """Test the JSON returned by each endpoint."""
+    assert get_json(service, "/countries") == (200, [{'iso3': 'NGA', 'name': 'Nigeria'}])
+    status, commodities = get_json(service, "/commodities")
+    assert status == 200 and 'Rice' in commodities
+    status, series = get_json(service, f"/series?commodity=Rice&element={quote(LCU)}")
+    assert status == 200 and len(series['time']) == len(series['price']) > 10
+    status, stats = get_json(service, f"/stats?commodity=Rice&element={quote(LCU)}")
+    assert status == 200
+    assert {entry['period'] for entry in stats['series']} == {'Annual', 'Monthly'}
+    annual = [entry for entry in stats['series'] if entry['period'] == 'Annual'][0]['statistics']
+    assert annual['count'] == len(series['time'])
+
+def test_errors(service):
+    """Test error statuses for bad queries."""
+    assert service.response("/nothing")[0] == 404
+    assert service.response("/stats")[0] == 400
+    assert service.response("/stats?commodity=Unobtainium")[0] == 404
+    assert service.response("/series?commodity=Rice")[0] == 400
+    assert service.response("/commodities?country=XXX")[0] == 404
+
+def test_response_cache(service):
+    """Test that repeated queries reuse the cached body and ETag."""
+    first = service.response("/stats?commodity=Rice")
+    assert service.response("/stats?commodity=Rice") is first
+
+def test_refresh_is_rate_limited_and_off_the_loop(tmp_path):
+    """Test that changed files are picked up, in a worker thread, at most
+    once per refresh interval."""
+    csv_copy = tmp_path / "producer-prices-nga.csv"
+    shutil.copy(path.join(DATA_DIR, "producer-prices-nga.csv"), csv_copy)
+    service = MarketQueryService(csv_copy, refresh_interval=3600)
+    index = service.index
+    threads = []
+    original_load = service._load
+    service._load = lambda: threads.append(threading.get_ident()) or original_load()
+    os.utime(csv_copy, ns=(0, os.stat(csv_copy).st_mtime_ns + 1))
+    asyncio.run(service.refresh_async())
+    assert service.index is index and threads == [], "Checked before the interval passed."
+    service.refresh_interval = 0
+    asyncio.run(service.refresh_async())
+    assert service.index is not index
+    assert threads and threads[0] != threading.get_ident()
+
+def test_http_keep_alive_and_etag(monkeypatch):
+    """Test the server over a real connection: keep-alive, If-None-Match
+    and errors."""
+    def broken(service, params):
+        raise RuntimeError("boom")
+    monkeypatch.setitem(MarketQueryService.ROUTES, '/broken', broken)
+    monkeypatch.setattr(logging.getLogger("market_analyzer.api"), "disabled", True)
+    async def scenario():
+        server = await start_server(DATA_DIR, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+        async def request(extra="", target="/commodities"):
+            writer.write(f"GET {target} HTTP/1.1\r\nHost: x\r\n{extra}\r\n".encode())
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            headers = {}
+            while (line := await reader.readline()) != b"\r\n":
+                name, _, value = line.decode().partition(":")
+                headers[name.lower()] = value.strip()
+            body = await reader.readexactly(int(headers["content-length"]))
+            return status, headers, body
+
+        try:
+            status, headers, body = await request()
+            assert status == 200 and 'Rice' in json.loads(body)
+            # The same connection serves a conditional request.
+            status, _, body = await request(f"If-None-Match: {headers['etag']}\r\n")
+            assert status == 304 and body == b""
+            # An unexpected error is a 500, and the connection stays usable.
+            status, _, body = await request(target="/broken")
+            assert status == 500 and json.loads(body) == {'error': 'internal server error'}
+            assert (await request())[0] == 200
+        finally:
+            writer.close()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(scenario())
+
+if __name__ == "__main__":
+    pytest.main(["-v", "--tb=line", "-rN", __file__])
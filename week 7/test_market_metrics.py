@@ -0,0 +1,76 @@
+import io
+import json
+import time
+import tracemalloc
+import pytest
+from market_metrics import StageTimer, stage_totals, reset_stage_totals, enable_log, logger
+
+def test_stage_timer_records_stages():
+    """Test that every stage is recorded in order with its time and memory change."""
+    reset_stage_totals()
+    timer = StageTimer()
+    with timer.stage("load"):
+        time.sleep(0.01)
+    with timer.stage("plot"):
+        pass
+    assert [record['stage'] for record in timer.stages] == ["load", "plot"]
+    assert timer.stages[0]['seconds'] >= 0.01
+    assert 'rss_delta' in timer.stages[0]
+    assert timer.total_seconds == pytest.approx(sum(r['seconds'] for r in timer.stages))
+    assert [row['stage'] for row in timer.table()] == ["load", "plot"]
+
+def test_stage_recorded_on_error():
+    """Test that a stage that raises is still recorded, and the error propagates."""
+    timer = StageTimer()
+    with pytest.raises(ValueError):
+        with timer.stage("load"):
+            raise ValueError("bad file")
+    assert timer.stages[0]['stage'] == "load"
+
+def test_stage_totals_accumulate():
+    """Test that the running totals add up the stages of several runs."""
+    reset_stage_totals()
+    for _ in range(3):
+        timer = StageTimer()
+        with timer.stage("filter"):
+            pass
+    totals = stage_totals()
+    assert totals["filter"]['count'] == 3
+    assert totals["filter"]['max_seconds'] <= totals["filter"]['total_seconds']
+
+def test_traced_allocations():
+    """Test that the peak allocation is recorded only while tracemalloc traces."""
+    timer = StageTimer()
+    with timer.stage("untraced"):
+        bytearray(1 << 20)
+    tracemalloc.start()
+    try:
+        with timer.stage("traced"):
+            bytearray(1 << 20)
+    finally:
+        tracemalloc.stop()
+    assert 'peak_allocated' not in timer.stages[0]
+    assert timer.stages[1]['peak_allocated'] >= 1 << 20
+
+def test_log_lines_are_json():
+    """Test that each stage is logged as one JSON line."""
+    stream = io.StringIO()
+    handlers = list(logger.handlers)
+    for handler in handlers:
+        logger.removeHandler(handler)
+    try:
+        enable_log(stream)
+        timer = StageTimer(run="test")
+        with timer.stage("stats"):
+            pass
+    finally:
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        for handler in handlers:
+            logger.addHandler(handler)
+    line = stream.getvalue().strip().splitlines()[-1]
+    record = json.loads(line[line.index("{"):])
+    assert record['event'] == "stage" and record['run'] == "test" and record['stage'] == "stats"
+
+if __name__ == "__main__":
+    pytest.main(["-v", "--tb=line", "-rN", __file__])
@@ -0,0 +1,41 @@
+import pytest
+import os
+from os import path
+from market_report import write_report, slugify, main
+
+CSV_FILE = path.join(path.dirname(__file__), "producer-prices-nga.csv")
+
+def test_write_report(tmp_path):
+    """Test that every commodity is rendered once and skipped when unchanged."""
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    # The first few commodities of the Nigeria file keep the test quick.
+    with open(CSV_FILE, "r", encoding="utf-8") as file:
+        lines = file.readlines()
+    rice_lines = [line for line in lines if ",Rice," in line]
+    (data_dir / "producer-prices-nga.csv").write_text("".join(lines[:600] + rice_lines), encoding="utf-8")
+    out = tmp_path / "report"
+    rendered, skipped = write_report(data_dir, out, workers=2)
+    assert rendered > 3 and skipped == 0
+    rice = out / "nga" / "rice"
+    assert (rice / "statistics.csv").exists()
+    assert (rice / "producer-price-usd-tonne-annual.png").exists()
+    assert len(os.listdir(out / "nga")) == rendered
+
+    assert write_report(data_dir, out) == (0, rendered)
+    # A changed commodity is the only one rendered again.
+    (rice / ".fingerprint").write_text("stale", encoding="utf-8")
+    assert write_report(data_dir, out, workers=1) == (1, rendered - 1)
+
+def test_report_cli(tmp_path, capsys):
+    """Test the command line entry point."""
+    assert main([str(tmp_path / "out"), "--data", str(tmp_path / "missing.csv")]) == 1
+    assert main([str(tmp_path / "out"), "--data", CSV_FILE, "--country", "XXX"]) == 0
+    assert "Rendered 0 commodities" in capsys.readouterr().out
+
+def test_slugify():
+    assert slugify("Producer Price Index (2014-2016 = 100)") == "producer-price-index-2014-2016-100"
+    assert slugify("Cashew nuts, in shell") == "cashew-nuts-in-shell"
+
+if __name__ == "__main__":
+    pytest.main(["-v", "--tb=line", "-rN", __file__])
@@ -0,0 +1,114 @@
+import pytest
+import numpy as np
+import pandas as pd
+from os import path
+from market_data import read_market_data, CommodityIndex, STATISTICS_KEYS
+from market_data import get_commodity_index, market_signature
+from market_report import write_report
+from market_store import MarketStore, get_store_index, row_hashes, main
+
+CSV_FILE = path.join(path.dirname(__file__), "producer-prices-nga.csv")
+
+def write_release(directory, name, transform=None):
+    """Write a copy of the Nigeria file, optionally with some lines changed."""
+    with open(CSV_FILE, "r", encoding="utf-8") as file:
+        lines = file.readlines()
+    if transform is not None:
+        lines = lines[:2] + transform(lines[2:])
+    filename = directory / name
+    filename.write_text("".join(lines), encoding="utf-8")
+    return filename
+
+def sorted_frame(data):
+    columns = ['Iso3', 'commodity', 'Element', 'date', 'Months']
+    return data.sort_values(columns).reset_index(drop=True).astype({
+        column: str for column in data.columns if isinstance(data[column].dtype, pd.CategoricalDtype)})
+
+def test_ingest_applies_only_the_delta(tmp_path):
+    """Test the first full ingest, a no-op re-ingest and a delta ingest."""
+    store = MarketStore(tmp_path / "store")
+    older = write_release(tmp_path, "old.csv", lambda rows: [row for row in rows if ",2022," not in row])
+    first = store.ingest(older)
+    assert first['version'] == 1 and first['changed'] == 0 and first['inserted'] > 8000
+
+    assert store.ingest(older) == {'version': 1, 'inserted': 0, 'changed': 0, 'unchanged': first['inserted']}
+
+    def revise(rows):
+        # Revise the first price; the 2022 rows come back as new rows.
+        return [rows[0].replace("1742.700000", "1800.000000")] + rows[1:]
+    newer = write_release(tmp_path, "new.csv", revise)
+    second = store.ingest(newer)
+    added = sum(",2022," in line for line in open(CSV_FILE, encoding="utf-8"))
+    assert second == {'version': 2, 'inserted': added, 'changed': 1,
+                      'unchanged': first['inserted'] - 1}
+    assert len(store.meta['segments']) == 2
+
+    expected = sorted_frame(read_market_data(newer, use_cache=False))
+    pd.testing.assert_frame_equal(sorted_frame(MarketStore(tmp_path / "store").read()), expected)
+
+    store.compact()
+    assert len(store.meta['segments']) == 1 and store.version == 2
+    pd.testing.assert_frame_equal(sorted_frame(store.read()), expected)
+
+def test_row_hashes_ignore_the_loaded_dtypes():
+    """Test that a release read with wider dtypes hashes the same."""
+    narrow = read_market_data(CSV_FILE, use_cache=False)
+    wide = narrow.astype({'date': np.int64, 'price': np.float64})
+    # As parsed from a file whose prices did not fit float32 exactly.
+    wide['price'] = wide['price'].round(4)
+    for expected, actual in zip(row_hashes(narrow), row_hashes(wide)):
+        np.testing.assert_array_equal(actual, expected)
+
+def test_store_index_is_cached_by_version(tmp_path):
+    """Test that the index is rebuilt only when the store version changes."""
+    store_dir = tmp_path / "store"
+    assert get_store_index(store_dir) is None
+    MarketStore(store_dir).ingest(CSV_FILE)
+    index = get_store_index(store_dir)
+    assert get_store_index(store_dir) is index
+    assert 'Rice' in index.commodities('NGA')
+    MarketStore(store_dir).ingest(write_release(tmp_path, "rev.csv", lambda rows: rows[1:] + [
+        rows[0].replace("1742.700000", "1.000000")]))
+    assert get_store_index(store_dir) is not index
+
+def test_store_index_applies_the_delta(tmp_path):
+    """Test that an index updated with a delta equals one built from scratch."""
+    store_dir = tmp_path / "store"
+    MarketStore(store_dir).ingest(write_release(tmp_path, "old.csv",
+        lambda rows: [row for row in rows if ",2022," not in row]))
+    old_index = get_store_index(store_dir)
+    MarketStore(store_dir).ingest(write_release(tmp_path, "new.csv", lambda rows: [
+        rows[0].replace("1742.700000", "1800.000000")] + rows[1:]))
+    index = get_store_index(store_dir)
+    assert index is not old_index
+    rebuilt = CommodityIndex(MarketStore(store_dir).read(key_hashes=True))
+    columns = ['key_hash'] + list(rebuilt.data.columns.drop('key_hash'))
+    pd.testing.assert_frame_equal(
+        index.data[columns].sort_values('key_hash').reset_index(drop=True).astype(str),
+        rebuilt.data[columns].sort_values('key_hash').reset_index(drop=True).astype(str))
+    assert index.slices.keys() == rebuilt.slices.keys()
+    assert index.series_slices.keys() == rebuilt.series_slices.keys()
+    pd.testing.assert_frame_equal(index.statistics.reset_index().astype({
+        key: str for key in STATISTICS_KEYS}), rebuilt.statistics.reset_index().astype({
+        key: str for key in STATISTICS_KEYS}))
+
+def test_loader_reads_the_store(tmp_path):
+    """Test that a store directory works as the data source of the loader."""
+    store_dir = tmp_path / "store"
+    MarketStore(store_dir).ingest(CSV_FILE)
+    signature = market_signature(store_dir)
+    index = get_commodity_index(store_dir)
+    assert index is get_store_index(store_dir)
+    assert get_commodity_index([str(store_dir)]) is index
+    MarketStore(store_dir).ingest(write_release(tmp_path, "rev.csv", lambda rows: rows[1:] + [
+        rows[0].replace("1742.700000", "1.000000")]))
+    assert market_signature(store_dir) != signature
+    assert get_commodity_index(store_dir) is get_store_index(store_dir) is not index
+    assert write_report(store_dir, tmp_path / "report", workers=1)[0] > 0
+
+def test_cli(tmp_path, capsys):
+    assert main([str(tmp_path / "store"), CSV_FILE]) == 0
+    assert "version 1" in capsys.readouterr().out
+
+if __name__ == "__main__":
+    pytest.main(["-v", "--tb=line", "-rN", __file__])
@@ -0,0 +1,111 @@
+import gc
+import tracemalloc
+import pytest
+import numpy as np
+import matplotlib.pyplot as plt
+from os import path
+from price_charts import lttb, draw_price_chart
+from market_data import get_commodity_index, get_price_chart, clear_caches, _cached_chart
+from market_metrics import resident_memory
+
+DATA_DIR = path.dirname(path.abspath(__file__))
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Rendering under tracemalloc is slow, so fewer reruns than a real session.
+RERUNS = 30
+# Dashboard reruns served through the chart cache, and the cache size they
+# run against: smaller than CHART_CACHE_SIZE so that evictions happen
+# without rendering hundreds of charts (each takes about 0.1 s).
+CACHED_RERUNS = 3000
+CACHED_CHARTS = 8
+
+def test_lttb_downsampling():
+    """Test that LTTB keeps the end points, the budget and the peaks."""
+    x = np.arange(10_000, dtype=float)
+    y = np.sin(x / 500)
+    y[4321] = 50.0
+    small_x, small_y = lttb(x, y, 200)
+    assert len(small_x) == len(small_y) == 200
+    assert small_x[0] == x[0] and small_x[-1] == x[-1]
+    assert (np.diff(small_x) > 0).all()
+    assert 50.0 in small_y, "The spike should survive downsampling."
+    same_x, same_y = lttb(x[:50], y[:50], 200)
+    assert len(same_x) == 50
+
+def test_draw_price_chart():
+    """Test that a chart renders to PNG bytes without leaving a pyplot figure open."""
+    png = draw_price_chart(np.arange(2000), np.random.default_rng(0).random(2000), "Title", "Price")
+    assert png.startswith(PNG_SIGNATURE)
+    assert plt.get_fignums() == []
+
+def test_chart_memory_over_reruns():
+    """Render the charts of many dashboard reruns and check memory stays flat."""
+    index = get_commodity_index(DATA_DIR)
+    commodities = ['Rice', 'Maize (corn)', 'Sorghum', 'Yams']
+    element = 'Producer Price (LCU/tonne)'
+    series = [index.series_arrays(commodity, 'NGA', element) for commodity in commodities]
+
+    def rerun(number):
+        x, y = series[number % len(series)]
+        return draw_price_chart(x, y, commodities[number % len(commodities)], element)
+
+    # Warm matplotlib's own caches, then measure growth across many more renders.
+    for number in range(2 * len(commodities)):
+        assert rerun(number).startswith(PNG_SIGNATURE)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for number in range(RERUNS):
+        rerun(number)
+    gc.collect()
+    growth = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    assert growth < 256 * 1024, f"Memory grew by {growth} bytes over {RERUNS} renders."
+    assert plt.get_fignums() == []
+
+def test_chart_cache_over_reruns(monkeypatch):
+    """Simulate thousands of reruns through get_price_chart, with more
+    distinct charts than the cache holds, and check that the cache stays
+    bounded, no figure is left open and resident memory stays flat."""
+    clear_caches()
+    monkeypatch.setattr(_cached_chart, "maxsize", CACHED_CHARTS)
+    index = get_commodity_index(DATA_DIR)
+    keys = list(index.series_slices)[:CACHED_CHARTS + 4]
+
+    def rerun(number):
+        # Most reruns redraw one of a few charts; every 50th asks for one
+        # of the others, which evicts a chart that is drawn again later.
+        if number % 50 == 0:
+            key = keys[CACHED_CHARTS + number // 50 % 4]
+        else:
+            key = keys[number % CACHED_CHARTS]
+        country, commodity, element, period = key
+        return get_price_chart(DATA_DIR, commodity, country, element, period)
+
+    for number in range(200):
+        assert rerun(number).startswith(PNG_SIGNATURE)
+    gc.collect()
+    before = resident_memory()
+    for number in range(200, 200 + CACHED_RERUNS):
+        rerun(number)
+    gc.collect()
+    growth = resident_memory() - before
+    info = _cached_chart.cache_info()
+    assert info.currsize <= CACHED_CHARTS
+    assert info.misses > len(keys), "Charts should have been evicted and drawn again."
+    assert plt.get_fignums() == []
+    assert growth < 32 * 2**20, f"Resident memory grew by {growth} bytes over {CACHED_RERUNS} reruns."
+
+def test_uncached_renders_release_figures():
+    """Test that rendering many distinct charts does not accumulate figures."""
+    import matplotlib.figure
+    gc.collect()
+    before = sum(isinstance(obj, matplotlib.figure.Figure) for obj in gc.get_objects())
+    for number in range(20):
+        draw_price_chart(np.arange(30), np.arange(30) * number, f"Chart {number}", "Price")
+    gc.collect()
+    after = sum(isinstance(obj, matplotlib.figure.Figure) for obj in gc.get_objects())
+    assert after == before
+    assert plt.get_fignums() == []
+
+if __name__ == "__main__":
+    pytest.main(["-v", "--tb=line", "-rN", __file__])
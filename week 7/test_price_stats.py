@@ -0,0 +1,72 @@
+import json
+import pickle
+import pytest
+import numpy as np
+import pandas as pd
+from price_stats import PriceAccumulator, QuantileSketch
+
+def test_accumulator_matches_describe():
+    """Test that a small accumulator reproduces Series.describe() exactly."""
+    values = np.random.default_rng(1).lognormal(8, 1, 500)
+    acc = PriceAccumulator().update(values)
+    expected = pd.Series(values, name='price').describe()
+    pd.testing.assert_series_equal(acc.describe(), expected)
+
+def test_accumulator_chunks_and_merge():
+    """Test that chunked updates and merges agree with a single pass."""
+    values = np.random.default_rng(2).normal(100, 15, 10_000)
+    whole = PriceAccumulator().update(values)
+    chunked = PriceAccumulator()
+    for chunk in np.array_split(values, 7):
+        chunked.update(chunk)
+    merged = PriceAccumulator()
+    for chunk in np.array_split(values, 5):
+        merged.merge(PriceAccumulator().update(chunk))
+    for acc in (chunked, merged):
+        assert acc.count == whole.count
+        assert acc.mean == pytest.approx(whole.mean)
+        assert acc.describe()['std'] == pytest.approx(whole.describe()['std'])
+        assert acc.min == whole.min and acc.max == whole.max
+
+def test_quantile_sketch_accuracy():
+    """Test that quartiles stay within a small rank error after compaction."""
+    values = np.random.default_rng(3).uniform(0, 1, 200_000)
+    sketch = QuantileSketch(k=256)
+    for chunk in np.array_split(values, 20):
+        sketch.update(chunk)
+    assert len(sketch.levels) > 1, "The sketch should have compacted."
+    assert sum(len(items) for items in sketch.levels) < 256 * len(sketch.levels)
+    for q, estimate in zip([0.25, 0.5, 0.75], sketch.quantiles([0.25, 0.5, 0.75])):
+        assert estimate == pytest.approx(q, abs=0.02)
+
+def test_empty_accumulator():
+    """Test that an empty accumulator describes like an empty Series."""
+    acc = PriceAccumulator().update([np.nan])
+    stats = acc.describe()
+    assert stats['count'] == 0
+    assert stats.drop('count').isna().all()
+
+def test_accumulator_serialization():
+    """Test that accumulators survive JSON and pickle round trips."""
+    values = np.random.default_rng(4).normal(50, 5, 30_000)
+    acc = PriceAccumulator(k=512).update(values)
+    restored = PriceAccumulator.from_dict(json.loads(json.dumps(acc.to_dict())))
+    pd.testing.assert_series_equal(restored.describe(), acc.describe())
+    unpickled = pickle.loads(pickle.dumps(acc))
+    pd.testing.assert_series_equal(unpickled.describe(), acc.describe())
+    # A restored accumulator keeps working.
+    restored.update(values[:10])
+    assert restored.count == acc.count + 10
+    empty = PriceAccumulator.from_dict(json.loads(json.dumps(PriceAccumulator().to_dict())))
+    assert empty.count == 0
+
+def test_merge_all():
+    """Test combining per-country accumulators into one."""
+    rng = np.random.default_rng(5)
+    parts = [rng.normal(100 * i, 10, 300) for i in range(1, 4)]
+    total = PriceAccumulator.merge_all(PriceAccumulator.from_values(p) for p in parts)
+    expected = pd.Series(np.concatenate(parts), name='price').describe()
+    pd.testing.assert_series_equal(total.describe(), expected)
+
+if __name__ == "__main__":
+    pytest.main(["-v", "--tb=line", "-rN", __file__])